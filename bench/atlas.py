@@ -0,0 +1,63 @@
+"""
+预渲染图集的规模与每条消息延迟
+
+在仓库根目录运行：
+    python -m bench.atlas [grid_step ...]
+
+列出不同网格步长下的图集大小，并对实际构建的图集（默认步长60，
+写入临时的缓存目录）测量每条消息的处理耗时，与实时合成+RGB565转换对比。
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.combine_render import make_renderers
+from mods import systems
+from mods.atlas import FrameAtlas
+from mods.Render import AlphaCompositor, eye_state, render_eye_state
+from mods.hardware.ST7789 import convert_rgba_to_rgb565
+
+
+def per_message(fn, messages):
+    start = time.perf_counter()
+    for msg in messages:
+        fn(*msg)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main(steps):
+    ias, eyelid = make_renderers()
+    pupil_n = len(ias.iris_and_sclera_array_list)
+    eyelid_n = len(eyelid.eyelid_frames)
+    limit = ias.iris_and_sclera_array_list[0].shape[0] // 4
+
+    rng = np.random.default_rng(0)
+    messages = [(rng.uniform(0, 1), *rng.uniform(-1, 1, 2)) for _ in range(500)]
+
+    left_compositor = AlphaCompositor()
+    right_compositor = AlphaCompositor()
+
+    def render(radius, rel_x, rel_y):
+        state = eye_state(pupil_n, eyelid_n, radius, rel_x, rel_y)
+        left, right = render_eye_state(state, ias, ias, eyelid, left_compositor, right_compositor)
+        return convert_rgba_to_rgb565(left), convert_rgba_to_rgb565(right)
+
+    print(f"实时渲染       {per_message(render, messages):8.1f} us/message")
+
+    for step in steps:
+        size = FrameAtlas.estimate_bytes(eyelid_n, step, limit)
+        with tempfile.TemporaryDirectory() as tmp:
+            #图集写入临时的缓存目录，不影响仓库中的预渲染缓存
+            systems.CACHE_DIR = tmp
+            atlas = FrameAtlas.build(f"bench-{step}", ias, ias, eyelid, grid_step=step)
+            latency = per_message(atlas.lookup, messages)
+            report = atlas.report()
+            del atlas
+        print(f"步长 {step:3d}px  {report['states']:6d} 状态  {size / 2**20:8.1f} MiB  "
+              f"构建 {report['build_seconds']:6.1f} s  {latency:8.1f} us/message")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or [120, 60])
@@ -0,0 +1,106 @@
+"""
+alpha合成的逐帧基准测试
+
+在仓库根目录运行：
+    python -m bench.combine_render
+
+用真实的眼睑帧叠加在虹膜/巩膜帧上（与EYErend相同的裁剪方式），
+对比旧的float64 combine_render 与 定点数AlphaCompositor 的每帧耗时，
+并检查两者输出的最大误差（应不超过1）。
+"""
+import time
+import warnings
+
+import numpy as np
+from PIL import Image
+
+from mods.Render import IrisAndScleraRender, EyeLidRender, AlphaCompositor, crop_centered_region, map_float_to_array
+
+
+#与mods/config.py中的左眼/眼睑配置一致（导入config会初始化屏幕硬件）
+IAS_FRAME_SIZE = 480
+IASR_CONF = {
+    "sclera_inner": (70, 72),
+    "sclera_outer": (120, 120),
+    "iris_inner_normal": (10, 69),
+    "iris_inner_crazy_max": (18, 71),
+    "iris_smooth_n": 10,
+    "iris_outer": (70, 72)
+}
+EYELID_RENDER_CONF = {
+    "eyelid_color": "#000000",
+    "Rsize": 480,
+    "flash_n": 16,
+    "axes_upper": (110, 80),
+    "axes_lower": (110, 1),
+    "angle": 15,
+    "sharpness": 6
+}
+
+
+def legacy_combine(frame1, frame2):
+    rgb1 = frame1[:, :, :3]
+    alpha1 = frame1[:, :, 3] / 255.0
+    rgb2 = frame2[:, :, :3]
+    alpha2 = frame2[:, :, 3] / 255.0
+    alpha_combined = alpha1 + alpha2 * (1 - alpha1)
+    rgb_combined = (rgb1 * alpha1[..., None] + rgb2 * alpha2[..., None] * (1 - alpha1[..., None])) / alpha_combined[..., None]
+    return np.dstack((rgb_combined, alpha_combined * 255)).astype(np.uint8)
+
+
+def make_renderers():
+    ias = IrisAndScleraRender(
+        sclera=Image.open("assest/eyes/sclera.png").convert("RGBA"),
+        iris=Image.open("assest/eyes/iris-L.png").convert("RGBA"),
+        frame_size=IAS_FRAME_SIZE,
+        **IASR_CONF
+    )
+    eyelid = EyeLidRender(**EYELID_RENDER_CONF)
+    return ias, eyelid
+
+
+def make_pairs(n=64):
+    ias, eyelid = make_renderers()
+    rng = np.random.default_rng(0)
+    pairs = []
+    for _ in range(n):
+        rel_x, rel_y = rng.uniform(-1, 1, 2)
+        lid = map_float_to_array(eyelid.eyelid_frames, rng.uniform(0, 1))
+        offset = (int(rel_x * 3), int(rel_y * 12))
+        top = crop_centered_region(lid.image, *offset)
+        bottom = crop_centered_region(map_float_to_array(ias.iris_and_sclera_array_list, rng.uniform(0, 1)), int(rel_x * 100), int(rel_y * 100))
+        pairs.append((top, bottom, lid, offset))
+    return pairs
+
+
+def timed(fn, pairs, rounds=5):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for pair in pairs:
+            fn(*pair)
+    return (time.perf_counter() - start) / (rounds * len(pairs)) * 1000
+
+
+def main():
+    warnings.simplefilter("ignore")
+    pairs = make_pairs()
+    compositor = AlphaCompositor()
+
+    old = timed(lambda t, b, lid, offset: legacy_combine(t, b), pairs)
+    new = timed(lambda t, b, lid, offset: compositor.over(t, b), pairs)
+    sparse = timed(lambda t, b, lid, offset: compositor.over_eyelid(lid, b, *offset), pairs)
+    err = max(
+        int(np.abs(legacy_combine(t, b).astype(int) - compositor.over(t, b).astype(int)).max())
+        for t, b, lid, offset in pairs
+    )
+    err_sparse = max(
+        int(np.abs(legacy_combine(t, b).astype(int) - compositor.over_eyelid(lid, b, *offset).astype(int)).max())
+        for t, b, lid, offset in pairs
+    )
+    print(f"float64 {old:6.2f} ms/frame")
+    print(f"定点数  {new:6.2f} ms/frame  ({old / new:.1f}x)  最大误差 {err} LSB")
+    print(f"眼睑开口 {sparse:6.2f} ms/frame  ({old / sparse:.1f}x)  最大误差 {err_sparse} LSB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+双屏显示吞吐量基准测试（模拟硬件后端）
+
+在仓库根目录运行，不需要屏幕和任何设备文件：
+    python -m bench.display_sim
+
+使用mods.hardware.backends.SimBackend，按配置的SPI速率和每次传输开销实时睡眠，
+左右眼各一个线程像SPIpipe一样推送帧，输出实际帧率、CPU耗时与模拟的线上耗时，
+结果只取决于模拟参数和本机CPU，可以在任意Linux机器上重复测量。
+"""
+import threading
+import time
+
+import numpy as np
+
+from mods.hardware.ST7789 import ST7789, convert_rgba_to_rgb565
+from mods.hardware.backends import SimBackend
+
+
+def run(speed_hz, overhead_s, frames, seconds=2.0):
+    hw = SimBackend(spi_overhead=overhead_s, realtime=True)
+    screens = []
+    for name in ("left", "right"):
+        dc = hw.pin(f"{name}-dc")
+        screens.append(ST7789(rst_pin=hw.pin(f"{name}-rst"), dc_pin=dc, bus=hw.spi(name, speed_hz, dc=dc, name=name)))
+
+    shown = [0, 0]
+    stop = time.monotonic() + seconds
+
+    def push(i):
+        n = 0
+        while time.monotonic() < stop:
+            screens[i].img_show(frames[n % len(frames)])
+            n += 1
+        shown[i] = n
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=push, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    stats = hw.stats()
+    return min(shown) / elapsed, stats["left"]["wire_ms"] / max(shown[0], 1)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    frames = [convert_rgba_to_rgb565(rng.integers(0, 256, (240, 240, 4), dtype=np.uint8)) for _ in range(8)]
+    print(f"{'spi MHz':>8}{'overhead us':>13}{'fps':>8}{'wire ms/frame':>15}")
+    for speed_hz in (40000000, 62500000, 80000000):
+        for overhead_s in (5e-6, 20e-6, 50e-6):
+            fps, wire = run(speed_hz, overhead_s, frames)
+            print(f"{speed_hz / 1e6:>8.1f}{overhead_s * 1e6:>13.0f}{fps:>8.1f}{wire:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+MQTT消息解析的基准测试
+
+在仓库根目录运行：
+    python -m bench.mqtt_parse
+
+对比 controler/eye 和 controler/pwm 的JSON消息解析路径
+与二进制主题的struct解码路径，输出每秒可解析的消息数和消息体大小。
+"""
+import json
+import time
+
+from mods.protocol import (
+    decode,
+    encode_eye_state,
+    encode_pwm_set,
+    encode_pwm_breath,
+    EYE_STATE_KEYS,
+    MSG_PWM_SET
+)
+
+
+def json_eye(payload):
+    message_json = json.loads(payload.decode())
+    args = message_json["data"]
+    if not message_json["isCustomScreen"]:
+        return args
+
+
+def binary_eye(payload):
+    kind, values = decode(payload)
+    return dict(zip(EYE_STATE_KEYS, values))
+
+
+def json_pwm(payload):
+    message_json = json.loads(payload.decode())
+    pwmdat = message_json["data"]
+    if message_json["type"] == "set":
+        return int(pwmdat["channel"]), int(pwmdat["value"])
+    return int(pwmdat["channel"]), int(pwmdat["step1"]), int(pwmdat["step2"]), tuple(pwmdat["range"])
+
+
+def binary_pwm(payload):
+    kind, fields = decode(payload)
+    if kind == MSG_PWM_SET:
+        return fields
+    channel, step1, step2, low, high = fields
+    return channel, step1, step2, (low, high)
+
+
+def throughput(fn, payloads, rounds=20):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for payload in payloads:
+            fn(payload)
+    return rounds * len(payloads) / (time.perf_counter() - start)
+
+
+def main():
+    n = 5000
+    eye_args = [
+        dict(eyelid_percentage=0.0, radius=(i % 100) / 100, rel_x=(i % 41 - 20) / 20, rel_y=(i % 23 - 11) / 11)
+        for i in range(n)
+    ]
+    eye_json = [json.dumps({"isCustomScreen": False, "data": args}).encode() for args in eye_args]
+    eye_bin = [encode_eye_state(**args) for args in eye_args]
+
+    pwm_json = []
+    pwm_bin = []
+    for i in range(n):
+        if i % 2:
+            pwm_json.append(json.dumps({"type": "set", "data": {"channel": i % 16, "value": i % 4096}}).encode())
+            pwm_bin.append(encode_pwm_set(i % 16, i % 4096))
+        else:
+            pwm_json.append(json.dumps({"type": "breath", "data": {"channel": i % 16, "step1": 5, "step2": 3, "range": [0, 4000]}}).encode())
+            pwm_bin.append(encode_pwm_breath(i % 16, 5, 3, (0, 4000)))
+
+    rows = [
+        ("eye  json", json_eye, eye_json),
+        ("eye  binary", binary_eye, eye_bin),
+        ("pwm  json", json_pwm, pwm_json),
+        ("pwm  binary", binary_pwm, pwm_bin),
+    ]
+    print(f"{'path':<14}{'msgs/s':>12}{'us/msg':>10}{'bytes':>8}")
+    for name, fn, payloads in rows:
+        rate = throughput(fn, payloads)
+        size = sum(len(p) for p in payloads) / len(payloads)
+        print(f"{name:<14}{rate:>12.0f}{1e6 / rate:>10.2f}{size:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
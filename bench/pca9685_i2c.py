@@ -0,0 +1,96 @@
+"""
+PCA9685 I2C写入的事务数基准测试（模拟总线）
+
+在仓库根目录运行：
+    python -m bench.pca9685_i2c
+
+对比旧的逐寄存器写入（每通道4次事务）与自动递增+批量写入+影子寄存器，
+输出各场景的I2C事务数、字节数和按总线速率估算的线上耗时（模拟总线见mods.hardware.backends）。
+
+另外检查初始化顺序：芯片上电或在AI关闭、通道点亮的状态下重启后，
+初始化完成时各通道寄存器应与驱动的影子寄存器一致，不一致时以非0状态退出。
+"""
+import sys
+
+from mods.hardware.PCA9685 import PCA9685, LED0_ON_L, MODE1, ALLCALL
+from mods.hardware.backends import I2CMessage, SimI2C, pca9685_power_on
+
+
+def legacy_set_pwm(bus, channel, on, off):
+    """旧实现：四次单字节写入"""
+    for reg, value in ((0, on & 0xFF), (1, on >> 8), (2, off & 0xFF), (3, off >> 8)):
+        bus.transfer(0x40, [I2CMessage([LED0_ON_L + 4 * channel + reg, value])])
+
+
+def scenarios():
+    # 16通道整体更新；同样的值再写一遍；呼吸灯单通道扫描（有重复值）
+    all_channels = [(ch, 1, 100 + ch * 200) for ch in range(16)]
+    repeat = all_channels * 2
+    breath = [(3, 1, v) for v in list(range(0, 4000, 40)) + list(range(4000, 0, -40))] * 2
+    return [
+        ("16ch update", [all_channels]),
+        ("16ch update x2 (same)", [all_channels, all_channels]),
+        ("breath sweep, 1ch", [[item] for item in breath]),
+        ("breath, 1ch x repeat", [[item] for item in breath for _ in range(2)]),
+    ]
+
+
+def channel_values(registers):
+    """从寄存器读出各通道的 (on, off)"""
+    values = []
+    for ch in range(PCA9685.CHANNELS):
+        reg = LED0_ON_L + 4 * ch
+        values.append((registers[reg] | registers[reg + 1] << 8, registers[reg + 2] | registers[reg + 3] << 8))
+    return values
+
+
+def init_states():
+    # 上电；上一次运行留下AI关闭（MODE1只有ALLCALL）且所有通道半亮的状态
+    lit = pca9685_power_on()
+    lit[MODE1] = ALLCALL
+    for ch in range(PCA9685.CHANNELS):
+        lit[LED0_ON_L + 4 * ch + 2:LED0_ON_L + 4 * ch + 4] = (2048).to_bytes(2, "little")
+    return [("power-on", pca9685_power_on()), ("restart, AI off, lit", lit)]
+
+
+def check_init():
+    ok = True
+    for name, registers in init_states():
+        bus = SimI2C()
+        bus.registers[0x40] = registers
+        pwm = PCA9685(i2c=bus)
+        match = channel_values(bus.registers[0x40]) == pwm._shadow
+        ok = ok and match
+        print(f"init {name:<22}{'ok' if match else 'FAIL: channel registers differ from the shadow'}")
+    return ok
+
+
+def main():
+    print(f"{'scenario':<24}{'legacy tx':>10}{'new tx':>8}{'legacy ms':>11}{'new ms':>8}{'skipped':>9}")
+    for name, frames in scenarios():
+        legacy = SimI2C()
+        for frame in frames:
+            for ch, on, off in frame:
+                legacy_set_pwm(legacy, ch, on, off)
+
+        bus = SimI2C()
+        pwm = PCA9685(i2c=bus)
+        bus.reset()
+        pwm.skipped = 0
+        for frame in frames:
+            if len(frame) == 1:
+                ch, on, off = frame[0]
+                pwm.set_pwm(ch, on, off)
+            else:
+                pwm.set_pwm_many({ch: (on, off) for ch, on, off in frame})
+
+        print(f"{name:<24}{legacy.transactions:>10}{bus.transactions:>8}"
+              f"{legacy.wire_time() * 1000:>11.2f}{bus.wire_time() * 1000:>8.2f}{pwm.skipped:>9}")
+
+    print()
+    if not check_init():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+RGB565转换+SPI发送路径的基准测试（模拟总线）
+
+在仓库根目录运行：
+    python -m bench.spi_rgb565
+
+对比旧的 tolist() 列表路径 与 新的预分配缓冲区+memoryview分块路径，
+输出每秒可推送到总线上的字节数。模拟总线（mods.hardware.backends.SimSPI）
+与periphery的SPI.transfer行为一致（类型检查 + array('B')拷贝），并按给定速率估算线上耗时。
+"""
+import time
+
+import numpy as np
+
+from mods.hardware.ST7789 import ST7789, convert_rgba_to_rgb565, new_rgb565_buffer
+from mods.hardware.backends import SimSPI, SimPin
+
+
+def make_screen(bus):
+    return ST7789(rst_pin=SimPin(), dc_pin=SimPin(), bus=bus)
+
+
+def legacy_convert(image):
+    r = image[..., 0] & 0xF8
+    g = image[..., 1]
+    b = image[..., 2] & 0xFC
+    pixel_high = r | (g >> 5)
+    pixel_low = ((g << 3) & 0xE0) | (b >> 3)
+    return np.dstack((pixel_high, pixel_low)).flatten().tolist()
+
+
+def legacy_show(screen, pixel):
+    screen.set_cursor(0, 0, screen.w, screen.h)
+    screen.dc.value = True
+    for i in range(0, len(pixel), 4096):
+        screen.spi.transfer(pixel[i:i + 4096])
+
+
+def run(name, frames, convert_and_show):
+    bus = SimSPI()
+    screen = make_screen(bus)
+    start = time.perf_counter()
+    for frame in frames:
+        convert_and_show(screen, frame)
+    cpu = time.perf_counter() - start
+    print(f"{name:8s} cpu {cpu / len(frames) * 1000:7.2f} ms/frame  "
+          f"{bus.bytes / cpu / 1e6:7.2f} MB/s  "
+          f"模拟线上 {bus.wire_time() / len(frames) * 1000:6.2f} ms/frame  "
+          f"transfers {bus.transfers}")
+    return bus.bytes / cpu
+
+
+def main(n=100):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (240, 240, 4), dtype=np.uint8) for _ in range(8)]
+    frames = [frames[i % len(frames)] for i in range(n)]
+
+    old = run("list", frames, lambda s, f: legacy_show(s, legacy_convert(f)))
+
+    buf = new_rgb565_buffer()
+    new = run("buffer", frames, lambda s, f: s.img_show(convert_rgba_to_rgb565(f, out=buf)))
+
+    #两条路径发送到总线上的字节必须一致
+    assert bytes(legacy_convert(frames[0])) == convert_rgba_to_rgb565(frames[0]).tobytes()
+    print(f"吞吐提升 {new / old:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+VideoStream文件来源的检查
+
+在仓库根目录运行：
+    python -m bench.videostream_file
+
+生成一个MJPEG文件，每帧是一种灰度，灰度值编码帧序号，然后检查：
+1. read_mjpeg_frames在不同读取块大小下（包括比一帧小得多的块、帧之间夹杂无关字节）切出的帧与写入的完全一致；
+2. 多个解码线程并行（不限速和限速）时送进显示帧队列的帧序号严格递增，读取、送出、丢弃的帧数对得上；
+3. max_age为0时所有帧都因过期被丢弃，没有帧送进队列。
+任一项不通过时以非0状态退出。
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from mods.framequeue import FrameQueue, FIFO
+from mods.videostream import VideoStream, read_mjpeg_frames
+
+FRAMES = 30
+SIZE = 64
+
+
+def gray(index):
+    return 16 + index * 7
+
+
+def make_mjpeg(path):
+    """写入FRAMES帧MJPEG，帧之间夹杂无关字节，返回各帧的JPEG数据"""
+    jpegs = []
+    with open(path, "wb") as file:
+        file.write(b"junk")
+        for index in range(FRAMES):
+            image = np.full((SIZE, SIZE, 3), gray(index), dtype=np.uint8)
+            ok, data = cv2.imencode(".jpg", image)
+            assert ok
+            jpegs.append(data.tobytes())
+            file.write(jpegs[-1])
+            if index % 3 == 0:
+                file.write(b"\x00\xff")
+    return jpegs
+
+
+def frame_index(frame):
+    """由RGB565帧的绿色分量还原帧序号"""
+    green = ((frame.astype(np.uint16) >> 5) & 0x3F) << 2
+    return int(round((float(green.mean()) - 16) / 7))
+
+
+def run_stream(path, workers, max_age, fps=0):
+    queue = FrameQueue(maxlen=FRAMES, policy=FIFO)
+    stream = VideoStream(queue, source="file", path=path, workers=workers,
+                         max_age=max_age, fps=fps, screen_size=(SIZE, SIZE)).start()
+    deadline = time.monotonic() + 10
+    while stream.stats()["read"] < FRAMES and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stream.stop()
+    indices = []
+    while len(queue):
+        left, right = queue.get(timeout=0)
+        indices.append(frame_index(left))
+    return indices, stream.stats()
+
+
+def main():
+    failed = []
+
+    def check(name, ok, detail=""):
+        print(f"{'ok' if ok else 'FAIL':>4}  {name}  {detail}")
+        if not ok:
+            failed.append(name)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "clip.mjpeg")
+        jpegs = make_mjpeg(path)
+        with open(path, "rb") as file:
+            data = file.read()
+
+        for chunk_size in (1, 7, 4096, 65536):
+            frames = list(read_mjpeg_frames(io.BytesIO(data), chunk_size))
+            check(f"split chunk={chunk_size}", frames == jpegs, f"{len(frames)}/{len(jpegs)} frames")
+
+        #不限速时大部分帧因解码池满被丢弃，限速时几乎每帧都会送出
+        for workers, fps in ((1, 0), (4, 0), (2, 200), (4, 1000)):
+            indices, stats = run_stream(path, workers, max_age=10, fps=fps)
+            ordered = all(a < b for a, b in zip(indices, indices[1:]))
+            counted = stats["emitted"] + stats["dropped_late"] + stats["dropped_busy"] + stats["errors"] == FRAMES
+            check(f"order workers={workers} fps={fps}", ordered and counted and len(indices) == stats["emitted"],
+                  f"emitted={stats['emitted']} busy={stats['dropped_busy']} late={stats['dropped_late']}")
+
+        indices, stats = run_stream(path, 2, max_age=0)
+        check("drop late max_age=0", not indices and stats["emitted"] == 0 and
+              stats["dropped_late"] + stats["dropped_busy"] == FRAMES,
+              f"late={stats['dropped_late']} busy={stats['dropped_busy']}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
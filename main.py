@@ -1,80 +1,188 @@
 import time
 import json
+import logging
 import base64
+import hashlib
 import threading
 import numpy as np
 from io import BytesIO
 import paho.mqtt.client as mqtt
-from PIL import Image, ImageSequence
+from PIL import Image
 from mods.config import *
 from mods.systems import *
-from mods.hardware.ST7789 import convert_rgba_to_rgb565
+from mods.hardware.ST7789 import convert_rgba_to_rgb565, RGB565_DTYPE
 
 from mods.Render import (
     IrisAndScleraRender,
     EyeLidRender,
-    crop_centered_region,
-    map_float_to_array,
-    combine_render
+    map_float_to_index,
+    eye_state,
+    render_eye_state
+)
+from mods.atlas import FrameAtlas, ATLAS_VERSION
+from mods.prerender import prerender
+from mods.mailbox import STATE, RAW_SCREEN, CLIP, PRESET
+from mods.presets import PresetManager, RenderSet
+from mods.hotreload import HotReloader
+from mods.clips import AnimationClip
+from mods.scheduler import FrameClock
+from mods.videostream import VideoStream
+from mods.curves import parse_effects
+from mods.pwmscheduler import ConstantWave
+from mods.protocol import (
+    decode,
+    decode_rgb565_screen,
+    EYE_BIN_TOPIC,
+    PWM_BIN_TOPIC,
+    SCREEN_BIN_TOPIC,
+    EYE_STATE_KEYS,
+    MSG_EYE_STATE,
+    MSG_PWM_SET,
+    MSG_PWM_BREATH
 )
 
-#正式加载开始
-def init():
-
-    global LEFT_IRIS_IMG, LEFT_SCLERA_IMG, RIGHT_IRIS_IMG, RIGHT_SCLERA_IMG
-    global LEFT_IRIS_AND_SCLERA_RENDER, RIGHT_IRIS_AND_SCLERA_RENDER, EYELID_RENDER
-    global INIT_STATUES
+logger = logging.getLogger(__name__)
 
+def irisAndScleraCacheKey(iris_path, sclera_path, conf):
+    #缓存key包含纹理内容和全部渲染参数，参数变化不会读到旧的缓存
+    return cache_key(
+        "IrisAndScleraRender",
+        calculate_md5(sclera_path),
+        calculate_md5(iris_path),
+        IAS_FRAME_SIZE,
+        conf
+    )
 
-    #判断是否存在预载缓存
-    #计算md5
-    LEFT_IRIS_MD5 = calculate_md5(LEFT_IRIS_IMG)
-    LEFT_SCLERA_MD5 = calculate_md5(LEFT_SCLERA_IMG)
-    RIGHT_IRIS_MD5 = calculate_md5(RIGHT_IRIS_IMG)
-    RIGHT_SCLERA_MD5 = calculate_md5(RIGHT_SCLERA_IMG)
-    
-    #渲染器开始预渲染加载(高耗时步骤)
-    
-    if check_cache(LEFT_SCLERA_MD5 + "_" + LEFT_IRIS_MD5):
-        LEFT_IRIS_AND_SCLERA_RENDER = read_cache(LEFT_SCLERA_MD5 + "_" + LEFT_IRIS_MD5)
-    else:
-        #资源文件的加载，左右眼可独立设置对应的资源文件
-        LEFT_IRIS_IMG = Image.open(LEFT_IRIS_IMG).resize((1024,80)).convert("RGBA")
-        LEFT_SCLERA_IMG = Image.open(LEFT_SCLERA_IMG).resize((24000,512)).convert("RGBA")
-        #渲染器开始预渲染纹理，将纹理载入内存
-        LEFT_IRIS_AND_SCLERA_RENDER = IrisAndScleraRender(
-            sclera=LEFT_SCLERA_IMG,
-            iris=LEFT_IRIS_IMG,
+def eyeLidCacheKey(conf):
+    return cache_key("EyeLidRender", conf)
+
+#各预设当前使用的图集key；构建图集在锁内进行，多个预设同时加载时不会一起超出上限
+ATLAS_KEYS = {}
+ATLAS_LOCK = threading.Lock()
+
+def loadAtlas(name, left_key, right_key, eyelid_key, left, right, eyelid):
+    #纹理或渲染参数变化时图集自动重建，放不下时返回None，这个预设改为实时渲染
+    atlas_key = cache_key("FrameAtlas", ATLAS_VERSION, ATLAS_GRID_STEP, left_key, right_key, eyelid_key)
+    with ATLAS_LOCK:
+        atlas = FrameAtlas.open(atlas_key, ATLAS_CACHE_DIR)
+        if atlas is None:
+            #其他预设正在使用的图集不能淘汰，新图集只能使用剩下的空间
+            live = {key for preset, key in ATLAS_KEYS.items() if preset != name}
+            sizes = cache_sizes(ATLAS_CACHE_DIR)
+            need = FrameAtlas.build_bytes(left, eyelid, ATLAS_GRID_STEP) + \
+                sum(sizes[key][1] for key in live if key in sizes)
+            if need > ATLAS_MAX_BYTES:
+                logger.warning(
+                    f"{name} atlas not built: needs {need / 2**20:.0f} MiB with the atlases of other presets, "
+                    f"ATLAS_MAX_BYTES is {ATLAS_MAX_BYTES / 2**20:.0f} MiB"
+                )
+                return None
+            atlas = FrameAtlas.build(
+                atlas_key,
+                left,
+                right,
+                eyelid,
+                grid_step=ATLAS_GRID_STEP,
+                max_bytes=ATLAS_MAX_BYTES,
+                keep=live,
+                root=ATLAS_CACHE_DIR
+            )
+        ATLAS_KEYS[name] = atlas_key
+    logger.info(f"{name} atlas: {atlas.report()}")
+    return atlas
+
+def loadRenderSet(name, preset):
+    #preset为合并了默认预设之后的完整参数
+    eyelid_conf = preset["eyelid_conf"]
+
+    start = time.time()
+    #资源文件的加载，左右眼可独立设置对应的资源文件
+    iris_jobs = {
+        "left": (preset["left_iris"], preset["left_sclera"], preset["left_conf"]),
+        "right": (preset["right_iris"], preset["right_sclera"], preset["right_conf"])
+    }
+    keys = {eye: irisAndScleraCacheKey(*job) for eye, job in iris_jobs.items()}
+    eyelid_key = eyeLidCacheKey(eyelid_conf)
+    #按需模式的眼睑帧在运行时渲染，不经过预渲染和缓存
+    eyelid_on_demand = eyelid_conf.get("on_demand", False)
+
+    #只预渲染缓存中没有的部分，两眼key相同（纹理和参数一致）时只渲染一次
+    missing = {keys[eye]: job for eye, job in iris_jobs.items() if not check_cache(keys[eye])}
+    eyelid_missing = not eyelid_on_demand and not check_cache(eyelid_key)
+    logger.info(f"{name} cache check: {len(missing)} iris/sclera + {int(eyelid_missing)} eyelid to prerender, {time.time() - start:.2f}s")
+
+    if missing or eyelid_missing:
+        #渲染器开始预渲染纹理(高耗时步骤)，按瞳孔步骤和眼睑帧分配到多个进程，结果直接写入缓存
+        prerender(
+            missing,
+            eyelid_conf if eyelid_missing else None,
+            eyelid_key,
             frame_size=IAS_FRAME_SIZE,
-            **LEFT_IASR_CONF
+            workers=PRERENDER_WORKERS,
+            max_bytes=CACHE_MAX_BYTES
         )
+        logger.info(f"{name} prerender + cache write: {time.time() - start:.2f}s")
 
-        make_cache(LEFT_IRIS_AND_SCLERA_RENDER,LEFT_SCLERA_MD5 + "_" + LEFT_IRIS_MD5)
-
-    if check_cache(RIGHT_SCLERA_MD5 + "_" + RIGHT_IRIS_MD5):
-        RIGHT_IRIS_AND_SCLERA_RENDER = read_cache(RIGHT_SCLERA_MD5 + "_" + RIGHT_IRIS_MD5)
+    #统一从缓存内存映射打开
+    left = read_cache(keys["left"], IrisAndScleraRender)
+    right = read_cache(keys["right"], IrisAndScleraRender)
+    if eyelid_on_demand:
+        eyelid = EyeLidRender(**eyelid_conf)
     else:
-        #资源文件的加载，左右眼可独立设置对应的资源文件
-        RIGHT_IRIS_IMG = Image.open(RIGHT_IRIS_IMG).resize((1024,80)).convert("RGBA")
-        RIGHT_SCLERA_IMG = Image.open(RIGHT_SCLERA_IMG).resize((24000,512)).convert("RGBA")
-        #渲染器开始预渲染纹理，将纹理载入内存
-        RIGHT_IRIS_AND_SCLERA_RENDER = IrisAndScleraRender(
-            sclera=RIGHT_SCLERA_IMG,
-            iris=RIGHT_IRIS_IMG,
-            frame_size=IAS_FRAME_SIZE,
-            **RIGHT_IASR_CONF
-        )
-        make_cache(RIGHT_IRIS_AND_SCLERA_RENDER,RIGHT_SCLERA_MD5 + "_" + RIGHT_IRIS_MD5)
+        eyelid = read_cache(eyelid_key, EyeLidRender)
+    left_key, right_key = keys["left"], keys["right"]
+    logger.info(f"{name} cache load: {time.time() - start:.2f}s")
 
-        
-    EYELID_RENDER = EyeLidRender(
-        **EYELID_RENDER_CONF
+    #各渲染器常驻内存的统计
+    for eye, render in (("left", left), ("right", right), ("eyelid", eyelid)):
+        logger.info(f"{name} {eye} memory: {render.memory_report()}")
+
+    atlas = None
+    if ATLAS_MODE:
+        atlas = loadAtlas(name, left_key, right_key, eyelid_key, left, right, eyelid)
+
+    return RenderSet(name, cache_key("RenderSet", left_key, right_key, eyelid_key), left, right, eyelid, atlas)
+
+#加载动画线程和init都会加载片段，同一个片段只加载一次
+CLIP_LOAD_LOCK = threading.Lock()
+
+def loadClip(name, path):
+    with CLIP_LOAD_LOCK:
+        if name not in CLIP_PLAYER.clips:
+            CLIP_PLAYER.clips[name] = AnimationClip.load(path, (LEFT_SCREEN.w, LEFT_SCREEN.h), CACHE_MAX_BYTES)
+        return CLIP_PLAYER.clips[name]
+
+#正式加载开始
+def init():
+
+    global RENDER_PRESETS, HOT_RELOADER, INIT_STATUES
+
+    #后台加载完成的预设切换后，通知渲染线程用新纹理重画当前状态
+    RENDER_PRESETS = PresetManager(
+        TEXTURE_PRESETS,
+        loadRenderSet,
+        PRESET_MAX_BYTES,
+        on_switch=lambda name: RENDER_MAILBOX.post_command({}, kind=PRESET),
+        default=DEFAULT_PRESET
     )
+    RENDER_PRESETS.switch(DEFAULT_PRESET, wait=True)
+    #需要立即可用的预设在启动时加载，之后切换不需要等待
+    for name, preset in TEXTURE_PRESETS.items():
+        if preset.get("preload") and name != DEFAULT_PRESET:
+            RENDER_PRESETS.load(name)
+
+    #重载时旧渲染器继续出帧，不重新初始化屏幕
+    HOT_RELOADER = HotReloader(RENDER_PRESETS, CONFIG_PATH, HOT_RELOAD_INTERVAL).start(watch=HOT_RELOAD)
+
+    #可以通过MQTT触发的动画片段
+    for name, path in CLIP_FILES.items():
+        loadClip(name, path)
+    logger.info(f"clips loaded: {sorted(CLIP_PLAYER.clips)}")
+
     INIT_STATUES = True
 
 #加载动画 搞笑的
 def loadingFrame():
-    gif = Image.open(LOADING_GIF)
     success = Image.open(LOADING_JOKE)
     success = np.array(success.convert('RGBA'))
     preloadSuccess = Image.open(PRELOADING_JOKE)
@@ -107,124 +215,153 @@ def loadingFrame():
                 )
         )
     
-    # 遍历GIF的每一帧
-    while True:
-        for frame in ImageSequence.Iterator(gif):
-            if INIT_STATUES:
-                return
-            # 获取当前帧的延迟时间，单位是毫秒
-            delay = frame.info['duration'] / 800.0
-            
-
-            frame_np = convert_rgba_to_rgb565(
-                np.array(
-                    frame.convert('RGBA')
-                    )
-            )
-            #提交到屏幕
-            LEFT_SCREEN.img_show(frame_np)
-            RIGHT_SCREEN.img_show(frame_np)
-            
-            # 等待帧延迟时间
-            time.sleep(delay)
-
+    #GIF只在第一次启动时解码转换，之后从缓存内存映射打开；与init共用CLIP_PLAYER中的同一个片段
+    loading = loadClip("loading", LOADING_GIF)
 
-def pushImg(leftimg,rightimg):
-    #体提交到队列
-    LEFT_FRAME_BUFFER.append(
-        convert_rgba_to_rgb565(
-            leftimg
-            )
-    )
-    RIGHT_FRAME_BUFFER.append(
-        convert_rgba_to_rgb565(
-            rightimg
-            )
-    )
+    def show(frame):
+        #提交到屏幕
+        LEFT_SCREEN.img_show(frame)
+        RIGHT_SCREEN.img_show(frame)
 
+    #原先按duration/800等待，保持1.25倍速播放
+    loading.play(show, stop=lambda: INIT_STATUES, speed=1.25)
 
-def EYErend(eyelid_percentage, radius, rel_x, rel_y):
 
-    
-    #计算瞳孔偏移后的缩小大小，模拟球面的透视效果
-    pupil_dy =  1 - (1 if abs(rel_x)*1.6 > 1 else abs(rel_x)*1.6)
-
-    left_ias_img = map_float_to_array(LEFT_IRIS_AND_SCLERA_RENDER.iris_and_sclera_array_list,pupil_dy)
-    right_ias_img = map_float_to_array(RIGHT_IRIS_AND_SCLERA_RENDER.iris_and_sclera_array_list,pupil_dy)
+def EYErend(eyelid_percentage, radius, rel_x, rel_y, stamp=None):
 
+    #每帧只取一次当前预设，预设切换发生在两帧之间
+    render_set = RENDER_PRESETS.active
 
-    eyelid_img = map_float_to_array(EYELID_RENDER.eyelid_list,eyelid_percentage)
+    #eyelid_percentage目前不参与渲染，只做范围检查
+    map_float_to_index(len(render_set.eyelid.eyelid_frames), eyelid_percentage)
 
     #眨眼处理
     #if radius == 0:
-        #eyelid_img = map_float_to_array(EYELID_RENDER.eyelid_list,1)
-    eyelid_img = map_float_to_array(EYELID_RENDER.eyelid_list,radius)
-
-    
-    #渲染最终图像
-    left_eyelid_surface =  crop_centered_region(
-        eyelid_img, 
-        int(rel_x*3), 
-        int(rel_y*12)
-    )
-    #右眼眼睑镜像
-    right_eyelid_surface =  crop_centered_region(
-        np.fliplr(
-            eyelid_img
-        ), 
-        int(rel_x*3),
-        int(rel_y*12)
-    )
-
-
-    left_ias_surface  = crop_centered_region(
-        left_ias_img, 
-        int(rel_x*100), 
-        int(rel_y*100)
-    )
-
-    right_ias_surface  = crop_centered_region(
-        right_ias_img, 
-        int(rel_x*100), 
-        int(rel_y*100)
+        #radius = 1
+
+    #预渲染图集模式：直接取出RGB565帧
+    if render_set.atlas is not None:
+        FRAME_QUEUE.put(*CLIP_PLAYER.overlay(render_set.atlas.lookup(radius, rel_x, rel_y)), stamp=stamp)
+        return
+
+    state = eye_state(
+        render_set.pupil_n,
+        len(render_set.eyelid.eyelid_frames),
+        radius,
+        rel_x,
+        rel_y
     )
+    #不同预设的帧在缓存中互不影响
+    frame_key = (render_set.key,) + state
+
+    frames = FRAME_CACHE.get(frame_key) if FRAME_CACHE is not None else None
+    if frames is None:
+        #合并最终图像，眼睑只合成开口部分，右眼眼睑镜像
+        left_eye, right_eye = render_eye_state(
+            state,
+            render_set.left,
+            render_set.right,
+            render_set.eyelid,
+            LEFT_COMPOSITOR,
+            RIGHT_COMPOSITOR
+        )
+        frames = (convert_rgba_to_rgb565(left_eye), convert_rgba_to_rgb565(right_eye))
+        if FRAME_CACHE is not None:
+            FRAME_CACHE.put(frame_key, frames)
 
-    #合并最终图像
-    left_eye = combine_render(left_eyelid_surface,left_ias_surface)
-    right_eye = combine_render(right_eyelid_surface,right_ias_surface)
+    #正在播放动画的眼睛用动画帧替换
+    FRAME_QUEUE.put(*CLIP_PLAYER.overlay(frames), stamp=stamp)
 
-    pushImg(left_eye,right_eye)
 
 
+def CustomScreenRend(leftimg,rightimg,n,encoding="png",stamp=None):
+    def base64_to_rgb565(base64_string):
+        #相同内容的图片只解码、转换一次
+        key = hashlib.blake2b(base64_string.encode(), digest_size=16).digest()
+        cached = CUSTOM_SCREEN_CACHE.get(key) if CUSTOM_SCREEN_CACHE is not None else None
+        if cached is not None:
+            return cached[0]
 
-def CustomScreenRend(leftimg,rightimg,n):
-    def base64_to_nparray(base64_string):
         # 解码Base64字符串
         img_data = base64.b64decode(base64_string)
-        
-        # 将二进制数据转换为字节流
-        img = BytesIO(img_data)
-        
-        # 使用Pillow打开图片
-        image = Image.open(img)
-        
-        # 将Pillow图片对象转换为numpy数组
-        img_array = np.array(image)
-        
-        return img_array
+
+        if encoding == "rgb565":
+            #预先编码好的大端RGB565像素，不经过PIL
+            frame = np.frombuffer(img_data, dtype=RGB565_DTYPE)
+            if frame.size != LEFT_SCREEN.w * LEFT_SCREEN.h:
+                raise ValueError(f"rgb565 screen expects {LEFT_SCREEN.w}x{LEFT_SCREEN.h} pixels, got {frame.size}")
+        else:
+            # 使用Pillow打开图片
+            image = Image.open(BytesIO(img_data))
+            if image.size != (LEFT_SCREEN.w, LEFT_SCREEN.h):
+                raise ValueError(f"custom screen expects {LEFT_SCREEN.w}x{LEFT_SCREEN.h} image, got {image.size[0]}x{image.size[1]}")
+            frame = convert_rgba_to_rgb565(np.array(image.convert('RGBA')))
+
+        if CUSTOM_SCREEN_CACHE is not None:
+            CUSTOM_SCREEN_CACHE.put(key, (frame,))
+        return frame
     
-    left = base64_to_nparray(leftimg) 
-    right = base64_to_nparray(rightimg)
+    left = base64_to_rgb565(leftimg) 
+    right = left if rightimg == leftimg else base64_to_rgb565(rightimg)
+
+    #同一组帧只转换一次，在队列中占一个位置，连续显示n次
+    FRAME_QUEUE.put(left, right, repeat=n, stamp=stamp)
+
+def PresetRend(name=None):
+    #切换纹理预设，返回是否需要用新纹理重画当前状态
+    if name is not None:
+        return RENDER_PRESETS.switch(name)
+    return True
+
+def ClipRend(name=None, eye="both", loop=False, speed=1.0, stop=False):
+    #播放或停止预先转换好的动画片段，可以只作用于一只眼
+    if stop:
+        CLIP_PLAYER.stop(eye)
+    else:
+        CLIP_PLAYER.play(name, eye, loop, speed)
 
-    for _ in range(n):
-        pushImg(left,right)
+def RawScreenRend(left, right, n, stamp=None):
+    #二进制主题推送的RGB565帧已经是显示格式，直接入队
+    FRAME_QUEUE.put(left, right, repeat=n, stamp=stamp)
 
 def MqttRender():
     def on_connect(client, userdata, flags, rc, properties=None):
         client.subscribe("controler/eye")
+        client.subscribe(EYE_BIN_TOPIC)
+        client.subscribe(SCREEN_BIN_TOPIC)
+        client.subscribe("controler/eye/clip")
+        client.subscribe("controler/eye/preset")
+        client.subscribe("controler/eye/reload")
+
+    def on_binary_message(msg):
+        #二进制消息目前只有眼部状态，字段顺序与EYE_STATE_KEYS一致
+        kind, values = decode(msg.payload)
+        if kind != MSG_EYE_STATE:
+            return
+        if FRAME_RATE > 0 or SERVO_PLANNER is not None:
+            GAZE_TRACK.add_values(values)
+        if FRAME_RATE <= 0:
+            RENDER_MAILBOX.post_state(dict(zip(EYE_STATE_KEYS, values)))
 
     def on_message(client, userdata, msg):
+        #网络线程只解析消息并放进信箱，渲染在RenderWorker线程中进行
         try:
+            if msg.topic == EYE_BIN_TOPIC:
+                on_binary_message(msg)
+                return
+            if msg.topic == "controler/eye/reload":
+                HOT_RELOADER.request("mqtt")
+                return
+            if msg.topic == "controler/eye/preset":
+                RENDER_MAILBOX.post_command(json.loads(msg.payload.decode()), kind=PRESET)
+                return
+            if msg.topic == "controler/eye/clip":
+                RENDER_MAILBOX.post_command(json.loads(msg.payload.decode()), kind=CLIP)
+                return
+            if msg.topic == SCREEN_BIN_TOPIC:
+                left, right, n = decode_rgb565_screen(msg.payload, LEFT_SCREEN.w, LEFT_SCREEN.h)
+                RENDER_MAILBOX.post_command({"left": left, "right": right, "n": n}, kind=RAW_SCREEN)
+                return
 
             message_payload = msg.payload.decode()
             message_json = json.loads(message_payload)
@@ -232,9 +369,13 @@ def MqttRender():
 
             if not message_json["isCustomScreen"]:
                 
-                EYErend(**args)
+                #舵机也从GAZE_TRACK取样
+                if FRAME_RATE > 0 or SERVO_PLANNER is not None:
+                    GAZE_TRACK.add(args)
+                if FRAME_RATE <= 0:
+                    RENDER_MAILBOX.post_state(args)
             else:
-                CustomScreenRend(**args)
+                RENDER_MAILBOX.post_command(args)
                 
         except:
             pass
@@ -254,44 +395,138 @@ def MqttRender():
         time.sleep(0.01)
 
 
-def SPIpipe():
-    iteration_count = 0
+def RenderWorker():
+    #固定帧率模式下按时钟取插值后的视线，否则每条消息渲染一帧
+    clock = FrameClock(FRAME_RATE) if FRAME_RATE > 0 else None
+    last_args = None
+    last_state = None
     start_time = time.time()
 
     while True:
-        if len(LEFT_FRAME_BUFFER) == 0 or len(RIGHT_FRAME_BUFFER) == 0:
-            pass
+        #屏幕取走排队的帧后才渲染下一帧，等待期间到达的视线消息只保留最新的一条
+        if not FRAME_QUEUE.wait_room(RENDER_QUEUE_DEPTH, timeout=1):
+            if FRAME_QUEUE.closed:
+                return
+            continue
+
+        if clock is None:
+            #播放动画时在下一次换帧时醒来
+            timeout = 1
+            clip_due = CLIP_PLAYER.next_change()
+            if clip_due is not None:
+                timeout = min(max(clip_due - time.monotonic(), 0), 1)
+            item = RENDER_MAILBOX.take(timeout=timeout)
         else:
+            now = clock.wait()
+            #信箱中只有自定义屏幕命令，优先处理
+            item = RENDER_MAILBOX.take(timeout=0)
+            if item is None:
+                sampled = GAZE_TRACK.sample(now)
+                #视线静止时不重复提交相同的帧
+                if sampled is not None and sampled[0] != last_args:
+                    last_args = sampled[0]
+                    item = (STATE, *sampled)
+
+        video_active = VIDEO_STREAM is not None and VIDEO_STREAM.active
+        if item is not None and item[0] == STATE and video_active:
+            #视频流占用屏幕时不渲染眼睛
+            item = None
+            last_args = None
+
+        if item is not None:
+            kind, args, stamp = item
+            try:
+                if kind == STATE:
+                    EYErend(**args, stamp=stamp)
+                    last_state = args
+                elif kind == PRESET:
+                    if PresetRend(**args) and last_state is not None and not video_active:
+                        #预设切换后立即用新纹理重画最后的视线状态
+                        EYErend(**last_state)
+                elif kind == RAW_SCREEN:
+                    RawScreenRend(**args, stamp=stamp)
+                elif kind == CLIP:
+                    ClipRend(**args)
+                else:
+                    CustomScreenRend(**args, stamp=stamp)
+            except Exception:
+                logger.exception(f"render {kind} failed")
+        elif RENDER_MAILBOX.closed:
+            return
+        elif not video_active:
+            #没有新的眼部状态时，播放中的动画按自己的帧时长换帧
+            frames = CLIP_PLAYER.overlay(only_changed=True)
+            if frames is not None:
+                FRAME_QUEUE.put(*frames)
+
+        # 每秒输出一次信箱和帧时钟统计
+        if time.time() - start_time >= 1:
+            logger.debug(f"render mailbox: {RENDER_MAILBOX.stats()}")
+            if VIDEO_STREAM is not None:
+                logger.debug(f"video stream: {VIDEO_STREAM.stats()}")
+            if CLIP_PLAYER.active:
+                logger.debug(f"clips: {CLIP_PLAYER.stats()}")
+            if clock is not None:
+                logger.debug(f"frame clock: {clock.stats()}")
+            start_time = time.time()
+
+
+def SPIpipe():
+    start_time = time.time()
+
+    while True:
+        #没有新帧时阻塞等待，超时只用于定期输出统计
+        pair = FRAME_QUEUE.get(timeout=1)
+        if pair is not None:
             # 提交到屏幕
-            l = LEFT_FRAME_BUFFER.popleft()
-            r = RIGHT_FRAME_BUFFER.popleft()
-            LEFT_SCREEN.img_show(l)
-            RIGHT_SCREEN.img_show(r)
-            iteration_count += 1
+            LEFT_SCREEN.img_show(pair[0])
+            RIGHT_SCREEN.img_show(pair[1])
+            FRAME_QUEUE.shown()
+        elif FRAME_QUEUE.closed:
+            return
         
-        # 每秒计算并打印循环次数
+        # 每秒输出一次队列统计
         if time.time() - start_time >= 1:
-            #print(iteration_count)
-            
-            iteration_count = 0
+            logger.debug(f"frame queue: {FRAME_QUEUE.stats()}")
+            if HW.name == "sim":
+                logger.debug(f"simulated hardware: {HW.stats()}")
             start_time = time.time()
 
 
 def MqttPWM():
     def on_connect(client, userdata, flags, rc, properties=None):
         client.subscribe("controler/pwm")
+        client.subscribe(PWM_BIN_TOPIC)
+
+    def setPWM(channel, value):
+        if channel < PWM.CHANNELS:
+            PWM_SCHEDULER.set_value(channel, value)
+
+    def breathPWM(channel, step1, step2, PWMrange):
+        #只替换通道的波形，调度线程下一个tick生效
+        PWM_SCHEDULER.breath(channel, step1, step2, PWMrange)
 
     def on_message(client, userdata, msg):
         try:
+            if msg.topic == PWM_BIN_TOPIC:
+                kind, fields = decode(msg.payload)
+                if kind == MSG_PWM_SET:
+                    setPWM(*fields)
+                elif kind == MSG_PWM_BREATH:
+                    channel, step1, step2, low, high = fields
+                    breathPWM(channel, step1, step2, (low, high))
+                return
 
             message_payload = msg.payload.decode()
             message_json = json.loads(message_payload)
             if message_json["type"] == "set":
                 pwmdat = message_json["data"]
-                channel = int(pwmdat["channel"])
                 value = int(pwmdat["value"])
-                if channel <= 15:
-                    PWM.set_pwm(channel, 1, value)
+                if pwmdat["channel"] == "all":
+                    #所有通道同一个值，每条总线一次ALLCALL广播
+                    PWM_SCHEDULER.set_waves({channel: ConstantWave(value) for channel in range(PWM.CHANNELS)})
+                else:
+                    setPWM(int(pwmdat["channel"]), value)
             elif message_json["type"] == "breath":
                 pwmdat = message_json["data"]
                 channel = int(pwmdat["channel"])
@@ -299,9 +534,10 @@ def MqttPWM():
                 step2 = int(pwmdat["step2"])
                 PWMrange = tuple(pwmdat["range"])
 
-                terminate_thread(threads[f"{channel}"])
-                threads[f"{channel}"] = threading.Thread(target = whilePWM ,args=(channel, step1, step2, PWMrange))
-                threads[f"{channel}"].start()         
+                breathPWM(channel, step1, step2, PWMrange)
+            elif message_json["type"] == "curve":
+                #一条消息中的所有通道同时替换、同时开始
+                PWM_SCHEDULER.set_waves(parse_effects(message_json["data"], PWM_CURVES, PWM_TICK_HZ))
             else:
                 pass
 
@@ -310,23 +546,8 @@ def MqttPWM():
         except:
             pass
 
-        
-    def whilePWM(channel:int,step1:int,step2:int,PWMrange:tuple):
-        while True:
-            if step1 == 0:
-                time.sleep(1)
-            else:
-                for i in range(PWMrange[0],PWMrange[1],step1):
-                    PWM.set_pwm(channel, 1, i)
-                
-                for i in range(PWMrange[1],PWMrange[0],-step2):
-                    PWM.set_pwm(channel, 1, i)
-
 
-    threads = {}
-    for i in range(16):
-        threads[f"{i}"] =  threading.Thread(target = whilePWM ,args=(i, 0, 0,(0,0)))
-        threads[f"{i}"].start()
+    PWM_SCHEDULER.start()
 
     # Create an MQTT client instance
     client = mqtt.Client(client_id="PWM_Controler")
@@ -339,11 +560,23 @@ def MqttPWM():
 
     # Start the loop in a separate thread
     client.loop_start()
+    start_time = time.time()
     while True:
         time.sleep(0.01)
+        if time.time() - start_time > 10:
+            logger.debug(f"pwm scheduler: {PWM_SCHEDULER.stats()}")
+            if SERVO_PLANNER is not None:
+                logger.debug(f"servo planner: {SERVO_PLANNER.stats()}")
+            start_time = time.time()
 
 if __name__ == "__main__":
 
+    logging.basicConfig(level=logging.INFO)
+
+    #打开设备、初始化屏幕和PWM控制板
+    init_hardware()
+    logger.info(f"hardware backend: {HW.name}")
+
     loadingThread = threading.Thread(target = loadingFrame)
     loadingThread.start()
 
@@ -353,6 +586,16 @@ if __name__ == "__main__":
     pipeThread = threading.Thread(target = SPIpipe)
     pipeThread.start()
 
+    if VIDEO_STREAM_CONF is not None:
+        VIDEO_STREAM = VideoStream(
+            FRAME_QUEUE,
+            screen_size=(LEFT_SCREEN.w, LEFT_SCREEN.h),
+            **VIDEO_STREAM_CONF
+        ).start()
+
+    RenderWorkerThread = threading.Thread(target = RenderWorker)
+    RenderWorkerThread.start()
+
     RenderThread = threading.Thread(target = MqttRender)
     RenderThread.start()
 
@@ -2,6 +2,9 @@ import numpy as np
 from PIL import Image
 import cv2
 import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 def calculate_distance(point1, point2):
     """
@@ -43,18 +46,17 @@ def generate_tuples(tuple1, tuple2, n):
     
     return result
 
-def crop_centered_region(image, center_x, center_y):
+def crop_centered_origin(height, width, center_x, center_y):
     """
-    从图像中以指定点为中心裁剪一个区域。裁剪区域的大小为图像宽高的一半。
+    计算crop_centered_region裁剪区域的左上角坐标。
 
     参数：
-    image: 输入的图像（numpy数组，RGBA格式）
+    height, width: 原图像的高和宽
     center_x, center_y: 裁剪区域的中心点位置
 
     返回：
-    裁剪后的图像（numpy数组，RGBA格式）
+    (start_y, start_x) 元组
     """
-    height, width, _ = image.shape
     crop_width, crop_height = width // 2, height // 2
 
     actual_center_x = width // 2 + center_x
@@ -78,50 +80,298 @@ def crop_centered_region(image, center_x, center_y):
         end_y = height
         start_y = end_y - crop_height
 
-    cropped_image = image[start_y:end_y, start_x:end_x]
+    return start_y, start_x
+
+def crop_centered_region(image, center_x, center_y):
+    """
+    从图像中以指定点为中心裁剪一个区域。裁剪区域的大小为图像宽高的一半。
+
+    参数：
+    image: 输入的图像（numpy数组，RGBA格式）
+    center_x, center_y: 裁剪区域的中心点位置
+
+    返回：
+    裁剪后的图像（numpy数组，RGBA格式）
+    """
+    height, width, _ = image.shape
+    start_y, start_x = crop_centered_origin(height, width, center_x, center_y)
+
+    cropped_image = image[start_y:start_y + height // 2, start_x:start_x + width // 2]
     return cropped_image
 
-def map_float_to_array(arr, float_num):
+def map_float_to_index(length, float_num):
     """
-    将浮点数映射到数组中的元素。
+    将浮点数映射到长度为length的数组下标。
 
     参数：
-    arr: 输入的数组
+    length: 数组长度
     float_num: 0到1之间的浮点数
 
     返回：
-    数组中的元素
+    数组下标（整数）
     """
     if not (0 <= float_num <= 1):
         raise ValueError("The floating point number must be between 0 and 1")
     
-    index = int(float_num * len(arr))
+    index = int(float_num * length)
     
-    if index == len(arr):
+    if index == length:
         index -= 1
     
-    return arr[index]
+    return index
+
+def map_float_to_array(arr, float_num):
+    """
+    将浮点数映射到数组中的元素。
+
+    参数：
+    arr: 输入的数组
+    float_num: 0到1之间的浮点数
+
+    返回：
+    数组中的元素
+    """
+    return arr[map_float_to_index(len(arr), float_num)]
 
-def combine_render(frame1, frame2):
+def _div255(x, out):
+    """
+    整数除以255（向下取整），对0~65280范围内的uint16精确。
+
+    参数：
+    x: uint16数组，被除数
+    out: uint16数组，结果写入位置，不能与x相同
+
+    返回：
+    out
+    """
+    np.right_shift(x, 8, out=out)
+    out += x
+    out += 1
+    out >>= 8
+    return out
+
+class AlphaCompositor:
+    def __init__(self, shape=(240, 240)):
+        """
+        定点数alpha合成器，预分配输出和中间缓冲区，逐帧复用。
+
+        参数：
+        shape: 元组，帧的高和宽
+
+        注意：over()返回的是内部输出缓冲区，下一次调用会被覆盖，
+        每个需要同时保留结果的调用方（如左右眼）应各自持有一个实例。
+        """
+        h, w = shape
+        self.shape = (h, w)
+        self.out = np.empty((h, w, 4), dtype=np.uint8)
+        #按像素打包的alpha权重，字节序固定为小端，与RGBA内存布局一致
+        self._w_top = np.empty((h, w), dtype='<u4')
+        self._w_bottom = np.empty((h, w), dtype='<u4')
+        self._acc = np.empty((h, w, 4), dtype=np.uint16)
+        self._tmp = np.empty((h, w, 4), dtype=np.uint16)
+        self._weight = np.empty((h, w, 4), dtype=np.uint16)
+        self._alpha_top = np.empty((h, w), dtype=np.uint8)
+
+    def over(self, top, bottom, out=None):
+        """
+        将top叠加在bottom之上（非预乘alpha），结果与浮点版本误差不超过1。
+
+        每个通道计算 (c1*a1 + c2*(255-a1)) / 255，alpha通道计算
+        (255*a1 + a2*(255-a1)) / 255，全部在连续的uint16缓冲区上完成；
+        底层不透明或顶层完全透明/不透明时这就是精确结果。
+        顶层半透明且底层不是完全不透明的像素（通常很少）再单独用整数除法修正颜色。
+
+        参数：
+        top, bottom: 输入的图像帧（numpy数组，RGBA格式，uint8，C连续）
+        out: 可选，输出位置，默认写入self.out
+
+        返回：
+        合成后的图像帧（numpy数组，RGBA格式）
+        """
+        if out is None:
+            out = self.out
+        h, w = self.shape
+        top = np.ascontiguousarray(top)
+        bottom = np.ascontiguousarray(bottom)
+
+        #把a1复制到像素的四个字节：顶层权重为(a1,a1,a1,255)，底层权重为(255-a1)*4
+        w_top, w_bottom = self._w_top, self._w_bottom
+        np.right_shift(top.view('<u4').reshape(h, w), 24, out=w_top)
+        np.multiply(w_top, 0x01010101, out=w_top)
+        np.invert(w_top, out=w_bottom)
+        np.bitwise_or(w_top, 0xFF000000, out=w_top)
+
+        acc, tmp, weight = self._acc, self._tmp, self._weight
+        np.copyto(acc, top)
+        np.copyto(weight, w_top.view(np.uint8).reshape(h, w, 4))
+        acc *= weight
+        np.copyto(tmp, bottom)
+        np.copyto(weight, w_bottom.view(np.uint8).reshape(h, w, 4))
+        tmp *= weight
+        acc += tmp
+        np.copyto(out, _div255(acc, tmp), casting='unsafe')
+
+        #合成后完全透明的像素统一置零
+        pixels = out.view('<u4')
+        np.copyto(pixels, 0, where=pixels < 0x01000000)
+
+        #顶层半透明且底层不是完全不透明的像素需要真正的除法
+        np.subtract(top[:, :, 3], 1, out=self._alpha_top)
+        ys, xs = np.nonzero((self._alpha_top < 254) & (bottom[:, :, 3] != 255))
+        if ys.size:
+            t = top[ys, xs].astype(np.uint32)
+            b = bottom[ys, xs].astype(np.uint32)
+            w1 = t[:, 3] * 255
+            w2 = b[:, 3] * (255 - t[:, 3])
+            den = w1 + w2
+            num = t[:, :3] * w1[:, None] + b[:, :3] * w2[:, None]
+            out[ys, xs, :3] = num // np.maximum(den, 1)[:, None]
+
+        return out
+
+    def over_eyelid(self, lid, bottom, center_x, center_y, flip=False, out=None):
+        """
+        将眼睑帧按EYErend的裁剪方式叠加在bottom之上，只处理眼睑开口部分。
+
+        眼睑帧只有完全透明和完全不透明两种像素，因此输出先整体填充眼睑颜色，
+        再按每行的开口区间从bottom拷贝像素，结果与crop+over()一致。
+        眼睑帧不满足该条件时退回到完整的over()。
+
+        参数：
+        lid: EyeLidFrame对象
+        bottom: 下层图像帧（numpy数组，RGBA格式，与合成器尺寸相同）
+        center_x, center_y: 眼睑裁剪区域的中心偏移，与crop_centered_region相同
+        flip: 布尔值，是否左右镜像眼睑（右眼）
+        out: 可选，输出位置，默认写入self.out
+
+        返回：
+        合成后的图像帧（numpy数组，RGBA格式）
+        """
+        if out is None:
+            out = self.out
+        image = np.fliplr(lid.image) if flip else lid.image
+        if not lid.sparse:
+            return self.over(crop_centered_region(image, center_x, center_y), bottom, out)
+
+        h, w = self.shape
+        size_y, size_x = lid.image.shape[:2]
+        start_y, start_x = crop_centered_origin(size_y, size_x, center_x, center_y)
+
+        out.view('<u4').fill(lid.color32)
+
+        y0 = max(lid.top, start_y)
+        y1 = min(lid.bottom, start_y + h)
+        if y0 >= y1:
+            return out
+
+        x0 = lid.x0[y0:y1]
+        x1 = lid.x1[y0:y1]
+        if flip:
+            x0, x1 = size_x - x1, size_x - x0
+        x0 = np.clip(x0 - start_x, 0, w).tolist()
+        x1 = np.clip(x1 - start_x, 0, w).tolist()
+
+        for y, a, b in zip(range(y0 - start_y, y1 - start_y), x0, x1):
+            if a < b:
+                out[y, a:b] = bottom[y, a:b]
+        return out
+
+def combine_render(frame1, frame2, out=None):
     """
     叠加两个图像帧并返回合成结果。
 
     参数：
-    frame1, frame2: 输入的图像帧（numpy数组，RGBA格式）
+    frame1, frame2: 输入的图像帧（numpy数组，RGBA格式），frame1在上层
+    out: 可选，预分配的输出数组
 
     返回：
     合成后的图像帧（numpy数组，RGBA格式）
     """
-    rgb1 = frame1[:, :, :3]
-    alpha1 = frame1[:, :, 3] / 255.0
-    rgb2 = frame2[:, :, :3]
-    alpha2 = frame2[:, :, 3] / 255.0
+    if out is None:
+        out = np.empty(frame1.shape[:2] + (4,), dtype=np.uint8)
+    return AlphaCompositor(frame1.shape[:2]).over(frame1, frame2, out)
 
-    alpha_combined = alpha1 + alpha2 * (1 - alpha1)
-    rgb_combined = (rgb1 * alpha1[..., None] + rgb2 * alpha2[..., None] * (1 - alpha1[..., None])) / alpha_combined[..., None]
+@lru_cache(maxsize=2)
+def polar_warp_map(size, inner, outer):
+    """
+    计算椭圆环到纹理坐标的反向映射，按 (size, inner, outer) 缓存最近的两份，
+    重复的瞳孔步骤共用同一份结果；映射以float32保存（480²时每份约2MB）。
 
-    combined_image = np.dstack((rgb_combined, alpha_combined * 255)).astype(np.uint8)
-    return combined_image
+    参数：
+    size: 整数，画布边长
+    inner: 元组，内圈长轴和短轴
+    outer: 元组，外圈长轴和短轴
+
+    返回：
+    (t, s, valid) 元组：t为0~1的径向位置（纹理行），s为0~1的角度位置（纹理列），
+    valid为落在环内的像素
+    """
+    center = size // 2
+    y, x = np.mgrid[:size, :size]
+    #像素中心
+    dx = x + 0.5 - center
+    dy = y + 0.5 - center
+
+    a0, b0 = inner
+    da, db = outer[0] - inner[0], outer[1] - inner[1]
+
+    def radius(t, dx, dy):
+        #像素相对于第t圈椭圆的归一化半径的平方，随t增大而减小
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (dx / (a0 + t * da)) ** 2 + (dy / (b0 + t * db)) ** 2
+
+    valid = (radius(0.0, dx, dy) >= 1) & (radius(1.0, dx, dy) <= 1)
+
+    #只对环内的像素二分求出所在的圈 t
+    vx, vy = dx[valid], dy[valid]
+    lo = np.zeros(vx.shape)
+    hi = np.ones(vx.shape)
+    for _ in range(20):
+        mid = (lo + hi) / 2
+        beyond = radius(mid, vx, vy) > 1
+        lo = np.where(beyond, mid, lo)
+        hi = np.where(beyond, hi, mid)
+    vt = (lo + hi) / 2
+
+    t = np.zeros((size, size), dtype=np.float32)
+    s = np.zeros((size, size), dtype=np.float32)
+    t[valid] = vt
+    s[valid] = np.arctan2(vy / (b0 + vt * db), vx / (a0 + vt * da)) % (2 * np.pi) / (2 * np.pi)
+    #缓存的结果被多次使用，设为只读
+    for array in (t, s, valid):
+        array.flags.writeable = False
+    return t, s, valid
+
+def _memory_report(obj):
+    """
+    统计对象属性中numpy数组（包括数组列表和带数组属性的对象列表）占用的字节数，
+    共享同一块内存的数组只计一次。
+    """
+    seen = {id(obj)}
+    report = {}
+
+    def nbytes(value):
+        if isinstance(value, np.ndarray):
+            base = value if value.base is None else value.base
+            if id(base) in seen:
+                return 0
+            seen.add(id(base))
+            return base.nbytes if isinstance(base, np.ndarray) else value.nbytes
+        if isinstance(value, (list, tuple)):
+            return sum(nbytes(v) for v in value)
+        if isinstance(value, dict):
+            return sum(nbytes(v) for v in value.values())
+        if hasattr(value, "__dict__") and id(value) not in seen:
+            seen.add(id(value))
+            return sum(nbytes(v) for v in vars(value).values())
+        return 0
+
+    for name, value in vars(obj).items():
+        size = nbytes(value)
+        if size:
+            report[name] = size
+    report["total"] = sum(report.values())
+    return report
 
 class IrisAndScleraRender:
     def __init__(self, sclera, iris, frame_size=480, sclera_inner=(82, 86), sclera_outer=(240, 240),
@@ -139,28 +389,68 @@ class IrisAndScleraRender:
         iris_inner_crazy_max: 元组，虹膜最大内圈长轴和短轴
         iris_smooth_n: 整数，瞳孔缩放动画的平滑度
         iris_outer: 元组，虹膜外圈长轴和短轴
+
+        渲染结果统一存放在iris_and_sclera_array_list这一块连续数组中，
+        纹理和中间结果（巩膜层、虹膜层、瞳孔层）在预渲染完成后即释放。
         """
-        self._sclera_array = np.array(sclera)
-        self._iris_array = np.array(iris)
+        sclera_array = np.array(sclera)
+        iris_array = np.array(iris)
 
-        self.sclera_img = self._iris_and_sclera_render(self._sclera_array, sclera.size, frame_size, sclera_inner, sclera_outer)
-        self.pupil_array = self._pupil_render(frame_size, iris_inner_crazy_max[1] + 2)
+        sclera_img = self._iris_and_sclera_render(sclera_array, sclera.size, frame_size, sclera_inner, sclera_outer)
+        pupil_array = self._pupil_render(frame_size, iris_inner_crazy_max[1] + 2)
+        del sclera_array
 
         iris_tuple_list = generate_tuples(iris_inner_normal, iris_inner_crazy_max, iris_smooth_n)
-        self.iris_array_list = []
-        self.iris_and_sclera_array_list = []
+        self.iris_and_sclera_array_list = np.empty((len(iris_tuple_list), frame_size, frame_size, 4), dtype=np.uint8)
+
+        for i, iris_tuple in enumerate(iris_tuple_list):
+            _tmp = self._iris_and_sclera_render(iris_array, iris.size, frame_size, iris_tuple, iris_outer)
+            _combine_iris = combine_render(_tmp, pupil_array)
+            combine_render(sclera_img, _combine_iris, out=self.iris_and_sclera_array_list[i])
+
+    def to_cache(self):
+        """
+        导出预渲染结果，供mods.systems.make_cache保存。
+
+        返回：
+        (数组字典, 参数字典) 元组
+        """
+        return {"frames": self.iris_and_sclera_array_list}, {}
+
+    @classmethod
+    def from_cache(cls, arrays, meta):
+        """
+        由缓存的数组直接构造渲染器，不再重新渲染。
+
+        参数：
+        arrays: 数组字典（可以是内存映射数组）
+        meta: 参数字典
+
+        返回：
+        IrisAndScleraRender对象
+        """
+        render = cls.__new__(cls)
+        render.iris_and_sclera_array_list = arrays["frames"]
+        return render
 
-        for iris_tuple in iris_tuple_list:
-            _tmp = self._iris_and_sclera_render(self._iris_array, iris.size, frame_size, iris_tuple, iris_outer)
-            _combine_iris = combine_render(_tmp, self.pupil_array)
-            self.iris_array_list.append(_combine_iris)
-            _combine = combine_render(self.sclera_img, _combine_iris)
-            self.iris_and_sclera_array_list.append(_combine)
+    def memory_report(self):
+        """
+        统计渲染器持有的数组占用的内存。
 
-    def _iris_and_sclera_render(self, frame_array, frame_size, size, inner, outer):
+        返回：
+        字典，属性名到字节数，total为合计
+        """
+        return _memory_report(self)
+
+    @staticmethod
+    def _iris_and_sclera_render(frame_array, frame_size, size, inner, outer):
         """
         全局通用渲染器，用于渲染瞳孔、虹膜和巩膜。
 
+        纹理的行对应从内圈到外圈，列对应0到2π的角度。对画布上的每个像素
+        反向求出它在纹理上的位置，再用cv2.remap双线性采样，
+        因此可以直接使用原始分辨率的纹理，不会出现空洞。
+
         参数：
         frame_array: numpy数组，输入图像数据
         frame_size: 元组，帧的尺寸
@@ -171,27 +461,21 @@ class IrisAndScleraRender:
         返回：
         渲染后的图像（numpy数组，RGBA格式）
         """
-        new_img = np.zeros((size, size, 4), dtype=np.uint8)
-        center = size // 2
-
-        t = np.linspace(0, 1, frame_size[1])[:, np.newaxis]
-        a = inner[0] + t * (outer[0] - inner[0])
-        b = inner[1] + t * (outer[1] - inner[1])
-        theta = np.linspace(0, 2 * np.pi, frame_size[0])
-        x = center + a * np.cos(theta)
-        y = center + b * np.sin(theta)
+        t, s, valid = polar_warp_map(size, tuple(inner), tuple(outer))
+        width, height = frame_size
 
-        x = np.clip(x, 0, size - 1).astype(int)
-        y = np.clip(y, 0, size - 1).astype(int)
-        idx = np.arange(frame_size[0])
+        map_x = (s * (width - 1)).astype(np.float32)
+        map_y = (t * (height - 1)).astype(np.float32)
+        new_img = cv2.remap(frame_array, map_x, map_y, interpolation=cv2.INTER_LINEAR,
+                            borderMode=cv2.BORDER_REPLICATE)
 
-        new_img[y, x] = frame_array[np.arange(frame_size[1])[:, np.newaxis], idx]
-        mask = new_img[:, :, 3] == 0
+        mask = ~valid | (new_img[:, :, 3] == 0)
         new_img[mask] = [0, 0, 0, 0]
 
         return new_img
 
-    def _pupil_render(self, size, radius):
+    @staticmethod
+    def _pupil_render(size, radius):
         """
         瞳孔生成器。
 
@@ -244,9 +528,55 @@ class IrisAndScleraRender:
         lens_effect_img = cv2.remap(img_array, x_new, y_new, interpolation=cv2.INTER_LINEAR)
         return lens_effect_img
 
+class EyeLidFrame:
+    def __init__(self, image):
+        """
+        单帧眼睑及其开口区域的预计算信息，供AlphaCompositor.over_eyelid使用。
+
+        参数：
+        image: 眼睑图像（numpy数组，RGBA格式）
+
+        属性：
+        mask: 布尔数组，True为眼睑开口（透明）部分
+        top, bottom: 开口区域所在的行范围 [top, bottom)
+        left, right: 开口区域所在的列范围 [left, right)
+        x0, x1: 每一行开口的列区间 [x0, x1)，无开口的行为 (0, 0)
+        sparse: 布尔值，是否可以按行区间合成
+        color32: 眼睑颜色按小端打包的RGBA像素，用于整块填充
+        """
+        self.image = image
+        alpha = image[:, :, 3]
+        self.mask = alpha == 0
+        height, width = self.mask.shape
+
+        opaque = ~self.mask
+        if opaque.any():
+            self.color32 = int(image[opaque][0].view('<u4')[0])
+        else:
+            self.color32 = 0
+
+        rows = self.mask.any(axis=1)
+        row_idx = np.flatnonzero(rows)
+        self.x0 = np.zeros(height, dtype=np.int32)
+        self.x1 = np.zeros(height, dtype=np.int32)
+        self.x0[rows] = np.argmax(self.mask[rows], axis=1)
+        self.x1[rows] = width - np.argmax(self.mask[rows, ::-1], axis=1)
+
+        if row_idx.size:
+            self.top, self.bottom = int(row_idx[0]), int(row_idx[-1]) + 1
+            self.left, self.right = int(self.x0[rows].min()), int(self.x1[rows].max())
+        else:
+            self.top = self.bottom = self.left = self.right = 0
+
+        #开口必须每行连续、且眼睑只有全透明和全不透明两种像素
+        binary = np.all((alpha == 0) | (alpha == 255))
+        uniform = not opaque.any() or np.all(image[opaque].view('<u4') == self.color32)
+        contiguous = np.array_equal(self.mask.sum(axis=1), self.x1 - self.x0)
+        self.sparse = bool(binary and uniform and contiguous)
+
 class EyeLidRender:
     def __init__(self, eyelid_color, Rsize=480, flash_n=10, axes_upper=(110, 60), axes_lower=(110, 1),
-                 angle=10, sharpness=6):
+                 angle=10, sharpness=6, eyelid_list=None, dtype="float64", on_demand=False, memo_size=64):
         """
         眼睑渲染器，用于生成眨眼动画。
 
@@ -258,13 +588,72 @@ class EyeLidRender:
         axes_lower: 元组，闭眼状态的眼睑
         angle: 整数，眼睑的旋转角度
         sharpness: 整数，眼睑一侧的收缩程度
+        eyelid_list: 可选，已经渲染好的眼睑帧列表（如并行预渲染的结果），提供时不再重新生成
+        dtype: 字符串，椭圆计算使用的浮点类型，"float32"更快、内存更少
+        on_demand: 布尔值，为True时启动时不生成任何帧，第一次用到某一帧时才按椭圆轴长解析地渲染并缓存，
+                   帧仍按下标访问，开合程度的精度由flash_n决定，适合把flash_n设得很大以获得更平滑的眨眼
+        memo_size: 整数，on_demand模式下最多缓存的帧数
         """
         self.border_color_hex = eyelid_color
         self.sharpness = sharpness
         self.angle = angle
         self.Rsize = Rsize
-        eyelid_tuple_list = generate_tuples(axes_upper, axes_lower, flash_n)
-        self.eyelid_list = [self.create_custom_ellipse_image(axes) for axes in eyelid_tuple_list]
+        self.axes_upper = axes_upper
+        self.axes_lower = axes_lower
+        self.dtype = np.dtype(dtype)
+        self._ellipse_terms_cache = None
+
+        if on_demand:
+            self.eyelid_frames = _OnDemandEyeLidFrames(self, flash_n, memo_size)
+            self.eyelid_list = _OnDemandEyeLidImages(self.eyelid_frames)
+            return
+
+        if eyelid_list is None:
+            eyelid_tuple_list = generate_tuples(axes_upper, axes_lower, flash_n)
+            eyelid_list = list(self.create_ellipse_images(eyelid_tuple_list))
+        self.eyelid_list = eyelid_list
+        self.eyelid_frames = [EyeLidFrame(image) for image in self.eyelid_list]
+
+    def to_cache(self):
+        """
+        导出眼睑帧，供mods.systems.make_cache保存。
+
+        返回：
+        (数组字典, 参数字典) 元组
+        """
+        return {"eyelid": np.stack(self.eyelid_list)}, self.cache_meta()
+
+    def cache_meta(self):
+        """缓存中保存的参数，from_cache用它们重建渲染器"""
+        return {
+            "eyelid_color": self.border_color_hex,
+            "sharpness": self.sharpness,
+            "angle": self.angle,
+            "Rsize": self.Rsize
+        }
+
+    @classmethod
+    def from_cache(cls, arrays, meta):
+        """
+        由缓存的数组直接构造渲染器，开口区域信息按帧重新计算。
+
+        参数：
+        arrays: 数组字典（可以是内存映射数组）
+        meta: 参数字典
+
+        返回：
+        EyeLidRender对象
+        """
+        return cls(eyelid_list=list(arrays["eyelid"]), **meta)
+
+    def memory_report(self):
+        """
+        统计渲染器持有的数组占用的内存。
+
+        返回：
+        字典，属性名到字节数，total为合计
+        """
+        return _memory_report(self)
 
     def _hex_to_rgb(self, hex_color):
         """
@@ -279,6 +668,69 @@ class EyeLidRender:
         hex_color = hex_color.lstrip('#')
         return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
 
+    def _ellipse_terms(self):
+        """
+        所有眼睑帧共用的几何量，只计算一次。
+
+        眼睑椭圆为 u²/rx² + w/ry² <= 1，其中u、v为旋转后的坐标，
+        w = v²/gradient²，gradient为眼睑一侧的收缩系数。
+
+        返回：
+        (u², w) 元组（numpy数组，Rsize x Rsize）
+        """
+        if self._ellipse_terms_cache is None:
+            dtype = self.dtype
+            y, x = np.ogrid[:self.Rsize, :self.Rsize]
+            cy = (self.Rsize // 2) + (self.Rsize // 20)
+            cx = (self.Rsize // 2)
+            dx = (x - cx).astype(dtype)
+            dy = (y - cy).astype(dtype)
+
+            angle_rad = np.deg2rad(self.angle)
+            cos_angle = dtype.type(np.cos(angle_rad))
+            sin_angle = dtype.type(np.sin(angle_rad))
+
+            gradient = (1 - dy / dtype.type(self.Rsize)) ** self.sharpness
+            gradient = np.clip(gradient, 0, 1)
+
+            u = dx * cos_angle + dy * sin_angle
+            v = dx * sin_angle - dy * cos_angle
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self._ellipse_terms_cache = (u * u, (v * v) / (gradient * gradient))
+        return self._ellipse_terms_cache
+
+    def _color32(self):
+        """眼睑颜色按小端打包的RGBA像素"""
+        r, g, b = self._hex_to_rgb(self.border_color_hex)
+        return r | (g << 8) | (b << 16) | (255 << 24)
+
+    def create_ellipse_images(self, axes_list, chunk=8, out=None):
+        """
+        批量创建眼睑图像，共用同一份几何量，每次对chunk帧做一次广播计算。
+
+        参数：
+        axes_list: 列表，每一帧椭圆的长轴和短轴（可以是浮点数）
+        chunk: 整数，每次广播计算的帧数，限制临时内存
+        out: 可选，预分配的输出数组（N x Rsize x Rsize x 4，可以是内存映射数组）
+
+        返回：
+        生成的眼睑图像（numpy数组，N x Rsize x Rsize x 4，RGBA格式）
+        """
+        u2, w = self._ellipse_terms()
+        images = out if out is not None else np.empty((len(axes_list), self.Rsize, self.Rsize, 4), dtype=np.uint8)
+        pixels = images.view('<u4')[..., 0]
+        color32 = np.uint32(self._color32())
+
+        for start in range(0, len(axes_list), chunk):
+            axes = np.asarray(axes_list[start:start + chunk], dtype=self.dtype)
+            rx2 = (axes[:, 0] ** 2)[:, None, None]
+            ry2 = (axes[:, 1] ** 2)[:, None, None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                inside = (u2 / rx2 + w / ry2) <= 1
+            pixels[start:start + len(axes)] = np.where(inside, np.uint32(0), color32)
+
+        return images
+
     def create_custom_ellipse_image(self, axes):
         """
         创建自定义椭圆图像。
@@ -289,26 +741,110 @@ class EyeLidRender:
         返回：
         生成的椭圆图像（numpy数组，RGBA格式）
         """
-        border_color = self._hex_to_rgb(self.border_color_hex)
-        image = np.zeros((self.Rsize, self.Rsize, 4), dtype=np.uint8)
+        return self.create_ellipse_images([axes])[0]
 
-        y, x = np.ogrid[:self.Rsize, :self.Rsize]
-        cy = (self.Rsize // 2) + (self.Rsize // 20)
-        cx = (self.Rsize // 2)
+    def axes_at(self, openness):
+        """
+        按开合程度解析地插值椭圆轴长，不做取整，on_demand模式按帧下标换算开合程度后使用。
 
-        rx, ry = axes
-        angle_rad = np.deg2rad(self.angle)
-        cos_angle = np.cos(angle_rad)
-        sin_angle = np.sin(angle_rad)
+        参数：
+        openness: 0到1之间的浮点数，0为axes_upper（正常），1为axes_lower（闭眼）
 
-        gradient = (1 - (y - cy) / self.Rsize) ** self.sharpness
-        gradient = np.clip(gradient, 0, 1)
+        返回：
+        (rx, ry) 元组
+        """
+        (x1, y1), (x2, y2) = self.axes_upper, self.axes_lower
+        return (x1 + (x2 - x1) * openness, y1 + (y2 - y1) * openness)
+
+class _OnDemandEyeLidFrames:
+    def __init__(self, render, flash_n, memo_size):
+        """
+        按需渲染的眼睑帧序列，下标与预先生成的eyelid_frames一致，
+        第一次访问时渲染，最近使用的memo_size帧保留在内存中。
+        """
+        self._render = render
+        self._n = flash_n
+        self._memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._n
+        if not 0 <= index < self._n:
+            raise IndexError("eyelid frame index out of range")
+        with self._lock:
+            frame = self._memo.get(index)
+            if frame is not None:
+                self._memo.move_to_end(index)
+                return frame
+        #与generate_tuples相同的取整，结果和预先生成的帧一致
+        axes = tuple(round(a) for a in self._render.axes_at(index / (self._n - 1)))
+        frame = EyeLidFrame(self._render.create_custom_ellipse_image(axes))
+        with self._lock:
+            self._memo[index] = frame
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return frame
+
+class _OnDemandEyeLidImages:
+    def __init__(self, frames):
+        """on_demand模式下eyelid_list的只读视图"""
+        self._frames = frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, index):
+        return self._frames[index].image
+
+def eye_state(pupil_n, eyelid_n, radius, rel_x, rel_y):
+    """
+    从眼部消息参数推导出渲染所需的整数状态，相同状态渲染结果相同。
+
+    参数：
+    pupil_n: 整数，瞳孔缩放帧数（iris_and_sclera_array_list的长度）
+    eyelid_n: 整数，眼睑帧数（eyelid_frames的长度）
+    radius: 0到1之间的浮点数，眼睑闭合程度
+    rel_x, rel_y: 浮点数，视线偏移
 
-        ellipse = (((x - cx) * cos_angle + (y - cy) * sin_angle) ** 2) / (rx ** 2) + \
-                  (((x - cx) * sin_angle - (y - cy) * cos_angle) ** 2) / ((ry * gradient) ** 2)
+    返回：
+    (瞳孔帧下标, 眼睑帧下标, 虹膜裁剪x, 虹膜裁剪y, 眼睑裁剪x, 眼睑裁剪y) 元组
+    """
+    #计算瞳孔偏移后的缩小大小，模拟球面的透视效果
+    pupil_dy = 1 - (1 if abs(rel_x) * 1.6 > 1 else abs(rel_x) * 1.6)
+
+    return (
+        map_float_to_index(pupil_n, pupil_dy),
+        map_float_to_index(eyelid_n, radius),
+        int(rel_x * 100),
+        int(rel_y * 100),
+        int(rel_x * 3),
+        int(rel_y * 12)
+    )
+
+def render_eye_state(state, left_render, right_render, eyelid_render, left_compositor, right_compositor):
+    """
+    按eye_state得到的状态渲染左右眼画面，右眼眼睑镜像。
+
+    参数：
+    state: eye_state返回的元组
+    left_render, right_render: IrisAndScleraRender对象
+    eyelid_render: EyeLidRender对象
+    left_compositor, right_compositor: AlphaCompositor对象，结果写入其输出缓冲区
+
+    返回：
+    (左眼图像, 右眼图像) 元组（numpy数组，RGBA格式）
+    """
+    pupil_idx, eyelid_idx, ias_x, ias_y, lid_x, lid_y = state
+    eyelid_frame = eyelid_render.eyelid_frames[eyelid_idx]
 
-        mask = ellipse <= 1
-        image[mask] = [0, 0, 0, 0]
-        image[~mask] = list(border_color) + [255]
+    left_ias_surface = crop_centered_region(left_render.iris_and_sclera_array_list[pupil_idx], ias_x, ias_y)
+    right_ias_surface = crop_centered_region(right_render.iris_and_sclera_array_list[pupil_idx], ias_x, ias_y)
 
-        return image
+    left_eye = left_compositor.over_eyelid(eyelid_frame, left_ias_surface, lid_x, lid_y)
+    right_eye = right_compositor.over_eyelid(eyelid_frame, right_ias_surface, lid_x, lid_y, flip=True)
+    return left_eye, right_eye
@@ -0,0 +1,166 @@
+import os
+import shutil
+import time
+import numpy as np
+
+from .Render import AlphaCompositor, eye_state, render_eye_state, map_float_to_index
+from .hardware.ST7789 import RGB565_DTYPE, convert_rgba_to_rgb565
+from .systems import cache_tmpdir, check_cache, commit_cache, read_cache
+
+#图集格式版本，格式变化时递增，作为缓存key的一部分，旧图集自动失效
+ATLAS_VERSION = 2
+
+
+class FrameAtlas:
+    def __init__(self, frames, meta):
+        """
+        预渲染RGB565帧图集，以缓存的格式保存，以只读内存映射方式打开，按需分页加载。
+        图集放在单独的缓存目录中，与纹理缓存分开计算上限，互不淘汰。
+
+        图集按 (眼睑帧, 视线y格点, 视线x格点, 左/右眼) 索引，
+        每一项是可以直接交给ST7789.img_show的一帧大端RGB565数据。
+        瞳孔缩放帧由rel_x决定，因此不单独占一个维度。
+
+        参数：
+        frames: numpy数组，形状为 (眼睑帧数, n, n, 2, 像素数)
+        meta: 字典，grid_step、limit、eyelid_n等参数
+        """
+        self.meta = meta
+        self.grid_step = meta["grid_step"]
+        self.limit = meta["limit"]
+        self.eyelid_n = meta["eyelid_n"]
+        self.k = self.limit // self.grid_step
+        self.frames = frames
+
+    def to_cache(self):
+        return {"frames": self.frames}, self.meta
+
+    @classmethod
+    def from_cache(cls, arrays, meta):
+        return cls(arrays["frames"], meta)
+
+    @staticmethod
+    def grid_size(grid_step, limit):
+        """每个方向上的格点数"""
+        return 2 * (limit // grid_step) + 1
+
+    @staticmethod
+    def estimate_bytes(eyelid_n, grid_step, limit, w=240, h=240):
+        """估算图集文件大小（字节）"""
+        n = FrameAtlas.grid_size(grid_step, limit)
+        return eyelid_n * n * n * 2 * w * h * RGB565_DTYPE.itemsize
+
+    @staticmethod
+    def build_bytes(left_render, eyelid_render, grid_step):
+        """用这组渲染器构建图集时的文件大小（字节），与build的计算一致"""
+        frame_size = left_render.iris_and_sclera_array_list[0].shape[0]
+        return FrameAtlas.estimate_bytes(
+            len(eyelid_render.eyelid_frames), grid_step, frame_size // 4, frame_size // 2, frame_size // 2
+        )
+
+    @classmethod
+    def open(cls, key, root=None):
+        """
+        从缓存打开已有图集，不存在（未构建或已被淘汰）时返回None。
+
+        参数：
+        key: 字符串，由图集格式版本、网格步长、纹理和渲染参数得到的缓存key
+        root: 可选，图集所在的缓存目录，默认为CACHE_DIR
+        """
+        if not check_cache(key, root):
+            return None
+        return read_cache(key, cls, root)
+
+    @classmethod
+    def build(cls, key, left_render, right_render, eyelid_render, grid_step=20, max_bytes=None, keep=None, root=None):
+        """
+        渲染所有量化状态，直接写入缓存的临时目录，写完后原子改名为key。
+
+        参数：
+        key: 字符串，缓存key
+        left_render, right_render: IrisAndScleraRender对象
+        eyelid_render: EyeLidRender对象
+        grid_step: 整数，视线偏移网格步长（虹膜裁剪偏移的像素数）
+        max_bytes: 可选，缓存目录的总大小上限，写入后按最近使用时间淘汰其他缓存
+        keep: 可选，淘汰时保留的key的集合（其他预设正在使用的图集）
+        root: 可选，图集所在的缓存目录，默认为CACHE_DIR
+
+        返回：
+        FrameAtlas对象
+        """
+        start = time.time()
+        frame_size = left_render.iris_and_sclera_array_list[0].shape[0]
+        h = w = frame_size // 2
+        #虹膜裁剪偏移超过画布的四分之一后会被裁剪函数截断，再往外没有意义
+        limit = frame_size // 4
+        k = limit // grid_step
+        n = cls.grid_size(grid_step, limit)
+        pupil_n = len(left_render.iris_and_sclera_array_list)
+        eyelid_n = len(eyelid_render.eyelid_frames)
+
+        tmp = cache_tmpdir(key, root)
+        try:
+            frames = np.lib.format.open_memmap(
+                os.path.join(tmp, "frames.npy"), mode="w+", dtype=RGB565_DTYPE, shape=(eyelid_n, n, n, 2, w * h)
+            )
+            left_compositor = AlphaCompositor((h, w))
+            right_compositor = AlphaCompositor((h, w))
+
+            for e in range(eyelid_n):
+                #取眼睑帧区间的中点，保证映射回同一个下标
+                radius = (e + 0.5) / eyelid_n
+                for iy in range(n):
+                    rel_y = (iy - k) * grid_step / 100
+                    for ix in range(n):
+                        rel_x = (ix - k) * grid_step / 100
+                        state = eye_state(pupil_n, eyelid_n, radius, rel_x, rel_y)
+                        left, right = render_eye_state(
+                            state, left_render, right_render, eyelid_render, left_compositor, right_compositor
+                        )
+                        convert_rgba_to_rgb565(left, out=frames[e, iy, ix, 0])
+                        convert_rgba_to_rgb565(right, out=frames[e, iy, ix, 1])
+            frames.flush()
+            del frames
+        except BaseException:
+            #构建耗时较长，中断时不留下写了一半的临时目录
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        meta = {
+            "grid_step": grid_step,
+            "limit": limit,
+            "eyelid_n": eyelid_n,
+            "build_seconds": round(time.time() - start, 3)
+        }
+        commit_cache(tmp, key, ["frames"], meta, max_bytes, keep, root)
+        return read_cache(key, cls, root)
+
+    def _grid_index(self, rel):
+        offset = min(max(rel * 100, -self.limit), self.limit)
+        return int(round(offset / self.grid_step)) + self.k
+
+    def lookup(self, radius, rel_x, rel_y):
+        """
+        取出最接近给定眼部状态的左右眼RGB565帧。
+
+        参数：
+        radius: 0到1之间的浮点数，眼睑闭合程度
+        rel_x, rel_y: 浮点数，视线偏移
+
+        返回：
+        (左眼帧, 右眼帧) 元组（内存映射的只读数组视图）
+        """
+        e = map_float_to_index(self.eyelid_n, radius)
+        iy = self._grid_index(rel_y)
+        ix = self._grid_index(rel_x)
+        return self.frames[e, iy, ix, 0], self.frames[e, iy, ix, 1]
+
+    def report(self):
+        """图集的规模信息"""
+        n = self.frames.shape[1]
+        return {
+            "grid_step": self.grid_step,
+            "states": self.eyelid_n * n * n,
+            "bytes": self.frames.nbytes,
+            "build_seconds": self.meta.get("build_seconds")
+        }
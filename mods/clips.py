@@ -0,0 +1,273 @@
+import bisect
+import threading
+import time
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from .hardware.ST7789 import RGB565_DTYPE, convert_rgba_to_rgb565
+from .systems import cache_key, calculate_md5, check_cache, make_cache, read_cache
+
+#GIF未写帧时长时使用的默认值（毫秒）
+DEFAULT_FRAME_MS = 100
+
+EYES = ("left", "right")
+
+
+class AnimationClip:
+    def __init__(self, frames, durations):
+        """
+        预先转换好的动画片段，播放时只需要把帧交给屏幕。
+
+        参数：
+        frames: numpy数组，N x (w*h)，大端RGB565
+        durations: numpy数组，每一帧的显示时长（毫秒）
+        """
+        self.frames = frames
+        self.durations = np.asarray(durations, dtype=np.float64)
+        #每一帧的开始时刻（毫秒），按时间查帧时使用
+        self.starts = np.concatenate(([0.0], np.cumsum(self.durations)[:-1]))
+        self.length = float(self.durations.sum())
+
+    @classmethod
+    def decode(cls, path, size=(240, 240)):
+        """
+        解码GIF/APNG等动画文件，每一帧只转换一次。
+
+        参数：
+        path: 字符串，动画文件路径
+        size: (宽, 高) 元组，屏幕尺寸，帧尺寸不同时缩放
+
+        返回：
+        AnimationClip对象
+        """
+        image = Image.open(path)
+        frames = np.empty((getattr(image, "n_frames", 1), size[0] * size[1]), dtype=RGB565_DTYPE)
+        durations = []
+        for i, frame in enumerate(ImageSequence.Iterator(image)):
+            rgba = frame.convert("RGBA")
+            if rgba.size != size:
+                rgba = rgba.resize(size)
+            convert_rgba_to_rgb565(np.array(rgba), out=frames[i])
+            durations.append(frame.info.get("duration") or DEFAULT_FRAME_MS)
+        return cls(frames, durations)
+
+    @classmethod
+    def load(cls, path, size=(240, 240), max_bytes=None):
+        """
+        从缓存内存映射打开动画，缓存中没有时解码并写入缓存。
+
+        参数：
+        path: 字符串，动画文件路径
+        size: (宽, 高) 元组，屏幕尺寸
+        max_bytes: 可选，缓存目录大小上限
+
+        返回：
+        AnimationClip对象
+        """
+        key = cache_key("AnimationClip", calculate_md5(path), tuple(size))
+        if not check_cache(key):
+            make_cache(cls.decode(path, size), key, max_bytes)
+        return read_cache(key, cls)
+
+    def to_cache(self):
+        """导出帧和帧时长，用于写入缓存"""
+        return {"frames": self.frames, "durations": self.durations}, {}
+
+    @classmethod
+    def from_cache(cls, arrays, meta):
+        """从缓存数组恢复"""
+        return cls(arrays["frames"], arrays["durations"])
+
+    def index_at(self, elapsed_ms):
+        """
+        按已经播放的时间取帧下标。
+
+        参数：
+        elapsed_ms: 浮点数，从开始播放起经过的时间（毫秒），超过片段长度时按循环处理
+
+        返回：
+        帧下标
+        """
+        if self.length > 0:
+            elapsed_ms %= self.length
+        return bisect.bisect_right(self.starts, elapsed_ms) - 1
+
+    def play(self, show, stop=None, loop=True, speed=1.0):
+        """
+        在当前线程中按帧时长播放，直接调用show显示。
+
+        每一帧的显示时刻都由开始时间和累计帧时长算出，睡眠误差不会累积；
+        落后时跳过已经过时的帧。
+
+        参数：
+        show: 可调用对象，show(frame) 显示一帧
+        stop: 可选，可调用对象，返回True时停止播放
+        loop: 布尔值，是否循环播放
+        speed: 浮点数，播放速度倍率
+        """
+        start = time.monotonic()
+        shown = -1
+        while True:
+            #先检查停止条件，停止后不再覆盖屏幕上的内容
+            if stop is not None and stop():
+                return
+            elapsed = (time.monotonic() - start) * 1000 * speed
+            if not loop and elapsed >= self.length:
+                return
+            index = self.index_at(elapsed)
+            cycle = int(elapsed // self.length) if self.length > 0 else 0
+            if (cycle, index) != shown:
+                show(self.frames[index])
+                shown = (cycle, index)
+            #睡到下一帧的开始时刻
+            next_ms = cycle * self.length + (self.starts[index + 1] if index + 1 < len(self.starts) else self.length)
+            time.sleep(max(next_ms - elapsed, 0) / 1000 / speed)
+
+
+class _Playback:
+    def __init__(self, name, clip, start, loop, speed):
+        self.name = name
+        self.clip = clip
+        self.start = start
+        self.loop = loop
+        self.speed = speed
+
+    def elapsed_ms(self, now):
+        return (now - self.start) * 1000 * self.speed
+
+    def finished(self, now):
+        return not self.loop and self.elapsed_ms(now) >= self.clip.length
+
+    def index(self, now):
+        elapsed = self.elapsed_ms(now)
+        if not self.loop:
+            elapsed = min(elapsed, self.clip.length - 1e-6)
+        return self.clip.index_at(elapsed)
+
+    def next_change(self, now):
+        """下一帧开始的时刻（time.monotonic）"""
+        clip = self.clip
+        elapsed = self.elapsed_ms(now)
+        cycle, offset = divmod(elapsed, clip.length) if clip.length > 0 else (0, 0)
+        index = bisect.bisect_right(clip.starts, offset) - 1
+        end = clip.starts[index + 1] if index + 1 < len(clip.starts) else clip.length
+        return self.start + (cycle * clip.length + end) / 1000 / self.speed
+
+
+class ClipPlayer:
+    def __init__(self, clips=None):
+        """
+        左右眼各自的动画播放状态。播放中的眼睛用动画帧替换渲染出的眼睛帧，
+        另一只眼照常渲染；动画帧按开始时间和帧时长选取，与渲染频率无关。
+
+        参数：
+        clips: 字典，名称到AnimationClip的映射
+        """
+        self.clips = dict(clips or {})
+        self.started = 0
+        self._playing = {}
+        self._base = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def play(self, name, eye="both", loop=False, speed=1.0):
+        """
+        开始播放一个动画。
+
+        参数：
+        name: 字符串，动画名
+        eye: 字符串，"left"、"right"或"both"
+        loop: 布尔值，是否循环播放，循环的动画需要用stop停止
+        speed: 浮点数，播放速度倍率
+        """
+        clip = self.clips[name]
+        playback = _Playback(name, clip, time.monotonic(), loop, speed)
+        with self._lock:
+            for side in self._eyes(eye):
+                self._playing[side] = playback
+            self.started += 1
+
+    def stop(self, eye="both"):
+        """停止播放，眼睛恢复为渲染帧"""
+        with self._lock:
+            for side in self._eyes(eye):
+                self._playing.pop(side, None)
+
+    @staticmethod
+    def _eyes(eye):
+        if eye == "both":
+            return EYES
+        if eye not in EYES:
+            raise ValueError(f"unknown eye: {eye}")
+        return (eye,)
+
+    @property
+    def active(self):
+        """是否有动画正在播放"""
+        with self._lock:
+            return bool(self._playing)
+
+    def next_change(self, now=None):
+        """
+        正在播放的动画中最早的换帧时刻。
+
+        返回：
+        time.monotonic时刻，没有动画在播放时返回None
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            playing = list(self._playing.values())
+        if not playing:
+            return None
+        return min(playback.next_change(now) for playback in playing)
+
+    def overlay(self, frames=None, now=None, only_changed=False):
+        """
+        用动画帧替换正在播放动画的眼睛。
+
+        参数：
+        frames: 可选，渲染出的 (左眼帧, 右眼帧)，为None时使用上一次渲染的帧
+        now: 可选，当前时间（time.monotonic）
+        only_changed: 布尔值，为True时画面与上一次返回的相同则返回None
+
+        返回：
+        (左眼帧, 右眼帧) 元组，还没有任何可显示的帧时返回None
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if frames is not None:
+                self._base = frames
+            for side, playback in list(self._playing.items()):
+                if playback.finished(now):
+                    del self._playing[side]
+
+            base = self._base
+            sources = []
+            for i, side in enumerate(EYES):
+                playback = self._playing.get(side)
+                if playback is None and base is None and self._playing:
+                    #还没有渲染过眼睛时，另一只眼也显示动画
+                    playback = next(iter(self._playing.values()))
+                if playback is not None:
+                    index = playback.index(now)
+                    sources.append((playback.clip.frames[index], (id(playback), index)))
+                elif base is not None:
+                    sources.append((base[i], id(base)))
+                else:
+                    return None
+
+            signature = tuple(sig for _, sig in sources)
+            if only_changed and signature == self._signature:
+                return None
+            self._signature = signature
+            return tuple(frame for frame, _ in sources)
+
+    def stats(self):
+        """已加载和正在播放的动画"""
+        with self._lock:
+            return {
+                "clips": len(self.clips),
+                "started": self.started,
+                "playing": {side: playback.name for side, playback in self._playing.items()}
+            }
@@ -1,56 +1,118 @@
-import board
-import digitalio
-from collections import deque
-from periphery import SPI
+import os
 from .hardware.ST7789 import ST7789
-from .hardware.PCA9685 import PCA9685
+from .hardware.backends import make_backend
+from .Render import AlphaCompositor
+from .framecache import FrameCache
+from .framequeue import FrameQueue
+from .mailbox import RenderMailbox
+from .scheduler import GazeTrack
+from .servo import ServoPlanner
+from .clips import ClipPlayer
+from .pwmscheduler import PWMScheduler
+from .pwmspace import PWMChannelSpace
 
 #配置部分，定义各种硬件接口和资源文件
+#硬件后端: "real" 真实的SPI/I2C/GPIO; "sim" 模拟总线，不需要任何设备，用于性能分析和压力测试
+#可以用环境变量EYES_BACKEND覆盖，例: EYES_BACKEND=sim python main.py
+#导入本文件不会访问硬件，设备在init_hardware()或第一次使用时才打开
+HARDWARE_BACKEND = os.environ.get("EYES_BACKEND", "real")
+SIM_CONF = {
+    "spi_overhead": 20e-6,                    #每次SPI传输的固定开销（秒）
+    "i2c_speed": 400000,                      #I2C总线速率
+    "i2c_overhead": 50e-6,                    #每次I2C传输的固定开销（秒）
+    "realtime": True,                         #按估算的总线耗时睡眠，吞吐量与真实硬件接近
+    "dump_dir": None,                         #屏幕帧保存目录，例: "./cache/frames"，为None时不保存
+    "dump_every": 30                          #每隔几帧保存一帧
+}
+HW = make_backend(HARDWARE_BACKEND, **SIM_CONF)
+
 #I2C总线定义
 I2C_BUS = "/dev/i2c-5"
 #SPI总线定义
 SPI_SPEED = 80000000                         #使用60MHZ的通信速率，实测比较稳定的最大速度
-EYE_BL = board.GPIO11                        #两个眼睛共用同一个背光控制接口，可用pwm控制亮度，默认由屏幕控制器加载为最大亮度
+EYE_BL_PIN = "GPIO11"                        #两个眼睛共用同一个背光控制接口，可用pwm控制亮度，默认由屏幕控制器加载为最大亮度
 
 #左眼接口定义
 LEFT_EYE_TREE = "/dev/spidev3.0"             #系统spi设备树
-LEFT_EYE_RES_PIN = board.GPIO13              #RES/RST数据位
-LEFT_EYE_DC_PIN = board.GPIO15               #DC控制引脚
+LEFT_EYE_RES_PIN = "GPIO13"                  #RES/RST数据位
+LEFT_EYE_DC_PIN = "GPIO15"                   #DC控制引脚
 LEFT_EYE_EXCURISON = (5,5)                   #玻璃透镜贴的歪的程度，一个偏移矫正量
 
 #右眼接口定义
 RIGHT_EYE_TREE = "/dev/spidev3.1"            #系统spi设备数
-RIGHT_EYE_RES_PIN = board.GPIO16             #RES/RST数据位
-RIGHT_EYE_DC_PIN = board.GPIO18              #DC控制引脚
+RIGHT_EYE_RES_PIN = "GPIO16"                 #RES/RST数据位
+RIGHT_EYE_DC_PIN = "GPIO18"                  #DC控制引脚
 RIGHT_EYE_EXCURISON = (5,5)                  #玻璃透镜贴的歪的程度，一个偏移矫正量
 
-#初始化各个眼睛的spi总线（一个总线，两个片选设备)
-SPI_LEFT = SPI(LEFT_EYE_TREE, 0, SPI_SPEED)
-SPI_RIGHT = SPI(RIGHT_EYE_TREE, 0, SPI_SPEED)
-
-#各个眼睛控制器开始实例化
+#各个眼睛的spi总线（一个总线，两个片选设备)和控制器
+LEFT_EYE_DC = HW.pin(LEFT_EYE_DC_PIN)
+RIGHT_EYE_DC = HW.pin(RIGHT_EYE_DC_PIN)
+SPI_LEFT = HW.spi(LEFT_EYE_TREE, SPI_SPEED, dc=LEFT_EYE_DC, name="left")
+SPI_RIGHT = HW.spi(RIGHT_EYE_TREE, SPI_SPEED, dc=RIGHT_EYE_DC, name="right")
 LEFT_SCREEN = ST7789(
-                rst_pin=LEFT_EYE_RES_PIN,
-                dc_pin=LEFT_EYE_DC_PIN,
+                rst_pin=HW.pin(LEFT_EYE_RES_PIN),
+                dc_pin=LEFT_EYE_DC,
                 bus=SPI_LEFT
             )
 RIGHT_SCREEN = ST7789(
-                rst_pin=RIGHT_EYE_RES_PIN,
-                dc_pin=RIGHT_EYE_DC_PIN,
+                rst_pin=HW.pin(RIGHT_EYE_RES_PIN),
+                dc_pin=RIGHT_EYE_DC,
                 bus=SPI_RIGHT
             )
-LEFT_SCREEN.lcd_init()                        #初始化LCD
-LEFT_SCREEN.clear()
-RIGHT_SCREEN.lcd_init()                       #初始化LCD
-RIGHT_SCREEN.clear()
-
-PWM = PCA9685(i2c_dev=I2C_BUS)
-PWM.set_pwm_freq(1000)  # 通常舵机使用50-60Hz的PWM信号
 
 #背光控制
-EYE_BL = digitalio.DigitalInOut(EYE_BL)
-EYE_BL.direction = digitalio.Direction.OUTPUT
-EYE_BL.value = True                           #打开背光
+EYE_BL = HW.pin(EYE_BL_PIN)
+
+#PWM控制板，全局通道号按顺序连续编号（第一块板0-15，第二块16-31……），每条I2C总线一个写入线程
+#例: [{"bus": "/dev/i2c-5", "address": 0x40}, {"bus": "/dev/i2c-5", "address": 0x41}, {"bus": "/dev/i2c-6", "address": 0x40}]
+#舵机板需要单独的频率: {"bus": "/dev/i2c-5", "address": 0x41, "freq": 50}
+PWM_BOARDS = [
+    {"bus": I2C_BUS, "address": 0x40}
+]
+PWM_FREQ = 1000                               # 通常舵机使用50-60Hz的PWM信号
+PWM = PWMChannelSpace(PWM_BOARDS, open_bus=HW.i2c)
+
+
+def init_hardware():
+    """初始化屏幕、PWM控制板并打开背光，程序启动时调用一次"""
+    LEFT_SCREEN.lcd_init()                    #初始化LCD
+    LEFT_SCREEN.clear()
+    RIGHT_SCREEN.lcd_init()                   #初始化LCD
+    RIGHT_SCREEN.clear()
+    PWM.begin()
+    PWM.set_pwm_freq(PWM_FREQ)
+    EYE_BL.value = True                       #打开背光
+
+
+#所有通道的波形由一个调度线程按固定tick推进，每个tick一次批量写入
+PWM_TICK_HZ = 100                             #tick频率，呼吸灯的step1/step2为每个tick的步进量
+PWM_SCHEDULER = PWMScheduler(PWM, PWM_TICK_HZ)
+#命名的灯光曲线，关键帧为 [时间(秒), 感知亮度(0-1), 缓动函数名]，启动时不计算，第一次使用时生成查找表
+#通过controler/pwm主题设置，一条消息可以设置多组通道，例:
+#{"type": "curve", "data": [{"channels": [0, 1, 2], "curve": "breath", "phase": 0.3},
+#                           {"channels": [3], "keyframes": [[0, 0], [0.5, 1, "ease_out"], [2, 0]], "loop": false}]}
+PWM_CURVES = {
+    "breath": {
+        "keyframes": [[0, 0, "sine"], [1.5, 1, "sine"], [3, 0]],
+        "gamma": 2.2,
+        "loop": True
+    },
+    "heartbeat": {
+        "keyframes": [[0, 0, "ease_out"], [0.1, 1, "ease_in"], [0.25, 0.2, "ease_out"], [0.35, 0.8, "ease_in"], [0.6, 0], [1.2, 0]],
+        "gamma": 2.2,
+        "loop": True
+    },
+    "fade_in": {
+        "keyframes": [[0, 0, "ease_in_out"], [1, 1]],
+        "gamma": 2.2,
+        "loop": False
+    },
+    "fade_out": {
+        "keyframes": [[0, 1, "ease_in_out"], [1, 0]],
+        "gamma": 2.2,
+        "loop": False
+    }
+}
 
 #资源和渲染器
 #定义个个纹理数据的路径
@@ -61,12 +123,17 @@ RIGHT_SCLERA_IMG = "assest/eyes/sclera.png"   #右眼巩膜纹理
 LOADING_GIF = "assest/loading_Render.gif"
 LOADING_JOKE = "assest/loading_Render_joke.png"
 PRELOADING_JOKE = "assest/preloading_Render_success.png"
-#渲染器
-LEFT_IRIS_AND_SCLERA_RENDER = None            #左眼主渲染器
-RIGHT_IRIS_AND_SCLERA_RENDER = None           #右眼主渲染器
-EYELID_RENDER = None
+#渲染器，init中创建PresetManager，当前使用的一套渲染器为RENDER_PRESETS.active
+RENDER_PRESETS = None
+#预渲染进程数，None为全部CPU核，1为在主进程中顺序渲染
+PRERENDER_WORKERS = None
+#预渲染缓存总大小上限，超出后按最近使用时间淘汰
+CACHE_MAX_BYTES = 256 * 1024 * 1024
 #渲染器参数
 IAS_FRAME_SIZE = 480                          #眼部画布大小，一般为方/圆屏幕边分辨率的两倍
+#合成器，预分配合成缓冲区，左右眼各持有一个
+LEFT_COMPOSITOR = AlphaCompositor((IAS_FRAME_SIZE // 2, IAS_FRAME_SIZE // 2))
+RIGHT_COMPOSITOR = AlphaCompositor((IAS_FRAME_SIZE // 2, IAS_FRAME_SIZE // 2))
 #渲染器具体参数，具体参数功能见IrisAndScleraRender和EyeLidRender的说明
 LEFT_IASR_CONF = {
     "sclera_inner": (70,72),
@@ -91,8 +158,54 @@ EYELID_RENDER_CONF = {
     "axes_upper": (110, 80),
     "axes_lower": (110, 1),
     "angle": 15,
-    "sharpness": 6
+    "sharpness": 6,
+    "dtype": "float32",         #椭圆计算精度，float32与float64生成的帧一致
+    "on_demand": False,         #为True时不预渲染眼睑帧，用到时再渲染并缓存，可以把flash_n设得更大
+    "memo_size": 64             #on_demand模式下缓存的眼睑帧数
+}
+
+#纹理预设，可以通过controler/eye/preset主题在运行时切换，例: {"name": "white"}
+#没有写的项使用默认预设的值；preload为True的预设在启动时加载，其余在第一次切换时于后台加载
+TEXTURE_PRESETS = {
+    "default": {
+        "left_iris": LEFT_IRIS_IMG,
+        "left_sclera": LEFT_SCLERA_IMG,
+        "right_iris": RIGHT_IRIS_IMG,
+        "right_sclera": RIGHT_SCLERA_IMG,
+        "left_conf": LEFT_IASR_CONF,
+        "right_conf": RIGHT_IASR_CONF,
+        "eyelid_conf": EYELID_RENDER_CONF,
+        "preload": True
+    },
+    "white": {
+        "left_sclera": "assest/eyes/sclera-w.png",
+        "right_sclera": "assest/eyes/sclera-w.png",
+        "preload": False
+    }
 }
+DEFAULT_PRESET = "default"
+PRESET_MAX_BYTES = 512 * 1024 * 1024          #已加载预设的内存上限，超出后卸载最久未使用的预设
+
+#热重载：本文件中的TEXTURE_PRESETS（及其引用的参数）或纹理文件修改后，后台重建渲染器并无缝替换
+#也可以向controler/eye/reload主题发送任意消息触发
+HOT_RELOAD = True
+HOT_RELOAD_INTERVAL = 1.0                     #检查文件修改时间的间隔（秒）
+CONFIG_PATH = __file__
+HOT_RELOADER = None
+
+#最终显示帧的LRU缓存，视线停留或缓慢移动时重复的状态不再重新合成和转换
+FRAME_CACHE_BYTES = 32 * 1024 * 1024          #缓存内存上限，每组左右眼帧约225KB，设为0关闭
+FRAME_CACHE = FrameCache(FRAME_CACHE_BYTES) if FRAME_CACHE_BYTES > 0 else None
+
+#预渲染图集模式（可选）：启动时把所有量化后的眼部状态渲染为RGB565，存入内存映射文件
+#运行时每条消息只需查表和SPI发送，代价是较大的磁盘占用和首次构建时间
+ATLAS_MODE = False
+#每个纹理预设一个图集，默认画布下步长20约594MiB，40约172MiB（7x7格点，视线移动时有明显跳变）
+ATLAS_GRID_STEP = 20                          #视线偏移网格步长（虹膜偏移像素），越小越精细，文件越大
+#图集放在单独的缓存目录，不计入CACHE_MAX_BYTES；上限按预设数计算，每个预设的图集都能同时保留
+#新图集与其他预设正在使用的图集放不下时不构建（记录警告，改为实时渲染），不会淘汰正在使用的图集
+ATLAS_CACHE_DIR = "./cache/atlas"
+ATLAS_MAX_BYTES = len(TEXTURE_PRESETS) * 640 * 1024 * 1024
 
 MQTT_CONF = {
     "host": "127.0.0.1",
@@ -102,5 +215,47 @@ MQTT_CONF = {
 INIT_STATUES = False
 
 
-LEFT_FRAME_BUFFER = deque(maxlen=10)
-RIGHT_FRAME_BUFFER = deque(maxlen=10)
\ No newline at end of file
+#自定义屏幕图片的缓存，按消息内容的哈希索引，重复推送的图片不再解码和转换
+CUSTOM_SCREEN_CACHE_BYTES = 4 * 1024 * 1024
+CUSTOM_SCREEN_CACHE = FrameCache(CUSTOM_SCREEN_CACHE_BYTES) if CUSTOM_SCREEN_CACHE_BYTES > 0 else None
+
+#左右眼成对的显示帧队列
+#策略: "latest" 只显示最新帧, "fifo" 满时渲染等待, "drop_oldest" 满时丢弃最旧帧
+FRAME_QUEUE_POLICY = "drop_oldest"
+FRAME_QUEUE_SIZE = 10
+FRAME_QUEUE = FrameQueue(FRAME_QUEUE_SIZE, FRAME_QUEUE_POLICY)
+
+#MQTT消息到渲染线程的信箱，未渲染的眼部状态被新状态覆盖
+RENDER_MAILBOX = RenderMailbox()
+RENDER_QUEUE_DEPTH = 1          #显示队列中排队的帧少于这个数时才渲染下一帧
+
+#固定帧率渲染，两次视线消息之间插值，输入中断时短时外推；设为0时每收到一条消息渲染一帧
+FRAME_RATE = 30
+GAZE_DELAY = 0.05               #插值延迟（秒），约为追踪器的发布间隔
+GAZE_HORIZON = 0.05             #输入中断时最长外推时间（秒）
+GAZE_TRACK = GazeTrack(GAZE_DELAY, GAZE_HORIZON)
+
+#机械眼舵机，跟随controler/eye的视线，与屏幕从同一条插值曲线取样，在PWM调度器的每个tick与灯光一起批量写入
+#为None时关闭。每个通道: 使用的眼部参数、参数范围、对应的PWM计数、速度和加速度上限（全行程/秒、全行程/秒²）
+#例: {"delay": 0.03, "channels": {
+#        16: {"input": "rel_x", "range": (-1, 1), "pwm": (205, 410), "max_velocity": 2.0, "max_acceleration": 20.0},
+#        17: {"input": "rel_y", "range": (-1, 1), "pwm": (230, 380), "invert": True},
+#        18: {"input": "eyelid_percentage", "range": (0, 1), "pwm": (220, 330), "max_velocity": 6.0, "max_acceleration": 80.0}}}
+SERVO_CONF = None
+SERVO_PLANNER = ServoPlanner.from_conf(GAZE_TRACK, SERVO_CONF) if SERVO_CONF is not None else None
+if SERVO_PLANNER is not None:
+    PWM_SCHEDULER.add_source(SERVO_PLANNER)
+
+#视频流输入（图传），为None时关闭；视频流有画面时暂停眼睛渲染，停止后自动恢复
+#例: {"source": "pipe", "path": "/tmp/eyes.mjpeg", "format": "mjpeg", "layout": "split", "workers": 2}
+#    {"source": "file", "path": "./video/test.mjpeg", "format": "mjpeg", "fps": 30, "loop": True}
+#    {"source": "shm", "path": "eyes_video", "format": "rgb24", "width": 640, "height": 480}
+VIDEO_STREAM_CONF = None
+VIDEO_STREAM = None
+
+#动画片段，启动时转换为RGB565并缓存，通过controler/eye/clip主题按名称播放
+#例: {"name": "loading", "eye": "left", "loop": false, "speed": 1.0} / {"eye": "both", "stop": true}
+CLIP_FILES = {
+    "loading": LOADING_GIF
+}
+CLIP_PLAYER = ClipPlayer()
\ No newline at end of file
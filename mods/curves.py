@@ -0,0 +1,133 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+#缓动函数，输入输出都在0-1之间
+EASINGS = {
+    "linear": lambda x: x,
+    "step": lambda x: np.floor(x),
+    "ease_in": lambda x: x * x,
+    "ease_out": lambda x: 1 - (1 - x) * (1 - x),
+    "ease_in_out": lambda x: x * x * (3 - 2 * x),
+    "sine": lambda x: (1 - np.cos(x * math.pi)) / 2,
+    "cubic_in": lambda x: x * x * x,
+    "cubic_out": lambda x: 1 - (1 - x) ** 3
+}
+
+PWM_MAX = 4095
+
+
+def build_lut(keyframes, tick_hz, gamma=2.2, PWMrange=(0, PWM_MAX)):
+    """
+    把关键帧曲线按tick采样成查找表。
+
+    关键帧的值是0-1之间的感知亮度，经过gamma校正后映射到PWM计数，
+    低亮度段的步进更细，高亮度段相邻采样相同的值更多（写入时被影子寄存器跳过）。
+    每一段使用起点关键帧的缓动函数。
+
+    参数：
+    keyframes: 列表，[(时间(秒), 亮度(0-1), 缓动函数名), ...]，时间递增，缓动函数名可省略（linear）
+    tick_hz: 浮点数，采样频率，与调度器的tick频率相同
+    gamma: 浮点数，gamma校正指数，1为线性
+    PWMrange: 元组，亮度0和1对应的PWM计数
+
+    返回：
+    uint16数组，第i项为第i个tick的PWM计数
+    """
+    if len(keyframes) == 0:
+        raise ValueError("curve needs at least one keyframe")
+    times = [float(kf[0]) for kf in keyframes]
+    if any(b < a for a, b in zip(times, times[1:])):
+        raise ValueError("keyframe times must be increasing")
+
+    n = int(round((times[-1] - times[0]) * tick_hz)) + 1
+    t = times[0] + np.arange(n) / tick_hz
+    level = np.full(n, float(keyframes[-1][1]))
+    for (t0, v0, *ease), (t1, v1, *_) in zip(keyframes, keyframes[1:]):
+        t0, t1 = float(t0), float(t1)
+        if t1 <= t0:
+            continue
+        easing = EASINGS[ease[0] if ease else "linear"]
+        mask = (t >= t0) & (t < t1)
+        x = (t[mask] - t0) / (t1 - t0)
+        level[mask] = v0 + (v1 - v0) * easing(x)
+
+    low, high = PWMrange
+    counts = low + (high - low) * np.clip(level, 0.0, 1.0) ** gamma
+    return np.rint(counts).astype(np.uint16)
+
+
+@lru_cache(maxsize=64)
+def _cached_lut(keyframes, tick_hz, gamma, PWMrange):
+    lut = build_lut(keyframes, tick_hz, gamma, PWMrange)
+    lut.flags.writeable = False
+    return lut
+
+
+def curve_lut(keyframes, tick_hz, gamma=2.2, PWMrange=(0, PWM_MAX)):
+    """同build_lut，相同的曲线只计算一次，多个通道共用同一个只读查找表"""
+    keyframes = tuple(tuple(kf) for kf in keyframes)
+    return _cached_lut(keyframes, float(tick_hz), float(gamma), tuple(PWMrange))
+
+
+class CurveWave:
+    static = False
+
+    def __init__(self, lut, tick_hz, loop=True, phase=0.0):
+        """
+        按查找表播放的波形，每个tick只做一次取表，不做浮点计算。
+
+        参数：
+        lut: uint16数组，curve_lut的返回值
+        tick_hz: 浮点数，查找表的采样频率
+        loop: 布尔值，是否循环；不循环时播放完停在最后一个值
+        phase: 浮点数，起始相位（秒），多个通道使用同一曲线时错开播放
+        """
+        self.lut = lut
+        self.tick_hz = tick_hz
+        self.loop = loop
+        self.offset = int(round(phase * tick_hz))
+        #不循环的曲线播放完后由调度器换成固定值
+        self.end = None if loop else max(len(lut) - 1 - self.offset, 0) / tick_hz
+
+    def value_at(self, t):
+        i = int(t * self.tick_hz) + self.offset
+        if self.loop:
+            return int(self.lut[i % len(self.lut)])
+        return int(self.lut[min(i, len(self.lut) - 1)])
+
+
+def parse_effects(data, curves, tick_hz):
+    """
+    解析一条MQTT消息中的曲线效果。
+
+    参数：
+    data: 字典或字典列表，每项为：
+          {"channels": [0, 1, 2], "curve": "heartbeat"} 使用配置中的命名曲线，或
+          {"channels": [3], "keyframes": [[0, 0, "sine"], [1.5, 1, "sine"], [3, 0]],
+           "loop": true, "gamma": 2.2, "range": [0, 4095], "phase": 0.25}
+          phase为相邻通道之间的相位差（秒），命名曲线中的参数可以在消息中覆盖
+    curves: 字典，曲线名到曲线参数的映射
+    tick_hz: 浮点数，调度器的tick频率
+
+    返回：
+    字典，通道号到CurveWave对象的映射
+    """
+    if isinstance(data, dict):
+        data = [data]
+    waves = {}
+    for effect in data:
+        if "curve" in effect:
+            effect = {**curves[effect["curve"]], **effect}
+        lut = curve_lut(
+            effect["keyframes"],
+            tick_hz,
+            effect.get("gamma", 2.2),
+            effect.get("range", (0, PWM_MAX))
+        )
+        loop = bool(effect.get("loop", True))
+        phase = float(effect.get("phase", 0.0))
+        for i, channel in enumerate(effect["channels"]):
+            waves[int(channel)] = CurveWave(lut, tick_hz, loop, phase * i)
+    return waves
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+
+class FrameCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        """
+        最终显示帧的LRU缓存，按eye_state得到的整数状态索引。
+
+        缓存的值是 (左眼帧, 右眼帧) 两块已转换好的RGB565缓冲区，
+        取出的缓冲区会被直接放进显示队列，调用方不能修改它们。
+        只在渲染线程中使用，没有加锁。
+
+        参数：
+        max_bytes: 整数，缓存占用内存的上限（字节）
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+
+    def get(self, key):
+        """
+        取出缓存的帧，未命中时返回None。
+
+        参数：
+        key: eye_state返回的元组
+
+        返回：
+        (左眼帧, 右眼帧) 元组或None
+        """
+        frames = self._frames.get(key)
+        if frames is None:
+            self.misses += 1
+            return None
+        self._frames.move_to_end(key)
+        self.hits += 1
+        return frames
+
+    def put(self, key, frames):
+        """
+        写入一组帧，超出内存上限时淘汰最久未使用的项。
+
+        参数：
+        key: eye_state返回的元组
+        frames: (左眼帧, 右眼帧) 元组（numpy数组）
+        """
+        size = sum(f.nbytes for f in frames)
+        if size > self.max_bytes:
+            return
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self.bytes -= sum(f.nbytes for f in old)
+        self._frames[key] = frames
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self.bytes -= sum(f.nbytes for f in evicted)
+            self.evictions += 1
+
+    def stats(self):
+        """命中、未命中、淘汰次数与当前占用"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._frames),
+            "bytes": self.bytes
+        }
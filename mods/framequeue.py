@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+
+#队列满时的策略
+LATEST = "latest"                #只保留最新的一组帧，新帧到达时丢弃所有未显示的帧
+FIFO = "fifo"                    #有界先进先出，队列满时生产者阻塞等待
+DROP_OLDEST = "drop_oldest"      #有界先进先出，队列满时丢弃最旧的一组帧
+
+POLICIES = (LATEST, FIFO, DROP_OLDEST)
+
+
+class FrameQueue:
+    def __init__(self, maxlen=10, policy=DROP_OLDEST):
+        """
+        左右眼成对的显示帧队列，左右眼的帧总是一起入队、一起出队、一起丢弃，
+        两块屏幕不会因为单独丢帧而不同步。
+
+        消费者在队列为空时阻塞在条件变量上，不会空转占用CPU。
+
+        参数：
+        maxlen: 整数，队列最多容纳的帧对数（LATEST策略下固定为1）
+        policy: 字符串，队列满时的策略，见POLICIES
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"unknown frame queue policy: {policy}")
+        if maxlen < 1:
+            raise ValueError("maxlen must be at least 1")
+        self.policy = policy
+        self.maxlen = 1 if policy == LATEST else maxlen
+        self.enqueued = 0
+        self.dropped = 0
+        self.displayed = 0
+        self.max_depth = 0
+        self.latency_n = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.closed = False
+        self._showing_stamp = None
+        self._pairs = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, left, right, repeat=1, timeout=None, stamp=None):
+        """
+        放入一组左右眼帧。
+
+        参数：
+        left, right: 左右眼的RGB565帧
+        repeat: 整数，这组帧连续显示的次数，只占一个队列位置
+        timeout: FIFO策略下队列满时最多等待的秒数，None为一直等待，超时则丢弃这组帧
+        stamp: 可选，产生这组帧的消息到达时间（time.monotonic），用于统计端到端延迟
+
+        返回：
+        布尔值，这组帧是否进入了队列
+        """
+        with self._lock:
+            if self.closed:
+                return False
+            if self.policy == FIFO:
+                if not self._not_full.wait_for(lambda: len(self._pairs) < self.maxlen or self.closed, timeout):
+                    self.dropped += repeat
+                    return False
+                if self.closed:
+                    return False
+            else:
+                while len(self._pairs) >= self.maxlen:
+                    self.dropped += self._pairs.popleft()[2]
+
+            self._pairs.append([left, right, repeat, stamp])
+            self.enqueued += repeat
+            self.max_depth = max(self.max_depth, len(self._pairs))
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        取出下一组左右眼帧，队列为空时阻塞。
+
+        参数：
+        timeout: 最多等待的秒数，None为一直等待
+
+        返回：
+        (左眼帧, 右眼帧) 元组，超时或队列已关闭时返回None
+        """
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._pairs or self.closed, timeout):
+                return None
+            if not self._pairs:
+                return None
+            pair = self._pairs[0]
+            pair[2] -= 1
+            if pair[2] <= 0:
+                self._pairs.popleft()
+                self._not_full.notify_all()
+            #重复显示的帧只统计第一次的延迟
+            self._showing_stamp = pair[3]
+            pair[3] = None
+            return pair[0], pair[1]
+
+    def wait_room(self, depth=1, timeout=None):
+        """
+        等待队列中的帧对数少于depth，渲染线程用它与屏幕刷新同步，
+        屏幕每取走一组帧才渲染下一组。
+
+        参数：
+        depth: 整数，允许排队的帧对数
+        timeout: 最多等待的秒数，None为一直等待
+
+        返回：
+        布尔值，等待成功为True，超时或队列关闭为False
+        """
+        with self._lock:
+            return self._not_full.wait_for(lambda: len(self._pairs) < depth or self.closed, timeout) and not self.closed
+
+    def shown(self):
+        """消费者把一组帧送到屏幕后调用，用于统计"""
+        now = time.monotonic()
+        with self._lock:
+            self.displayed += 1
+            if self._showing_stamp is not None:
+                latency = now - self._showing_stamp
+                self.latency_n += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                self._showing_stamp = None
+
+    def clear(self):
+        """丢弃所有未显示的帧"""
+        with self._lock:
+            self.dropped += sum(pair[2] for pair in self._pairs)
+            self._pairs.clear()
+            self._not_full.notify_all()
+
+    def close(self):
+        """关闭队列，唤醒所有等待的生产者和消费者"""
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def __len__(self):
+        with self._lock:
+            return sum(pair[2] for pair in self._pairs)
+
+    def stats(self):
+        """入队、丢弃、已显示的帧数，当前队列深度，以及消息到达到帧送上屏幕的延迟"""
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "shown": self.displayed,
+                "depth": len(self._pairs),
+                "max_depth": self.max_depth,
+                "latency_avg_ms": round(self.latency_total / self.latency_n * 1000, 2) if self.latency_n else None,
+                "latency_max_ms": round(self.latency_max * 1000, 2) if self.latency_n else None
+            }
@@ -1,10 +1,12 @@
-from periphery import I2C
 import time
 import math
 import logging
 
+from .backends import I2CMessage, RealBackend
+
 # Registers/etc:
 PCA9685_ADDRESS    = 0x40
+ALLCALL_ADDRESS    = 0x70    # every PCA9685 on the bus with ALLCALL set answers here
 MODE1              = 0x00
 MODE2              = 0x01
 PRESCALE           = 0xFE
@@ -19,6 +21,7 @@ ALL_LED_OFF_H      = 0xFD
 
 # Bits:
 RESTART            = 0x80
+AI                 = 0x20
 SLEEP              = 0x10
 ALLCALL            = 0x01
 INVRT              = 0x10
@@ -27,29 +30,61 @@ OUTDRV             = 0x04
 logger = logging.getLogger(__name__)
 
 class PCA9685:
-    """PCA9685 PWM LED/servo controller using periphery."""
+    """PCA9685 PWM LED/servo controller."""
+
+    CHANNELS = 16
+    # unchanged channels between two changed runs are rewritten rather than
+    # starting another transaction when the gap is at most this many channels
+    MERGE_GAP = 2
+
+    def __init__(self, address=PCA9685_ADDRESS, i2c_dev="/dev/i2c-1", i2c=None):
+        """Initialize the PCA9685.
+
+        Register auto-increment is enabled so that a channel's ON_L..OFF_H (or
+        a run of consecutive channels) is written in a single I2C message.
+        The last value written to each channel is kept in shadow registers and
+        writes that would not change anything are skipped.
 
-    def __init__(self, address=PCA9685_ADDRESS, i2c_dev="/dev/i2c-1"):
-        """Initialize the PCA9685."""
-        self.i2c = I2C(i2c_dev)
+        i2c may be a bus object from a hardware backend, with a
+        transfer(address, messages) method taking I2CMessage objects;
+        otherwise i2c_dev is opened through the real backend.
+        """
+        self.i2c = i2c if i2c is not None else RealBackend().i2c(i2c_dev)
         self.address = address
-        self.set_all_pwm(0, 0)
+        self.transactions = 0
+        self.bytes_written = 0
+        self.skipped = 0
+        self.invalidate()
+        # MODE1 is 0x11 at power-on, with AI clear: enable auto-increment before
+        # the first multi-byte write, or every byte would land in one register
         self.write_byte(MODE2, OUTDRV)
-        self.write_byte(MODE1, ALLCALL)
+        self.write_byte(MODE1, ALLCALL | AI)
         time.sleep(0.005)  # wait for oscillator
+        self.set_all_pwm(0, 0)
         mode1 = self.read_byte(MODE1)
         mode1 = mode1 & ~SLEEP  # wake up (reset sleep)
         self.write_byte(MODE1, mode1)
         time.sleep(0.005)  # wait for oscillator
 
     def write_byte(self, reg, value):
-        self.i2c.transfer(self.address, [I2C.Message([reg, value])])
+        self.write_block(reg, [value])
+
+    def write_block(self, reg, values):
+        """Write consecutive registers starting at reg in one transaction (needs AI)."""
+        self.i2c.transfer(self.address, [I2CMessage([reg] + list(values))])
+        self.transactions += 1
+        self.bytes_written += 1 + len(values)
 
     def read_byte(self, reg):
-        read = I2C.Message([0], read=True)
-        self.i2c.transfer(self.address, [I2C.Message([reg]), read])
+        read = I2CMessage([0], read=True)
+        self.i2c.transfer(self.address, [I2CMessage([reg]), read])
+        self.transactions += 1
         return read.data[0]
 
+    def invalidate(self):
+        """Forget the shadow registers, e.g. after the chip was reset externally."""
+        self._shadow = [None] * self.CHANNELS
+
     def set_pwm_freq(self, freq_hz):
         """Set the PWM frequency to the provided value in hertz."""
         prescaleval = 25000000.0    # 25MHz
@@ -68,16 +103,83 @@ class PCA9685:
         time.sleep(0.005)
         self.write_byte(MODE1, oldmode | 0x80)
 
+    @staticmethod
+    def _pack(on, off):
+        return [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+
     def set_pwm(self, channel, on, off):
         """Sets a single PWM channel."""
-        self.write_byte(LED0_ON_L+4*channel, on & 0xFF)
-        self.write_byte(LED0_ON_H+4*channel, on >> 8)
-        self.write_byte(LED0_OFF_L+4*channel, off & 0xFF)
-        self.write_byte(LED0_OFF_H+4*channel, off >> 8)
+        if self._shadow[channel] == (on, off):
+            self.skipped += 1
+            return
+        self.write_block(LED0_ON_L+4*channel, self._pack(on, off))
+        self._shadow[channel] = (on, off)
+
+    def set_pwm_range(self, first, values):
+        """Sets consecutive PWM channels starting at first.
+
+        values is a list of (on, off) tuples. Only the span between the first
+        and the last changed channel is sent, as a single transaction.
+        """
+        changed = [i for i, value in enumerate(values) if self._shadow[first + i] != tuple(value)]
+        if not changed:
+            self.skipped += 1
+            return
+        start, end = changed[0], changed[-1] + 1
+        data = []
+        for on, off in values[start:end]:
+            data += self._pack(on, off)
+        self.write_block(LED0_ON_L+4*(first + start), data)
+        for i in range(start, end):
+            self._shadow[first + i] = tuple(values[i])
+
+    def set_pwm_many(self, updates):
+        """Sets several PWM channels given as {channel: (on, off)}.
+
+        Changed channels are grouped into runs, each written in one transaction.
+        Runs separated by a short gap of channels with known shadow values are
+        merged, the gap being rewritten with its current values. When every
+        channel gets the same value the ALL_LED registers are used instead.
+        """
+        channels = sorted(ch for ch, value in updates.items() if self._shadow[ch] != tuple(value))
+        if not channels:
+            self.skipped += 1
+            return
+        values = set(tuple(value) for value in updates.values())
+        if len(updates) == self.CHANNELS and len(values) == 1:
+            self.set_all_pwm(*values.pop())
+            return
+        run = [channels[0]]
+        for ch in channels[1:] + [None]:
+            if ch is not None and ch - run[-1] - 1 <= self.MERGE_GAP and \
+                    all(self._shadow[c] is not None for c in range(run[-1] + 1, ch)):
+                run.extend(range(run[-1] + 1, ch + 1))
+                continue
+            self.set_pwm_range(run[0], [updates.get(c, self._shadow[c]) for c in run])
+            if ch is not None:
+                run = [ch]
 
     def set_all_pwm(self, on, off):
         """Sets all PWM channels."""
-        self.write_byte(ALL_LED_ON_L, on & 0xFF)
-        self.write_byte(ALL_LED_ON_H, on >> 8)
-        self.write_byte(ALL_LED_OFF_L, off & 0xFF)
-        self.write_byte(ALL_LED_OFF_H, off >> 8)
+        if self.all_equal(on, off):
+            self.skipped += 1
+            return
+        self.write_block(ALL_LED_ON_L, self._pack(on, off))
+        self.assume_all_pwm(on, off)
+
+    def all_equal(self, on, off):
+        """True if every channel is known to be set to (on, off)."""
+        return all(value == (on, off) for value in self._shadow)
+
+    def assume_all_pwm(self, on, off):
+        """Update the shadow registers after all channels were set elsewhere,
+        e.g. by a write to ALLCALL_ADDRESS that reached every board on the bus."""
+        self._shadow = [(on, off)] * self.CHANNELS
+
+    def stats(self):
+        """I2C transaction, byte and skipped-write counters."""
+        return {
+            "transactions": self.transactions,
+            "bytes": self.bytes_written,
+            "skipped": self.skipped
+        }
@@ -1,7 +1,11 @@
 import time
 import numpy as np
-import digitalio
-from periphery import SPI
+
+
+#spidev单次传输的默认上限（/sys/module/spidev/parameters/bufsiz）
+SPI_CHUNK = 4096
+#RGB565像素在总线上按大端顺序发送（高字节在前）
+RGB565_DTYPE = np.dtype('>u2')
 
 
 class ST7789():
@@ -9,13 +13,15 @@ class ST7789():
             self,
             rst_pin,
             dc_pin,
-            bus:SPI
+            bus
             ):
-        self.rst = digitalio.DigitalInOut(rst_pin)
-        self.dc = digitalio.DigitalInOut(dc_pin)
-
-        self.rst.direction = digitalio.Direction.OUTPUT
-        self.dc.direction = digitalio.Direction.OUTPUT
+        """
+        参数：
+        rst_pin, dc_pin: 输出引脚对象（有value属性），由硬件后端的pin()创建
+        bus: SPI总线对象（有transfer方法），由硬件后端的spi()创建
+        """
+        self.rst = rst_pin
+        self.dc = dc_pin
         
         self.spi = bus
         
@@ -159,21 +165,39 @@ class ST7789():
         """清屏"""
         self.set_cursor(0, 0, self.w - 1, self.h - 1)
         self.dc.value = True
-        buf = [color >> 8, color & 0xFF] * (self.w * self.h)
-        for i in range(0, len(buf), 4096):
-
-            self.spi.transfer(buf[i:i+4096])
+        self._write_fill(color, self.w * self.h)
 
     def clear_window(self, start_x, start_y, end_x, end_y, color=0xFFFF):
         """清除窗口区域"""
         self.set_cursor(start_x, start_y, end_x, end_y)
         self.dc.value = True
-        buf = [color >> 8, color & 0xFF] * ((end_x - start_x) * (end_y - start_y))
-        for i in range(0, len(buf), 4096):
+        self._write_fill(color, (end_x - start_x) * (end_y - start_y))
+
+    def _write_fill(self, color, count):
+        """以单一颜色填充count个像素，只构造一个分块长度的模板并重复发送"""
+        chunk = bytes((color >> 8, color & 0xFF)) * (SPI_CHUNK // 2)
+        view = memoryview(chunk)
+        remaining = count * 2
+        while remaining > 0:
+            n = min(remaining, SPI_CHUNK)
+            self.spi.transfer(chunk if n == SPI_CHUNK else bytes(view[:n]))
+            remaining -= n
+
+    def _write_buffer(self, pixel):
+        """按SPI_CHUNK分块发送连续的字节缓冲区，不构造Python列表
+
+        periphery的SPI.transfer只接受bytes/bytearray/list，
+        因此每个memoryview分块只做一次C层面的拷贝再发送。
+        """
+        if isinstance(pixel, list):
+            #兼容旧的列表格式帧
+            pixel = bytes(pixel)
+        elif isinstance(pixel, np.ndarray):
+            pixel = np.ascontiguousarray(pixel)
+        view = memoryview(pixel).cast('B')
+        for i in range(0, len(view), SPI_CHUNK):
+            self.spi.transfer(bytes(view[i:i + SPI_CHUNK]))
 
-            self.spi.transfer(buf[i:i+4096])
-
-    
     def set_pixel(self, x, y, color):
         """设置像素颜色"""
         self.set_cursor(x, y, x, y)
@@ -183,19 +207,33 @@ class ST7789():
         """显示图像"""
         self.set_cursor(0, 0, self.w, self.h)
         self.dc.value = True
-        for i in range(0, len(pixel), 4096):
-            self.spi.transfer(pixel[i:i+4096])
+        self._write_buffer(pixel)
+
+
+def new_rgb565_buffer(w=240, h=240):
+    """预分配一帧大端RGB565缓冲区"""
+    return np.empty(w * h, dtype=RGB565_DTYPE)
+
 
+def convert_rgba_to_rgb565(image, out=None):
+    """将RGBA图像转换为RGB565格式
 
-def convert_rgba_to_rgb565(image):
-    """将RGBA图像转换为RGB565格式"""
-    r = image[..., 0] & 0xF8
-    g = image[..., 1]
-    b = image[..., 2] & 0xFC
+    结果按大端写入一维uint16缓冲区，可直接交给img_show发送。
+    out为预分配的缓冲区（见new_rgb565_buffer），为None时新建。
+    """
+    r = image[..., 0].astype(np.uint16)
+    g = image[..., 1].astype(np.uint16)
+    b = image[..., 2].astype(np.uint16)
 
-    pixel_high = r | (g >> 5)
-    pixel_low = ((g << 3) & 0xE0) | (b >> 3)
+    r &= 0xF8
+    r <<= 8
+    g &= 0xFC
+    g <<= 3
+    b >>= 3
+    r |= g
+    r |= b
 
-    # 将高低字节交错合并并展平为一维数组
-    pixel = np.dstack((pixel_high, pixel_low)).flatten().tolist()
-    return pixel
\ No newline at end of file
+    if out is None:
+        out = np.empty(r.size, dtype=RGB565_DTYPE)
+    out[:] = r.reshape(-1)
+    return out
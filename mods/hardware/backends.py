@@ -0,0 +1,406 @@
+import array
+import os
+import threading
+import time
+
+import numpy as np
+
+#ST7789写显存命令，之后的数据为像素
+RAMWR = 0x2C
+
+#PCA9685的地址和寄存器，模拟总线按它们把ALLCALL和ALL_LED写入展开到各芯片各通道，
+#并按MODE1的AI位决定多字节写入是否自动递增
+ALLCALL_ADDRESS = 0x70
+MODE1 = 0x00
+MODE2 = 0x01
+LED0_ON_L = 0x06
+ALL_LED_ON_L = 0xFA
+AI = 0x20
+PCA9685_CHANNELS = 16
+
+
+def pca9685_power_on():
+    """PCA9685上电时的寄存器：MODE1=0x11（休眠、AI关闭），MODE2=0x04，所有通道完全关断"""
+    registers = bytearray(256)
+    registers[MODE1] = 0x11
+    registers[MODE2] = 0x04
+    for channel in range(PCA9685_CHANNELS + 1):
+        #最后一组为ALL_LED，LEDn_OFF_H的第4位为完全关断
+        reg = LED0_ON_L + 4 * channel if channel < PCA9685_CHANNELS else ALL_LED_ON_L
+        registers[reg + 3] = 0x10
+    return registers
+
+
+class I2CMessage:
+    def __init__(self, data, read=False):
+        """
+        一条I2C消息，与后端无关，字段与periphery.I2C.Message相同。
+
+        参数：
+        data: 列表，写入的字节；读消息时为占位的列表，长度即读取的字节数，传输后被替换为读到的字节
+        read: 布尔值，是否为读消息
+        """
+        self.data = data
+        self.read = read
+
+
+class _RealPin:
+    def __init__(self, name):
+        """板上的GPIO输出引脚，第一次读写value时才初始化"""
+        self.name = name
+        self._io = None
+
+    def _open(self):
+        import board
+        import digitalio
+        self._io = digitalio.DigitalInOut(getattr(board, self.name))
+        self._io.direction = digitalio.Direction.OUTPUT
+        return self._io
+
+    @property
+    def value(self):
+        return (self._io or self._open()).value
+
+    @value.setter
+    def value(self, value):
+        (self._io or self._open()).value = value
+
+
+class _RealSPI:
+    def __init__(self, path, speed_hz, mode=0):
+        """spidev设备，第一次传输时才打开"""
+        self.path = path
+        self.speed_hz = speed_hz
+        self.mode = mode
+        self._spi = None
+
+    def transfer(self, data):
+        if self._spi is None:
+            from periphery import SPI
+            self._spi = SPI(self.path, self.mode, self.speed_hz)
+        return self._spi.transfer(data)
+
+    def close(self):
+        if self._spi is not None:
+            self._spi.close()
+            self._spi = None
+
+
+class _RealI2C:
+    def __init__(self, path):
+        """i2c-dev设备，第一次传输时才打开"""
+        self.path = path
+        self._i2c = None
+
+    def transfer(self, address, messages):
+        from periphery import I2C
+        if self._i2c is None:
+            self._i2c = I2C(self.path)
+        #I2CMessage转换为periphery的消息，读到的字节再写回原消息
+        wire = [I2C.Message(message.data, read=message.read) for message in messages]
+        self._i2c.transfer(address, wire)
+        for message, sent in zip(messages, wire):
+            if message.read:
+                message.data = sent.data
+
+    def close(self):
+        if self._i2c is not None:
+            self._i2c.close()
+            self._i2c = None
+
+
+class RealBackend:
+    """
+    真实硬件：periphery的SPI/I2C和Blinka的GPIO。
+
+    所有设备在第一次使用时才打开，导入配置文件不会访问硬件。
+    """
+    name = "real"
+
+    def pin(self, name):
+        """
+        参数：
+        name: 字符串，board模块中的引脚名，例如"GPIO11"
+        """
+        return _RealPin(name)
+
+    def spi(self, path, speed_hz, dc=None, name=None):
+        return _RealSPI(path, speed_hz)
+
+    def i2c(self, path):
+        return _RealI2C(path)
+
+    def stats(self):
+        return {}
+
+
+class _Wire:
+    def __init__(self, realtime):
+        """按模拟的线上耗时睡眠，耗时累积到1ms以上再睡，避免大量微秒级sleep"""
+        self.realtime = realtime
+        self.busy = 0.0
+        self._debt = 0.0
+
+    def spend(self, seconds):
+        self.busy += seconds
+        if not self.realtime:
+            return
+        self._debt += seconds
+        if self._debt >= 0.001:
+            start = time.perf_counter()
+            time.sleep(self._debt)
+            self._debt -= time.perf_counter() - start
+
+
+class SimPin:
+    """模拟的GPIO输出引脚，只保存电平"""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.value = False
+        self.direction = None
+
+
+class SimSPI:
+    def __init__(self, speed_hz=80000000, overhead_s=20e-6, realtime=False,
+                 dc=None, name=None, dump_dir=None, dump_every=1, screen_size=(240, 240)):
+        """
+        模拟的SPI总线，接口与periphery.SPI相同。
+
+        统计字节数和传输次数，按总线速率和每次传输的固定开销估算线上耗时，
+        realtime为True时按估算的耗时睡眠，吞吐量与真实总线接近。
+        给出dc引脚和dump_dir时，按ST7789的命令流解析出每一帧并保存为PNG。
+
+        参数：
+        speed_hz: 整数，总线速率
+        overhead_s: 浮点数，每次传输的固定开销（秒），包括系统调用和片选切换
+        realtime: 布尔值，是否按估算的耗时睡眠
+        dc: 可选，屏幕的DC引脚（SimPin），用于区分命令和数据
+        name: 可选，设备名，用于帧文件名
+        dump_dir: 可选，帧文件保存目录
+        dump_every: 整数，每隔几帧保存一帧
+        screen_size: 元组，屏幕尺寸
+        """
+        self.speed_hz = speed_hz
+        self.overhead_s = overhead_s
+        self.dc = dc
+        self.name = name or "spi"
+        self.dump_dir = dump_dir
+        self.dump_every = dump_every
+        self.screen_size = screen_size
+        self.frames = 0
+        self.dumped = 0
+        self._wire = _Wire(realtime)
+        self._frame = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bytes = 0
+        self.transfers = 0
+        self._wire.busy = 0.0
+
+    def transfer(self, data):
+        if not isinstance(data, (bytes, bytearray, list)):
+            raise TypeError("Invalid data type, should be bytes, bytearray, or list.")
+        #与periphery一样把数据拷贝进array，CPU开销与真实总线一致
+        n = len(array.array('B', data))
+        with self._lock:
+            self.bytes += n
+            self.transfers += 1
+            if self.dc is not None:
+                self._decode(data)
+        self._wire.spend(n * 8 / self.speed_hz + self.overhead_s)
+        return data
+
+    def _decode(self, data):
+        if not self.dc.value:
+            #命令，RAMWR之后开始收集一帧
+            self._frame = bytearray() if data and data[-1] == RAMWR else None
+            return
+        if self._frame is None:
+            return
+        self._frame += bytes(data)
+        w, h = self.screen_size
+        if len(self._frame) >= w * h * 2:
+            if self.dump_dir is not None and self.frames % self.dump_every == 0:
+                self._dump(self._frame[:w * h * 2])
+            self.frames += 1
+            self._frame = None
+
+    def _dump(self, frame):
+        from PIL import Image
+        w, h = self.screen_size
+        pixel = np.frombuffer(bytes(frame), dtype='>u2').reshape(h, w)
+        rgb = np.empty((h, w, 3), dtype=np.uint8)
+        r = (pixel >> 8) & 0xF8
+        g = (pixel >> 3) & 0xFC
+        b = (pixel << 3) & 0xF8
+        #低位用高位补齐，0xFFFF还原为纯白
+        rgb[..., 0] = r | (r >> 5)
+        rgb[..., 1] = g | (g >> 6)
+        rgb[..., 2] = b | (b >> 5)
+        os.makedirs(self.dump_dir, exist_ok=True)
+        Image.fromarray(rgb).save(os.path.join(self.dump_dir, f"{self.name}-{self.frames:06d}.png"))
+        self.dumped += 1
+
+    def wire_time(self):
+        """估算的累计线上耗时（秒）"""
+        return self._wire.busy
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {
+            "bytes": self.bytes,
+            "transfers": self.transfers,
+            "frames": self.frames,
+            "dumped": self.dumped,
+            "wire_ms": round(self._wire.busy * 1000, 3)
+        }
+
+
+class SimI2C:
+    def __init__(self, speed_hz=400000, overhead_s=50e-6, realtime=False):
+        """
+        模拟的I2C总线，接口与periphery.I2C相同。
+
+        每个从机地址有一份256字节的寄存器，初始为PCA9685的上电值，读出返回写入过的值，
+        可以直接检查PCA9685各通道的值。与芯片一样，只有MODE1的AI位置位时多字节读写才自动递增，
+        否则所有字节都落在同一个寄存器上；写ALL_LED寄存器同时改变所有通道的寄存器，
+        写ALLCALL地址同时写入总线上所有已知的芯片。每字节按9位（含ACK）计时，另加起止位和固定开销。
+
+        参数：
+        speed_hz: 整数，总线速率
+        overhead_s: 浮点数，每次传输的固定开销（秒）
+        realtime: 布尔值，是否按估算的耗时睡眠
+        """
+        self.speed_hz = speed_hz
+        self.overhead_s = overhead_s
+        self.registers = {}
+        self._wire = _Wire(realtime)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bytes = 0
+        self.transactions = 0
+        self._wire.busy = 0.0
+
+    def transfer(self, address, messages):
+        bits = 0
+        with self._lock:
+            if address == ALLCALL_ADDRESS:
+                #ALLCALL写入到达总线上所有已知的芯片
+                targets = [registers for known, registers in self.registers.items() if known != ALLCALL_ADDRESS]
+            else:
+                if address not in self.registers:
+                    self.registers[address] = pca9685_power_on()
+                targets = [self.registers[address]]
+            pointer = 0
+            for message in messages:
+                # 每条消息：起始位 + 地址字节 + 数据字节
+                self.bytes += 1 + len(message.data)
+                bits += (1 + len(message.data)) * 9 + 2
+                if message.read:
+                    registers = targets[0] if targets else pca9685_power_on()
+                    step = 1 if registers[MODE1] & AI else 0
+                    message.data = [registers[(pointer + i * step) & 0xFF] for i in range(len(message.data))]
+                    continue
+                pointer = message.data[0]
+                for registers in targets:
+                    self._write(registers, pointer, message.data[1:])
+            self.transactions += 1
+        self._wire.spend(bits / self.speed_hz + self.overhead_s)
+
+    @staticmethod
+    def _write(registers, pointer, values):
+        reg = pointer
+        for value in values:
+            registers[reg] = value
+            if ALL_LED_ON_L <= reg < ALL_LED_ON_L + 4:
+                #ALL_LED寄存器同时写入每个通道的对应寄存器
+                for channel in range(PCA9685_CHANNELS):
+                    registers[LED0_ON_L + 4 * channel + reg - ALL_LED_ON_L] = value
+            #AI关闭时所有数据字节都写入同一个寄存器
+            if registers[MODE1] & AI:
+                reg = (reg + 1) & 0xFF
+
+    def wire_time(self):
+        """估算的累计线上耗时（秒）"""
+        return self._wire.busy
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {
+            "bytes": self.bytes,
+            "transactions": self.transactions,
+            "wire_ms": round(self._wire.busy * 1000, 3)
+        }
+
+
+class SimBackend:
+    name = "sim"
+
+    def __init__(self, spi_overhead=20e-6, i2c_speed=400000, i2c_overhead=50e-6,
+                 realtime=True, dump_dir=None, dump_every=1, screen_size=(240, 240)):
+        """
+        模拟硬件，不需要任何设备文件，用于在普通Linux机器上做性能分析和压力测试。
+
+        参数：
+        spi_overhead: 浮点数，每次SPI传输的固定开销（秒），SPI速率使用配置中的值
+        i2c_speed: 整数，I2C总线速率
+        i2c_overhead: 浮点数，每次I2C传输的固定开销（秒）
+        realtime: 布尔值，是否按估算的总线耗时睡眠
+        dump_dir: 可选，屏幕帧保存目录，为None时不保存
+        dump_every: 整数，每隔几帧保存一帧
+        screen_size: 元组，屏幕尺寸
+        """
+        self.spi_overhead = spi_overhead
+        self.i2c_speed = i2c_speed
+        self.i2c_overhead = i2c_overhead
+        self.realtime = realtime
+        self.dump_dir = dump_dir
+        self.dump_every = dump_every
+        self.screen_size = screen_size
+        self.devices = {}
+
+    def pin(self, name):
+        return SimPin(name)
+
+    def spi(self, path, speed_hz, dc=None, name=None):
+        name = name or os.path.basename(path)
+        device = SimSPI(speed_hz, self.spi_overhead, self.realtime, dc, name,
+                        self.dump_dir, self.dump_every, self.screen_size)
+        self.devices[name] = device
+        return device
+
+    def i2c(self, path):
+        device = SimI2C(self.i2c_speed, self.i2c_overhead, self.realtime)
+        self.devices[os.path.basename(path)] = device
+        return device
+
+    def stats(self):
+        """各模拟设备的字节数、传输次数和估算的线上耗时"""
+        return {name: device.stats() for name, device in self.devices.items()}
+
+
+def make_backend(name, **conf):
+    """
+    按名称创建硬件后端。
+
+    参数：
+    name: 字符串，"real"或"sim"
+    conf: SimBackend的参数，real时忽略
+
+    返回：
+    后端对象，提供pin(name)、spi(path, speed_hz, dc, name)、i2c(path)和stats()
+    """
+    if name == "real":
+        return RealBackend()
+    if name == "sim":
+        return SimBackend(**conf)
+    raise ValueError(f"unknown hardware backend: {name}")
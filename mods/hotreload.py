@@ -0,0 +1,175 @@
+import ast
+import logging
+import operator
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#预设中的纹理文件
+TEXTURE_KEYS = ("left_iris", "left_sclera", "right_iris", "right_sclera")
+
+_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv
+}
+
+
+def _evaluate(node, env):
+    """只计算字面量、已知变量名和简单算术，其他表达式抛出ValueError"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id not in env:
+            raise ValueError(node.id)
+        return env[node.id]
+    if isinstance(node, (ast.Tuple, ast.List)):
+        values = [_evaluate(elt, env) for elt in node.elts]
+        return tuple(values) if isinstance(node, ast.Tuple) else values
+    if isinstance(node, ast.Dict):
+        return {_evaluate(k, env): _evaluate(v, env) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_evaluate(node.operand, env)
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        return _BINOPS[type(node.op)](_evaluate(node.left, env), _evaluate(node.right, env))
+    raise ValueError(ast.dump(node))
+
+
+def read_config_literals(path):
+    """
+    不执行配置文件，只取出其中由字面量组成的顶层赋值。
+
+    重新导入mods/config.py会创建新的屏幕、PWM和队列对象，与正在运行的对象脱节，
+    所以热重载只解析源码，按顺序计算字面量、已赋值的变量名和简单算术组成的表达式。
+    目前只使用TEXTURE_PRESETS和DEFAULT_PRESET，硬件、MQTT等配置仍需要重启才能生效。
+
+    参数：
+    path: 字符串，配置文件路径
+
+    返回：
+    字典，变量名到值的映射
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    env = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            continue
+        try:
+            env[node.targets[0].id] = _evaluate(node.value, env)
+        except (ValueError, TypeError, ZeroDivisionError):
+            continue
+    return env
+
+
+def preset_files(presets):
+    """所有预设用到的纹理文件"""
+    files = set()
+    for preset in presets.values():
+        for key in TEXTURE_KEYS:
+            if key in preset:
+                files.add(preset[key])
+    return files
+
+
+class HotReloader:
+    def __init__(self, manager, config_path, interval=1.0):
+        """
+        纹理和渲染参数的热重载。
+
+        检测到配置文件或纹理文件变化（或收到MQTT命令）后，在后台线程中重新读取预设、
+        重建渲染器，旧的渲染器在此期间继续出帧，重建完成后由PresetManager整体替换。
+        重建中再次收到的请求合并为重建结束后的一次。
+
+        参数：
+        manager: PresetManager对象
+        config_path: 字符串，配置文件路径
+        interval: 浮点数，检查文件修改时间的间隔（秒）
+        """
+        self.manager = manager
+        self.config_path = config_path
+        self.interval = interval
+        self.requests = 0
+        self.reloads = 0
+        self.failures = 0
+        self._requested = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._watcher = None
+
+    def start(self, watch=True):
+        """启动重建线程，watch为True时同时监视文件"""
+        self._worker = threading.Thread(target=self._run, name="hot-reload", daemon=True)
+        self._worker.start()
+        if watch:
+            self._watcher = threading.Thread(target=self._watch, name="hot-reload-watch", daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._requested.set()
+
+    def request(self, reason="manual"):
+        """请求一次重载，立即返回"""
+        logger.info(f"hot reload requested: {reason}")
+        self.requests += 1
+        self._requested.set()
+
+    def _watched_files(self):
+        return {self.config_path} | preset_files(self.manager.presets)
+
+    @staticmethod
+    def _mtimes(files):
+        mtimes = {}
+        for path in files:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def _watch(self):
+        last = self._mtimes(self._watched_files())
+        while not self._stop.wait(self.interval):
+            current = self._mtimes(self._watched_files())
+            if current == last:
+                continue
+            #等文件写完（两次检查之间不再变化）再重载
+            time.sleep(self.interval)
+            settled = self._mtimes(self._watched_files())
+            if settled != current:
+                continue
+            changed = sorted(path for path in settled if settled[path] != last.get(path))
+            last = settled
+            self.request(f"changed {', '.join(changed)}")
+
+    def _run(self):
+        while True:
+            self._requested.wait()
+            if self._stop.is_set():
+                return
+            self._requested.clear()
+            start = time.time()
+            try:
+                literals = read_config_literals(self.config_path)
+                presets = literals.get("TEXTURE_PRESETS", self.manager.presets)
+                self.manager.default = literals.get("DEFAULT_PRESET", self.manager.default)
+                self.manager.reload(presets)
+                self.reloads += 1
+                logger.info(f"hot reload done in {time.time() - start:.2f}s")
+            except Exception:
+                self.failures += 1
+                logger.exception("hot reload failed, keeping the current renderers")
+
+    def stats(self):
+        """请求、完成和失败的重载次数"""
+        return {
+            "requests": self.requests,
+            "reloads": self.reloads,
+            "failures": self.failures
+        }
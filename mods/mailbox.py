@@ -0,0 +1,99 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+#消息类型
+STATE = "state"          #眼部状态，未处理的旧状态会被新状态覆盖
+COMMAND = "command"      #自定义屏幕等命令，按到达顺序逐条处理
+RAW_SCREEN = "raw_screen"    #预先编码好的RGB565自定义屏幕，与命令一起按顺序处理
+CLIP = "clip"                #动画片段的播放和停止
+PRESET = "preset"            #纹理预设的切换
+
+
+class RenderMailbox:
+    def __init__(self):
+        """
+        MQTT接收线程与渲染线程之间的信箱。
+
+        眼部状态只保留最新的一条：渲染线程还没取走的状态被新状态直接覆盖，
+        一串连续的视线消息只渲染最后一个。命令消息不合并，按到达顺序排队，
+        状态和命令之间也保持到达顺序。
+        """
+        self.received = 0
+        self.coalesced = 0
+        self.commands = 0
+        self.closed = False
+        self._seq = itertools.count()
+        self._state = None
+        self._commands = deque()
+        self._cond = threading.Condition()
+
+    def post_state(self, args, stamp=None):
+        """
+        投递一条眼部状态，覆盖尚未处理的旧状态。
+
+        参数：
+        args: 字典，EYErend的参数
+        stamp: 可选，消息到达时间（time.monotonic），默认为当前时间
+        """
+        stamp = time.monotonic() if stamp is None else stamp
+        with self._cond:
+            self.received += 1
+            if self._state is not None:
+                self.coalesced += 1
+            self._state = (next(self._seq), STATE, args, stamp)
+            self._cond.notify()
+
+    def post_command(self, args, stamp=None, kind=COMMAND):
+        """
+        投递一条命令，不会被合并。
+
+        参数：
+        args: 字典，命令的参数
+        stamp: 可选，消息到达时间（time.monotonic），默认为当前时间
+        kind: 命令类型，COMMAND、RAW_SCREEN、CLIP或PRESET
+        """
+        stamp = time.monotonic() if stamp is None else stamp
+        with self._cond:
+            self.received += 1
+            self.commands += 1
+            self._commands.append((next(self._seq), kind, args, stamp))
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """
+        取出下一条要处理的消息，信箱为空时阻塞。
+
+        参数：
+        timeout: 最多等待的秒数，None为一直等待
+
+        返回：
+        (类型, 参数, 到达时间) 元组，超时或信箱关闭时返回None
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._state is not None or self._commands or self.closed, timeout):
+                return None
+            if self._commands and (self._state is None or self._commands[0][0] < self._state[0]):
+                item = self._commands.popleft()
+            elif self._state is not None:
+                item, self._state = self._state, None
+            else:
+                return None
+            return item[1:]
+
+    def close(self):
+        """关闭信箱，唤醒等待的渲染线程"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        """收到、被合并的消息数与待处理的消息数"""
+        with self._cond:
+            return {
+                "received": self.received,
+                "coalesced": self.coalesced,
+                "commands": self.commands,
+                "pending": len(self._commands) + (self._state is not None)
+            }
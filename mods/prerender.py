@@ -0,0 +1,181 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .Render import IrisAndScleraRender, EyeLidRender, combine_render, generate_tuples
+from .systems import cache_tmpdir, commit_cache
+
+logger = logging.getLogger(__name__)
+
+
+#以下函数在子进程中执行，参数只包含路径和配置，纹理在子进程中读取；
+#结果直接写入主进程创建好的.npy文件（内存映射），不经过pickle传回主进程
+
+def _sclera_layer(sclera_path, frame_size, inner, outer, out_path):
+    """渲染巩膜层，写入out_path"""
+    sclera = Image.open(sclera_path).convert("RGBA")
+    out = np.load(out_path, mmap_mode="r+")
+    out[:] = IrisAndScleraRender._iris_and_sclera_render(np.array(sclera), sclera.size, frame_size, inner, outer)
+    out.flush()
+
+
+def _iris_layer(iris_path, frame_size, inner, outer, pupil_radius, targets):
+    """
+    渲染一个瞳孔缩放步骤的虹膜层（含瞳孔），与每个目标的巩膜层合成后写入输出的对应帧。
+
+    参数：
+    targets: 元组，每项为 (巩膜层.npy路径, 输出.npy路径, 帧下标)，
+             只有巩膜不同的预设（例如white）共用同一个虹膜层
+    """
+    iris = Image.open(iris_path).convert("RGBA")
+    ring = IrisAndScleraRender._iris_and_sclera_render(np.array(iris), iris.size, frame_size, inner, outer)
+    layer = combine_render(ring, IrisAndScleraRender._pupil_render(frame_size, pupil_radius))
+    for sclera_path, out_path, index in targets:
+        out = np.load(out_path, mmap_mode="r+")
+        # 巩膜层在上，虹膜层在下
+        combine_render(np.load(sclera_path, mmap_mode="r"), layer, out=out[index])
+        out.flush()
+
+
+def _eyelid_frames(conf, axes_list, out_path, first):
+    """批量渲染一段连续的眼睑帧写入输出的对应位置，这一段共用一份椭圆几何量"""
+    render = EyeLidRender(eyelid_list=[], **conf)
+    out = np.load(out_path, mmap_mode="r+")
+    render.create_ellipse_images(axes_list, out=out[first:first + len(axes_list)])
+    out.flush()
+
+
+def _create_npy(path, shape):
+    """在主进程中创建输出文件，子进程以r+内存映射打开后写入各自的部分"""
+    np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=shape).flush()
+    return path
+
+
+class _InlineExecutor:
+    """单进程时直接在当前线程执行任务，接口与ProcessPoolExecutor一致"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class _Stage:
+    """记录一个预渲染阶段的提交时间，等待全部任务完成后输出耗时"""
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.futures = {}
+
+    def submit(self, executor, key, fn, *args):
+        # 相同输入只提交一次
+        if key not in self.futures:
+            self.futures[key] = executor.submit(fn, *args)
+        return self.futures[key]
+
+    def results(self):
+        results = {key: future.result() for key, future in self.futures.items()}
+        logger.info(f"prerender {self.name}: {len(results)} jobs done at {time.time() - self.start:.2f}s")
+        return results
+
+
+def prerender(iris_jobs, eyelid_conf=None, eyelid_key=None, frame_size=480, workers=None, max_bytes=None):
+    """
+    用进程池并行预渲染眼部渲染器，结果直接写入预渲染缓存。
+
+    每个巩膜层、每个瞳孔缩放步骤的虹膜层、每个进程的一段眼睑帧都是独立的任务，
+    输入完全相同的任务（例如左右眼共用sclera.png和相同参数）只渲染一次。
+    输出在主进程中预先创建为缓存临时目录中的.npy，子进程以内存映射打开，
+    把合成好的帧写到各自的位置，不通过pickle把结果传回主进程，主进程也不持有整份结果；
+    巩膜层先渲染到临时的.npy，虹膜任务读取后直接合成。全部完成后原子改名为缓存。
+
+    参数：
+    iris_jobs: 字典，缓存key到 (iris路径, sclera路径, 渲染参数字典) 的映射，key相同的只渲染一次
+    eyelid_conf: 可选，EyeLidRender的参数字典
+    eyelid_key: 字符串，eyelid_conf不为None时眼睑帧的缓存key
+    frame_size: 整数，渲染画布边长
+    workers: 整数，进程数，默认为CPU核数；为1时在当前进程中顺序执行
+    max_bytes: 可选，缓存总大小上限，写入后按最近使用时间淘汰
+    """
+    workers = workers or os.cpu_count() or 1
+    start = time.time()
+    if workers > 1:
+        # 预渲染在加载和热重载线程中进行，此时SPI、MQTT和PWM线程都在运行，fork出的子进程
+        # 可能卡在这些线程持有的锁上；forkserver的子进程由单线程的服务进程创建
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    else:
+        executor = _InlineExecutor()
+
+    sclera_stage = _Stage("sclera layers", start)
+    iris_stage = _Stage("iris layers", start)
+    eyelid_stage = _Stage("eyelid frames", start)
+    #巩膜层的临时文件，以及各缓存key的临时目录
+    scratch = cache_tmpdir("prerender")
+    outputs = {}
+
+    try:
+        sclera_paths = {}
+        iris_targets = {}
+        for key, (iris_path, sclera_path, conf) in iris_jobs.items():
+            sclera_args = (sclera_path, frame_size,
+                           tuple(conf["sclera_inner"]), tuple(conf["sclera_outer"]))
+            if sclera_args not in sclera_paths:
+                sclera_paths[sclera_args] = _create_npy(
+                    os.path.join(scratch, f"sclera-{len(sclera_paths)}.npy"), (frame_size, frame_size, 4)
+                )
+                sclera_stage.submit(executor, sclera_args, _sclera_layer, *sclera_args, sclera_paths[sclera_args])
+
+            pupil_radius = conf["iris_inner_crazy_max"][1] + 2
+            iris_tuples = generate_tuples(conf["iris_inner_normal"], conf["iris_inner_crazy_max"], conf["iris_smooth_n"])
+            outputs[key] = cache_tmpdir(key)
+            out_path = _create_npy(os.path.join(outputs[key], "frames.npy"),
+                                   (len(iris_tuples), frame_size, frame_size, 4))
+            for i, iris_tuple in enumerate(iris_tuples):
+                iris_args = (iris_path, frame_size,
+                             tuple(iris_tuple), tuple(conf["iris_outer"]), pupil_radius)
+                iris_targets.setdefault(iris_args, []).append((sclera_paths[sclera_args], out_path, i))
+
+        if eyelid_conf is not None:
+            conf = dict(eyelid_conf)
+            axes_list = [tuple(axes) for axes in generate_tuples(conf.pop("axes_upper"), conf.pop("axes_lower"), conf.pop("flash_n"))]
+            rsize = EyeLidRender(eyelid_list=[], **conf).Rsize
+            outputs[eyelid_key] = cache_tmpdir(eyelid_key)
+            out_path = _create_npy(os.path.join(outputs[eyelid_key], "eyelid.npy"),
+                                   (len(axes_list), rsize, rsize, 4))
+            #每个进程一段连续的帧，几何量在每段中只计算一次
+            size = -(-len(axes_list) // workers)
+            for first in range(0, len(axes_list), size):
+                chunk = tuple(axes_list[first:first + size])
+                eyelid_stage.submit(executor, first, _eyelid_frames, conf, chunk, out_path, first)
+
+        #虹膜任务需要读取巩膜层，巩膜层写完后再提交；眼睑帧与巩膜层同时渲染
+        sclera_stage.results()
+        for iris_args, targets in iris_targets.items():
+            iris_stage.submit(executor, iris_args, _iris_layer, *iris_args, tuple(targets))
+        iris_stage.results()
+        eyelid_stage.results()
+    except BaseException:
+        for tmp in outputs.values():
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    finally:
+        executor.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    for key in iris_jobs:
+        commit_cache(outputs[key], key, ["frames"], {}, max_bytes)
+    if eyelid_conf is not None:
+        meta = EyeLidRender(eyelid_list=[], **eyelid_conf).cache_meta()
+        commit_cache(outputs[eyelid_key], eyelid_key, ["eyelid"], meta, max_bytes)
+    logger.info(f"prerender: {len(outputs)} caches written at {time.time() - start:.2f}s")
@@ -0,0 +1,263 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class RenderSet:
+    def __init__(self, name, key, left, right, eyelid, atlas=None):
+        """
+        一套完整的眼部渲染器，切换外观时整体替换。
+
+        参数：
+        name: 字符串，预设名
+        key: 字符串，由纹理和渲染参数得到的标识，用于区分显示帧缓存
+        left, right: IrisAndScleraRender对象
+        eyelid: EyeLidRender对象
+        atlas: 可选，FrameAtlas对象
+        """
+        self.name = name
+        self.key = key
+        self.left = left
+        self.right = right
+        self.eyelid = eyelid
+        self.atlas = atlas
+
+    @property
+    def pupil_n(self):
+        return len(self.left.iris_and_sclera_array_list)
+
+    def memory_report(self):
+        """各渲染器占用的内存（字节）"""
+        report = {
+            "left": self.left.memory_report()["total"],
+            "right": self.right.memory_report()["total"],
+            "eyelid": self.eyelid.memory_report()["total"]
+        }
+        if self.atlas is not None:
+            report["atlas"] = self.atlas.frames.nbytes
+        report["total"] = sum(report.values())
+        return report
+
+
+class PresetManager:
+    def __init__(self, presets, loader, max_bytes=None, on_switch=None, default=None):
+        """
+        纹理预设的加载和切换。
+
+        已加载的预设切换时只替换一个引用，渲染线程每帧开始时取一次active，
+        切换总是发生在两帧之间。未加载的预设在后台线程中加载，加载完成后再切换。
+        已加载的预设总大小超过max_bytes时，按最近使用时间卸载不在使用中的预设。
+
+        参数：
+        presets: 字典，预设名到预设参数的映射
+        loader: 可调用对象，loader(name, preset) 返回RenderSet
+        max_bytes: 可选，已加载预设的内存上限（字节）
+        on_switch: 可选，后台加载完成并切换后调用 on_switch(name)
+        default: 可选，默认预设名，其他预设中没有写的项使用默认预设的值
+        """
+        self.presets = presets
+        self.default = default
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.on_switch = on_switch
+        self.version = 0
+        self.switches = 0
+        self.unloads = 0
+        self.reloads = 0
+        self._active = None
+        self._sets = OrderedDict()
+        self._loading = {}
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def resolve(self, name):
+        """合并默认预设后的完整预设参数"""
+        preset = self.presets[name]
+        if self.default is not None and name != self.default:
+            preset = {**self.presets[self.default], **preset}
+        return preset
+
+    @property
+    def active(self):
+        """当前使用的RenderSet"""
+        return self._active
+
+    def loaded(self):
+        """已加载的预设名"""
+        with self._lock:
+            return list(self._sets)
+
+    def load(self, name):
+        """
+        加载一个预设（阻塞），已加载时直接返回。
+
+        返回：
+        RenderSet对象
+        """
+        if name not in self.presets:
+            raise KeyError(f"unknown texture preset: {name}")
+        with self._lock:
+            if name in self._sets:
+                self._sets.move_to_end(name)
+                return self._sets[name]
+            event = self._loading.get(name)
+            owner = event is None
+            if owner:
+                event = self._loading[name] = threading.Event()
+
+        if not owner:
+            #其他线程正在加载同一个预设
+            event.wait()
+            with self._lock:
+                if name not in self._sets:
+                    raise RuntimeError(f"texture preset {name} failed to load")
+                return self._sets[name]
+
+        try:
+            start = time.time()
+            render_set = self.loader(name, self.resolve(name))
+            logger.info(f"preset {name} loaded in {time.time() - start:.2f}s: {render_set.memory_report()}")
+            with self._lock:
+                self._sets[name] = render_set
+                self._evict()
+            return render_set
+        finally:
+            with self._lock:
+                del self._loading[name]
+            event.set()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        total = sum(s.memory_report()["total"] for s in self._sets.values())
+        for name in list(self._sets):
+            if total <= self.max_bytes:
+                break
+            render_set = self._sets[name]
+            if render_set is self._active:
+                continue
+            total -= render_set.memory_report()["total"]
+            del self._sets[name]
+            self.unloads += 1
+            logger.info(f"preset {name} unloaded, over memory budget")
+
+    def switch(self, name, wait=False):
+        """
+        切换到一个预设。
+
+        参数：
+        name: 字符串，预设名
+        wait: 布尔值，预设未加载时是否阻塞等待加载完成
+
+        返回：
+        布尔值，已经切换为True；在后台加载、稍后切换为False
+        """
+        if name not in self.presets:
+            raise KeyError(f"unknown texture preset: {name}")
+        with self._lock:
+            render_set = self._sets.get(name)
+            self._pending = name
+            if render_set is not None:
+                self._activate(render_set)
+                return True
+
+        if wait:
+            render_set = self.load(name)
+            with self._lock:
+                if self._pending == name:
+                    self._activate(render_set)
+            return True
+
+        threading.Thread(target=self._load_and_switch, args=(name,), name=f"preset-{name}", daemon=True).start()
+        return False
+
+    def _activate(self, render_set):
+        self._sets.move_to_end(render_set.name)
+        self._active = render_set
+        self._pending = None
+        self.version += 1
+        self.switches += 1
+
+    def _load_and_switch(self, name):
+        try:
+            render_set = self.load(name)
+        except Exception:
+            logger.exception(f"preset {name} failed to load")
+            return
+        with self._lock:
+            #加载期间又切换到了别的预设时不再切换
+            if self._pending != name:
+                return
+            self._activate(render_set)
+        if self.on_switch is not None:
+            self.on_switch(name)
+
+    def reload(self, presets=None):
+        """
+        重新加载所有已加载的预设（阻塞，应在后台线程中调用）。
+
+        重建期间旧的渲染器继续出帧，每个预设重建完成后整体替换；
+        纹理和参数没有变化的渲染器直接命中缓存。重建失败时保留旧的渲染器。
+
+        参数：
+        presets: 可选，新的预设字典，替换原有的预设
+        """
+        with self._lock:
+            if presets is not None:
+                self.presets = presets
+            active = self._active.name if self._active is not None else None
+            names = [name for name in self._sets if name in self.presets]
+            #不再存在的预设直接卸载（正在使用的除外）
+            for name in list(self._sets):
+                if name not in self.presets and name != active:
+                    del self._sets[name]
+        #当前使用的预设最先重建
+        names.sort(key=lambda name: name != active)
+
+        for name in names:
+            start = time.time()
+            try:
+                render_set = self.loader(name, self.resolve(name))
+            except Exception:
+                logger.exception(f"preset {name} failed to reload, keeping the current renderers")
+                continue
+            switched = False
+            with self._lock:
+                if name in self._sets:
+                    self._sets[name] = render_set
+                if self._active is not None and self._active.name == name:
+                    #不影响正在后台加载、等待切换的其他预设
+                    self._active = render_set
+                    self.version += 1
+                    switched = True
+                self.reloads += 1
+            logger.info(f"preset {name} reloaded in {time.time() - start:.2f}s")
+            if switched and self.on_switch is not None:
+                self.on_switch(name)
+
+    def preload(self, names):
+        """在后台依次加载预设，不切换"""
+        def run():
+            for name in names:
+                try:
+                    self.load(name)
+                except Exception:
+                    logger.exception(f"preset {name} failed to preload")
+        thread = threading.Thread(target=run, name="preset-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        """当前预设、已加载的预设与切换次数"""
+        with self._lock:
+            return {
+                "active": self._active.name if self._active is not None else None,
+                "loaded": list(self._sets),
+                "loading": list(self._loading),
+                "switches": self.switches,
+                "unloads": self.unloads,
+                "reloads": self.reloads
+            }
@@ -0,0 +1,144 @@
+import struct
+
+import numpy as np
+
+#二进制消息格式版本，布局变化时递增
+PROTOCOL_VERSION = 1
+
+#与JSON主题并行的二进制主题
+EYE_BIN_TOPIC = "controler/eye/bin"
+PWM_BIN_TOPIC = "controler/pwm/bin"
+SCREEN_BIN_TOPIC = "controler/eye/screen"
+
+#消息类型
+MSG_EYE_STATE = 1
+MSG_PWM_SET = 2
+MSG_PWM_BREATH = 3
+MSG_RGB565_SCREEN = 4
+
+#所有消息以 版本(uint8) + 类型(uint8) 开头，小端
+HEADER = struct.Struct("<BB")
+EYE_STATE = struct.Struct("<BBffff")        #eyelid_percentage, radius, rel_x, rel_y
+PWM_SET = struct.Struct("<BBBH")            #channel, value
+PWM_BREATH = struct.Struct("<BBBHHHH")      #channel, step1, step2, range[0], range[1]
+RGB565_SCREEN = struct.Struct("<BBH")       #n，后面跟一帧（左右眼相同）或两帧（左、右）大端RGB565像素
+
+EYE_STATE_KEYS = ("eyelid_percentage", "radius", "rel_x", "rel_y")
+
+_LAYOUTS = {
+    MSG_EYE_STATE: EYE_STATE,
+    MSG_PWM_SET: PWM_SET,
+    MSG_PWM_BREATH: PWM_BREATH
+}
+
+
+class ProtocolError(ValueError):
+    """二进制消息版本、类型或长度不正确"""
+
+
+def decode(payload):
+    """
+    解码一条二进制消息。
+
+    参数：
+    payload: bytes，MQTT消息体
+
+    返回：
+    (消息类型, 字段元组) 元组，字段不含版本和类型
+    """
+    if len(payload) < HEADER.size:
+        raise ProtocolError("payload too short")
+    version, kind = HEADER.unpack_from(payload)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    layout = _LAYOUTS.get(kind)
+    if layout is None:
+        raise ProtocolError(f"unknown message type {kind}")
+    if len(payload) != layout.size:
+        raise ProtocolError(f"message type {kind} expects {layout.size} bytes, got {len(payload)}")
+    return kind, layout.unpack(payload)[2:]
+
+
+def decode_rgb565_screen(payload, w=240, h=240):
+    """
+    解码一条RGB565自定义屏幕消息，像素不拷贝，直接引用消息体。
+
+    参数：
+    payload: bytes，MQTT消息体
+    w, h: 整数，屏幕尺寸
+
+    返回：
+    (左眼帧, 右眼帧, n) 元组，帧为只读的大端RGB565数组
+    """
+    frame_bytes = w * h * 2
+    if len(payload) < RGB565_SCREEN.size:
+        raise ProtocolError("payload too short")
+    version, kind, n = RGB565_SCREEN.unpack_from(payload)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    if kind != MSG_RGB565_SCREEN:
+        raise ProtocolError(f"unexpected message type {kind}")
+    count, rest = divmod(len(payload) - RGB565_SCREEN.size, frame_bytes)
+    if rest or count not in (1, 2):
+        raise ProtocolError(f"rgb565 screen expects 1 or 2 frames of {w}x{h}, got {len(payload)} bytes")
+    frames = np.frombuffer(payload, dtype=">u2", offset=RGB565_SCREEN.size).reshape(count, w * h)
+    return frames[0], frames[-1], n
+
+
+def encode_rgb565_screen(left, right=None, n=1):
+    """
+    编码一条RGB565自定义屏幕消息。
+
+    参数：
+    left: 左眼（或两眼共用）的大端RGB565帧
+    right: 可选，右眼的大端RGB565帧
+    n: 整数，连续显示的帧数
+    """
+    parts = [RGB565_SCREEN.pack(PROTOCOL_VERSION, MSG_RGB565_SCREEN, n), np.asarray(left, dtype=">u2").tobytes()]
+    if right is not None:
+        parts.append(np.asarray(right, dtype=">u2").tobytes())
+    return b"".join(parts)
+
+
+def encode_eye_state(eyelid_percentage, radius, rel_x, rel_y):
+    """编码一条眼部状态消息，参数与EYErend一致"""
+    return EYE_STATE.pack(PROTOCOL_VERSION, MSG_EYE_STATE, eyelid_percentage, radius, rel_x, rel_y)
+
+
+def encode_pwm_set(channel, value):
+    """编码一条PWM设置消息"""
+    return PWM_SET.pack(PROTOCOL_VERSION, MSG_PWM_SET, channel, value)
+
+
+def encode_pwm_breath(channel, step1, step2, PWMrange):
+    """编码一条PWM呼吸消息"""
+    return PWM_BREATH.pack(PROTOCOL_VERSION, MSG_PWM_BREATH, channel, step1, step2, PWMrange[0], PWMrange[1])
+
+
+class BinaryPublisher:
+    def __init__(self, client, qos=0):
+        """
+        追踪器等发布端使用的二进制消息发布工具。
+
+        参数：
+        client: 已连接的paho.mqtt.client.Client对象
+        qos: 整数，发布使用的QoS
+        """
+        self.client = client
+        self.qos = qos
+
+    def eye_state(self, eyelid_percentage, radius, rel_x, rel_y):
+        """发布一条眼部状态"""
+        return self.client.publish(EYE_BIN_TOPIC, encode_eye_state(eyelid_percentage, radius, rel_x, rel_y), self.qos)
+
+    def rgb565_screen(self, left, right=None, n=1):
+        """发布一组预先编码的RGB565帧"""
+        return self.client.publish(SCREEN_BIN_TOPIC, encode_rgb565_screen(left, right, n), self.qos)
+
+    def pwm_set(self, channel, value):
+        """发布一条PWM设置"""
+        return self.client.publish(PWM_BIN_TOPIC, encode_pwm_set(channel, value), self.qos)
+
+    def pwm_breath(self, channel, step1, step2, PWMrange):
+        """发布一条PWM呼吸设置"""
+        return self.client.publish(PWM_BIN_TOPIC, encode_pwm_breath(channel, step1, step2, PWMrange), self.qos)
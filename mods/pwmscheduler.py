@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ConstantWave:
+    #不随时间变化的波形只需要写一次
+    static = True
+
+    def __init__(self, value):
+        """
+        固定占空比。
+
+        参数：
+        value: 整数，PWM关断计数（0-4095）
+        """
+        self.value = value
+
+    def value_at(self, t):
+        return self.value
+
+
+class BreathWave:
+    static = False
+
+    def __init__(self, step1, step2, PWMrange, tick_hz=100):
+        """
+        呼吸灯：从range[0]每个tick增加step1到range[1]，再每个tick减少step2回到range[0]，循环。
+
+        值由经过的时间直接算出，呼吸速度只取决于tick_hz，与总线速度和CPU负载无关。
+
+        参数：
+        step1: 整数，上升时每个tick的增量，为0时保持在range[0]
+        step2: 整数，下降时每个tick的减量
+        PWMrange: 元组，(最小值, 最大值)
+        tick_hz: 浮点数，步进频率，一般与调度器的tick频率相同
+        """
+        self.low, self.high = PWMrange
+        self.step1 = step1
+        self.step2 = step2
+        span = max(self.high - self.low, 0)
+        self.rise = span / step1 / tick_hz if step1 > 0 else 0.0
+        self.fall = span / step2 / tick_hz if step2 > 0 else 0.0
+        self.period = self.rise + self.fall
+        self.static = step1 <= 0 or self.period <= 0
+
+    def value_at(self, t):
+        if self.static:
+            return self.low
+        t %= self.period
+        if t < self.rise:
+            return int(self.low + (self.high - self.low) * t / self.rise)
+        return int(self.high - (self.high - self.low) * (t - self.rise) / self.fall)
+
+
+class PWMScheduler:
+    def __init__(self, pwm, tick_hz=100, on=1):
+        """
+        单线程的PWM波形调度器。
+
+        每个通道对应一个波形对象，调度线程按固定tick用时钟时间计算所有通道的值，
+        每个tick合并成一次批量写入（PCA9685.set_pwm_many，未变化的通道不写）。
+        切换效果只替换通道的波形对象，不需要结束线程。
+        没有动态波形时线程阻塞等待，不占用CPU和总线。
+
+        参数：
+        pwm: PCA9685对象
+        tick_hz: 浮点数，tick频率
+        on: 整数，PWM开启计数，与原来的set_pwm(channel, 1, value)一致
+        """
+        self.pwm = pwm
+        self.period = 1.0 / tick_hz
+        self.tick_hz = tick_hz
+        self.on = on
+        self.ticks = 0
+        self.late = 0
+        self.updates = 0
+        self._waves = {}
+        self._sources = []
+        self._dirty = set()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def set_wave(self, channel, wave):
+        """
+        替换一个通道的波形，下一个tick生效。
+
+        参数：
+        channel: 整数，通道号
+        wave: 波形对象（需要value_at(t)方法和static属性，可选end属性：播放结束的时间（秒），
+              之后由调度器换成固定值），为None时停止该通道的波形
+        """
+        self.set_waves({channel: wave})
+
+    def set_waves(self, waves):
+        """
+        同时替换多个通道的波形，这些通道从同一时刻开始播放。
+
+        参数：
+        waves: 字典，通道号到波形对象的映射
+        """
+        for channel in waves:
+            if not 0 <= channel < self.pwm.CHANNELS:
+                raise ValueError(f"channel {channel} out of range")
+        with self._cond:
+            start = time.monotonic()
+            for channel, wave in waves.items():
+                if wave is None:
+                    self._waves.pop(channel, None)
+                else:
+                    self._waves[channel] = (wave, start)
+                    self._dirty.add(channel)
+            self._cond.notify()
+
+    def add_source(self, source):
+        """
+        加入一个每个tick都要计算的数据源（例如舵机运动规划），它的输出与波形合并在同一次批量写入中。
+
+        参数：
+        source: 对象，需要update(now, dt)方法，返回 {通道: PWM关断计数}
+        """
+        with self._cond:
+            self._sources.append(source)
+            self._cond.notify()
+
+    def set_value(self, channel, value):
+        """设为固定占空比"""
+        self.set_wave(channel, ConstantWave(value))
+
+    def breath(self, channel, step1, step2, PWMrange):
+        """设为呼吸波形"""
+        self.set_wave(channel, BreathWave(step1, step2, PWMrange, self.tick_hz))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="pwm-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _collect(self, now):
+        """计算本tick需要写入的通道值，返回 {通道: (on, off)}，固定值的通道只在设置后写一次"""
+        updates = {}
+        for channel, (wave, start) in list(self._waves.items()):
+            if wave.static and channel not in self._dirty:
+                continue
+            value = wave.value_at(now - start)
+            updates[channel] = (self.on, value)
+            end = getattr(wave, "end", None)
+            if end is not None and now - start >= end:
+                #播放结束，之后不再计算
+                self._waves[channel] = (ConstantWave(value), start)
+        for source in self._sources:
+            try:
+                values = source.update(now, self.period)
+            except Exception:
+                logger.exception("pwm source update failed")
+                continue
+            for channel, value in values.items():
+                updates[channel] = (self.on, value)
+        self._dirty.clear()
+        return updates
+
+    def _run(self):
+        deadline = time.monotonic()
+        while True:
+            with self._cond:
+                #只有固定值的通道时，写完后等到下一次设置再醒来
+                while not self._stop and not self._dirty and not self._sources and \
+                        all(w.static for w, _ in self._waves.values()):
+                    self._cond.wait()
+                    deadline = time.monotonic()
+                if self._stop:
+                    return
+                now = time.monotonic()
+                updates = self._collect(now)
+
+            if updates:
+                try:
+                    self.pwm.set_pwm_many(updates)
+                    self.updates += 1
+                except Exception:
+                    logger.exception("pwm update failed")
+            self.ticks += 1
+
+            #按固定时刻推进，不累积睡眠误差；落后超过一个tick时重新对齐
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stop or bool(self._dirty), delay)
+            elif -delay > self.period:
+                self.late += 1
+                deadline = time.monotonic()
+
+    def stats(self):
+        """tick数、落后次数、批量写入次数和总线统计"""
+        with self._cond:
+            waves = {channel: type(wave).__name__ for channel, (wave, _) in self._waves.items()}
+        return {
+            "ticks": self.ticks,
+            "late": self.late,
+            "updates": self.updates,
+            "waves": waves,
+            "bus": self.pwm.stats()
+        }
@@ -0,0 +1,199 @@
+import logging
+import threading
+
+from .hardware.backends import I2CMessage, RealBackend
+from .hardware.PCA9685 import PCA9685, PCA9685_ADDRESS, ALLCALL_ADDRESS, ALL_LED_ON_L
+
+logger = logging.getLogger(__name__)
+
+
+class _PWMBus:
+    def __init__(self, path, i2c, boards, broadcast=True):
+        """
+        一条I2C总线上的所有PCA9685，由一个工作线程负责写入。
+
+        参数：
+        path: 字符串，总线设备路径
+        i2c: 已打开的总线对象
+        boards: 列表，[(第一个全局通道号, PCA9685对象), ...]
+        broadcast: 布尔值，总线上所有通道设为同一个值时是否通过ALLCALL地址一次写入
+        """
+        self.path = path
+        self.i2c = i2c
+        self.boards = boards
+        self.broadcast = broadcast and all(board.address != ALLCALL_ADDRESS for _, board in boards)
+        self.channels = sum(board.CHANNELS for _, board in boards)
+        self.batches = 0
+        self.merged = 0
+        self.broadcasts = 0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._busy = False
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"pwm-bus-{self.path}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def post(self, updates):
+        """提交一批更新（全局通道号），立即返回；尚未写出的同一通道的旧值被覆盖"""
+        with self._cond:
+            if self._pending:
+                self.merged += 1
+            self._pending.update(updates)
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """等待已提交的更新全部写出"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stop or self._pending)
+                if self._stop:
+                    return
+                updates, self._pending = self._pending, {}
+                self._busy = True
+            try:
+                self.write(updates)
+            except Exception:
+                logger.exception(f"pwm write on {self.path} failed")
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def write(self, updates):
+        """把一批更新按芯片分组写出，每个芯片的连续通道合并为一次传输"""
+        self.batches += 1
+        if self.broadcast and len(updates) == self.channels and len(set(updates.values())) == 1:
+            on, off = next(iter(updates.values()))
+            self._broadcast(on, off)
+            return
+        for first, board in self.boards:
+            local = {ch - first: value for ch, value in updates.items() if first <= ch < first + board.CHANNELS}
+            if local:
+                board.set_pwm_many(local)
+
+    def _broadcast(self, on, off):
+        if all(board.all_equal(on, off) for _, board in self.boards):
+            return
+        if len(self.boards) == 1:
+            self.boards[0][1].set_all_pwm(on, off)
+            return
+        self.i2c.transfer(ALLCALL_ADDRESS, [I2CMessage([ALL_LED_ON_L] + PCA9685._pack(on, off))])
+        self.broadcasts += 1
+        for _, board in self.boards:
+            board.assume_all_pwm(on, off)
+
+    def stats(self):
+        boards = {hex(board.address): board.stats() for _, board in self.boards}
+        return {
+            "batches": self.batches,
+            "merged": self.merged,
+            "broadcasts": self.broadcasts,
+            "transactions": sum(b["transactions"] for b in boards.values()) + self.broadcasts,
+            "boards": boards
+        }
+
+
+class PWMChannelSpace:
+    def __init__(self, boards, open_bus=None, broadcast=True):
+        """
+        多块PCA9685组成的全局通道空间，接口与PCA9685相同，可以直接交给PWMScheduler使用。
+
+        全局通道号按boards中的顺序连续编号（第一块板0-15，第二块16-31……），
+        每条I2C总线一个工作线程，set_pwm_many把一批更新按总线分发后立即返回，
+        各总线并行写入，同一总线上按芯片分组，每个芯片的连续通道合并为一次自动递增传输。
+        同一总线上所有通道设为同一个值时，通过ALLCALL地址写ALL_LED寄存器，一次传输完成。
+
+        参数：
+        boards: 列表，每项为 {"bus": "/dev/i2c-5", "address": 0x40, "freq": 50}，
+                address可省略；freq可省略，写了freq的板（如舵机板）不受set_pwm_freq影响
+        open_bus: 可调用对象，open_bus(path) 返回总线对象，同一路径只打开一次，默认为真实硬件后端的i2c
+        broadcast: 布尔值，是否使用ALLCALL广播
+
+        创建时只计算通道编号，不访问总线；begin()时才打开总线、初始化芯片并启动写入线程。
+        """
+        self.conf = [dict(conf) for conf in boards]
+        self.open_bus = open_bus if open_bus is not None else RealBackend().i2c
+        self.broadcast = broadcast
+        self.buses = {}
+        self.boards = []
+        self._route = []
+        for conf in self.conf:
+            conf.setdefault("address", PCA9685_ADDRESS)
+            self._route += [conf["bus"]] * PCA9685.CHANNELS
+        self.CHANNELS = len(self._route)
+
+    def begin(self):
+        """打开总线，初始化所有芯片，启动每条总线的写入线程"""
+        buses = {}
+        first = 0
+        for conf in self.conf:
+            path = conf["bus"]
+            if path not in buses:
+                buses[path] = (self.open_bus(path), [])
+            i2c, members = buses[path]
+            board = PCA9685(address=conf["address"], i2c=i2c)
+            if "freq" in conf:
+                board.set_pwm_freq(conf["freq"])
+            members.append((first, board))
+            self.boards.append(board)
+            first += board.CHANNELS
+        for path, (i2c, members) in buses.items():
+            bus = _PWMBus(path, i2c, members, self.broadcast)
+            bus.start()
+            self.buses[path] = bus
+        return self
+
+    def locate(self, channel):
+        """
+        全局通道号对应的硬件位置。
+
+        返回：
+        (总线路径, 芯片地址, 芯片内通道号) 元组
+        """
+        conf = self.conf[channel // PCA9685.CHANNELS]
+        return conf["bus"], conf["address"], channel % PCA9685.CHANNELS
+
+    def set_pwm_freq(self, freq_hz):
+        """没有单独设置频率的芯片设置同一个PWM频率（阻塞）"""
+        self.flush()
+        for conf, board in zip(self.conf, self.boards):
+            if "freq" not in conf:
+                board.set_pwm_freq(freq_hz)
+
+    def set_pwm_many(self, updates):
+        """设置多个全局通道 {通道: (on, off)}，按总线分发后立即返回"""
+        per_bus = {}
+        for channel, value in updates.items():
+            per_bus.setdefault(self._route[channel], {})[channel] = tuple(value)
+        for path, bus_updates in per_bus.items():
+            self.buses[path].post(bus_updates)
+
+    def set_pwm(self, channel, on, off):
+        self.set_pwm_many({channel: (on, off)})
+
+    def set_all_pwm(self, on, off):
+        """所有通道设为同一个值，每条总线一次广播"""
+        value = (on, off)
+        for bus in self.buses.values():
+            bus.post({channel: value for first, board in bus.boards for channel in range(first, first + board.CHANNELS)})
+
+    def flush(self, timeout=None):
+        """等待所有总线写完"""
+        return all(bus.flush(timeout) for bus in self.buses.values())
+
+    def stats(self):
+        """各总线的批次数、被合并的批次数、广播次数和传输数"""
+        return {path: bus.stats() for path, bus in self.buses.items()}
@@ -0,0 +1,158 @@
+import math
+import threading
+import time
+from collections import deque
+
+#参与插值的眼部参数
+GAZE_KEYS = ("eyelid_percentage", "radius", "rel_x", "rel_y")
+#取值范围为0到1的参数，插值和外推后需要截断
+UNIT_KEYS = ("eyelid_percentage", "radius")
+
+
+class GazeTrack:
+    def __init__(self, delay=0.05, horizon=0.1, history=8):
+        """
+        带时间戳的视线样本，按任意时刻插值或短时外推出眼部状态。
+
+        渲染时刻比当前时间晚delay秒取样，两次消息之间的帧在相邻样本间线性插值；
+        输入中断时按最后两个样本的速度外推，最多外推horizon秒，之后保持不动。
+
+        参数：
+        delay: 浮点数，插值延迟（秒），一般设为追踪器的发布间隔
+        horizon: 浮点数，最长外推时间（秒）
+        history: 整数，保留的样本数
+        """
+        self.delay = delay
+        self.horizon = horizon
+        self.samples = 0
+        self.extrapolated = 0
+        self._history = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def add(self, args, stamp=None):
+        """
+        加入一个样本。
+
+        参数：
+        args: 字典，EYErend的参数
+        stamp: 可选，消息到达时间（time.monotonic），默认为当前时间
+        """
+        self.add_values(tuple(float(args[key]) for key in GAZE_KEYS), stamp)
+
+    def add_values(self, values, stamp=None):
+        """
+        加入一个样本，values按GAZE_KEYS的顺序排列，二进制消息解码后直接使用。
+
+        参数：
+        values: 元组，(eyelid_percentage, radius, rel_x, rel_y)
+        stamp: 可选，消息到达时间（time.monotonic），默认为当前时间
+        """
+        stamp = time.monotonic() if stamp is None else stamp
+        with self._lock:
+            #时间戳不递增的样本（同一时刻的重复消息）直接替换上一个
+            if self._history and stamp <= self._history[-1][0]:
+                self._history[-1] = (self._history[-1][0], values)
+            else:
+                self._history.append((stamp, values))
+            self.samples += 1
+
+    def sample(self, now=None):
+        """
+        取出某一时刻的眼部状态。
+
+        参数：
+        now: 可选，当前时间（time.monotonic），默认为当前时间
+
+        返回：
+        (EYErend参数字典, 样本时间戳) 元组，还没有样本时返回None
+        """
+        now = time.monotonic() if now is None else now
+        t = now - self.delay
+        with self._lock:
+            history = list(self._history)
+        if not history:
+            return None
+
+        if len(history) == 1 or t <= history[0][0]:
+            stamp, values = history[0] if t <= history[0][0] else history[-1]
+        elif t <= history[-1][0]:
+            #在相邻两个样本之间插值
+            for (t0, v0), (t1, v1) in zip(history, history[1:]):
+                if t <= t1:
+                    k = (t - t0) / (t1 - t0)
+                    values = tuple(a + (b - a) * k for a, b in zip(v0, v1))
+                    stamp = t1
+                    break
+        else:
+            #输入中断，按最后两个样本的速度短时外推
+            (t0, v0), (t1, v1) = history[-2], history[-1]
+            dt = min(t - t1, self.horizon)
+            k = dt / (t1 - t0)
+            values = tuple(b + (b - a) * k for a, b in zip(v0, v1))
+            stamp = t1
+            self.extrapolated += 1
+
+        args = dict(zip(GAZE_KEYS, values))
+        for key in UNIT_KEYS:
+            args[key] = min(max(args[key], 0.0), 1.0)
+        return args, stamp
+
+
+class FrameClock:
+    def __init__(self, fps):
+        """
+        固定帧率的时钟，统计实际帧间隔相对目标间隔的抖动。
+
+        参数：
+        fps: 浮点数，目标帧率
+        """
+        self.period = 1.0 / fps
+        self.frames = 0
+        self.late = 0
+        self._deadline = None
+        self._last = None
+        self._n = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._max = 0.0
+
+    def wait(self):
+        """
+        睡到下一帧的时刻。落后超过一帧时不补帧，从当前时间重新对齐。
+
+        返回：
+        当前时间（time.monotonic）
+        """
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        elif self._deadline > now:
+            time.sleep(self._deadline - now)
+            now = time.monotonic()
+        elif now - self._deadline > self.period:
+            self.late += 1
+            self._deadline = now
+
+        if self._last is not None:
+            error = (now - self._last) - self.period
+            self._n += 1
+            self._sum += error
+            self._sum_sq += error * error
+            self._max = max(self._max, abs(error))
+        self._last = now
+        self._deadline += self.period
+        self.frames += 1
+        return now
+
+    def stats(self):
+        """帧数、落后次数，以及帧间隔误差的平均值、标准差和最大值（毫秒）"""
+        mean = self._sum / self._n if self._n else 0.0
+        std = math.sqrt(max(self._sum_sq / self._n - mean * mean, 0.0)) if self._n else 0.0
+        return {
+            "fps": round(1.0 / self.period, 2),
+            "frames": self.frames,
+            "late": self.late,
+            "jitter_mean_ms": round(mean * 1000, 3),
+            "jitter_std_ms": round(std * 1000, 3),
+            "jitter_max_ms": round(self._max * 1000, 3)
+        }
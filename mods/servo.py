@@ -0,0 +1,143 @@
+import math
+import threading
+
+from .scheduler import GAZE_KEYS
+
+
+class ServoChannel:
+    def __init__(self, channel, input="rel_x", range=(-1.0, 1.0), pwm=(205, 410),
+                 max_velocity=2.0, max_acceleration=20.0, invert=False):
+        """
+        一个舵机通道的标定和运动状态。
+
+        眼部状态中的一个参数在range内线性映射到pwm范围（超出部分截断），
+        运动时速度和加速度受限，接近目标时按加速度上限减速，不会越过目标。
+
+        参数：
+        channel: 整数，全局PWM通道号
+        input: 字符串，使用的眼部参数（eyelid_percentage、radius、rel_x、rel_y之一）
+        range: 元组，参数的取值范围
+        pwm: 元组，range两端对应的PWM关断计数（50Hz时1ms-2ms脉宽约为205-410）
+        max_velocity: 浮点数，最大速度，单位为每秒走过的全行程比例
+        max_acceleration: 浮点数，最大加速度，单位为每秒平方走过的全行程比例
+        invert: 布尔值，是否反向
+        """
+        if input not in GAZE_KEYS:
+            raise ValueError(f"unknown servo input: {input}")
+        self.channel = channel
+        self.input = input
+        self.range = tuple(range)
+        self.pwm = tuple(pwm)
+        self.invert = invert
+        travel = abs(self.pwm[1] - self.pwm[0])
+        self.max_velocity = max_velocity * travel
+        self.max_acceleration = max_acceleration * travel
+        self.position = None
+        self.velocity = 0.0
+
+    def target(self, args):
+        """眼部状态对应的目标PWM计数"""
+        low, high = self.range
+        x = (args[self.input] - low) / (high - low)
+        x = min(max(x, 0.0), 1.0)
+        if self.invert:
+            x = 1.0 - x
+        return self.pwm[0] + (self.pwm[1] - self.pwm[0]) * x
+
+    def step(self, target, dt):
+        """
+        向目标运动一个时间步。
+
+        参数：
+        target: 浮点数，目标PWM计数
+        dt: 浮点数，时间步长（秒）
+
+        返回：
+        整数，本步的PWM计数
+        """
+        if self.position is None:
+            #第一次直接到位
+            self.position = target
+            return int(round(target))
+        error = target - self.position
+        #能在剩余距离内按最大加速度停下的速度
+        stop_velocity = math.sqrt(2 * self.max_acceleration * abs(error))
+        desired = math.copysign(min(self.max_velocity, stop_velocity), error)
+        dv = self.max_acceleration * dt
+        self.velocity += min(max(desired - self.velocity, -dv), dv)
+        move = self.velocity * dt
+        if abs(move) >= abs(error) and (move == 0 or (move > 0) == (error > 0)):
+            self.position = target
+            self.velocity = 0.0
+        else:
+            self.position += move
+        return int(round(self.position))
+
+
+class ServoPlanner:
+    def __init__(self, track, channels, delay=0.0):
+        """
+        视线到舵机的运动规划，作为PWMScheduler的数据源，舵机与灯光在同一次批量写入中更新。
+
+        舵机与屏幕从同一个GazeTrack取样：屏幕渲染线程在帧时钟时刻取样，
+        规划器在每个PWM tick取样，两者得到同一条插值后的视线曲线，不需要另外发布舵机消息。
+        delay用于对齐机械与屏幕：屏幕帧经过显示队列和SPI有延迟，舵机本身也有响应延迟，
+        正值让舵机晚一些跟随，负值让舵机提前。
+
+        参数：
+        track: GazeTrack对象
+        channels: ServoChannel对象的列表
+        delay: 浮点数，舵机相对屏幕取样时刻的延迟（秒）
+        """
+        self.track = track
+        self.channels = list(channels)
+        self.delay = delay
+        self.updates = 0
+        self.limited = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_conf(cls, track, conf):
+        """
+        由配置创建。
+
+        参数：
+        track: GazeTrack对象
+        conf: 字典，{"delay": 0.0, "channels": {通道号: ServoChannel的参数}}
+        """
+        channels = [ServoChannel(int(channel), **params) for channel, params in conf["channels"].items()]
+        return cls(track, channels, conf.get("delay", 0.0))
+
+    def update(self, now, dt):
+        """
+        计算一个tick的舵机位置，由PWMScheduler调用。
+
+        参数：
+        now: 浮点数，当前时间（time.monotonic）
+        dt: 浮点数，tick间隔（秒）
+
+        返回：
+        字典，通道号到PWM关断计数的映射，还没有视线样本时为空
+        """
+        sampled = self.track.sample(now - self.delay)
+        if sampled is None:
+            return {}
+        args = sampled[0]
+        values = {}
+        with self._lock:
+            for servo in self.channels:
+                target = servo.target(args)
+                values[servo.channel] = servo.step(target, dt)
+                if servo.position != target:
+                    self.limited += 1
+            self.updates += 1
+        return values
+
+    def stats(self):
+        """更新次数、受速度/加速度限制的通道次数和各通道当前位置"""
+        with self._lock:
+            return {
+                "updates": self.updates,
+                "limited": self.limited,
+                "positions": {servo.channel: round(servo.position, 1) for servo in self.channels if servo.position is not None}
+            }
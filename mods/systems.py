@@ -1,25 +1,111 @@
-import ctypes
 import hashlib
+import json
 import os
-import pickle
+import shutil
+import tempfile
+import numpy as np
 
 
-def check_cache(md5):
-    return os.path.exists(f"./cache/{md5}.cache")
+#预渲染缓存的目录和格式版本，格式变化时递增，旧缓存自动失效
+CACHE_DIR = "./cache"
+CACHE_VERSION = 3
+#写入中的临时目录名中的标记，淘汰时跳过
+_TMP_MARK = ".tmp-"
 
 
-def make_cache(obj, md5):
-    # 以二进制写模式打开文件
-    with open(f"./cache/{md5}.cache", 'wb') as file:
-        # 使用pickle将对象序列化并写入文件
-        pickle.dump(obj, file)
+def cache_key(*parts):
+    # 缓存key包含格式版本和全部渲染参数（纹理md5、配置等），任一变化都会得到新的key
+    return hashlib.md5(repr((CACHE_VERSION,) + parts).encode()).hexdigest()
+
+
+def _cache_path(key, root=None):
+    # root为缓存所在目录，默认为CACHE_DIR；图集等大文件可以放在单独的目录中，单独计算上限
+    return os.path.join(root or CACHE_DIR, key)
+
+
+def check_cache(key, root=None):
+    return os.path.exists(os.path.join(_cache_path(key, root), "header.json"))
+
+
+def cache_tmpdir(key, root=None):
+    # 每个写入方使用自己的临时目录，多个线程或进程同时写同一个key互不干扰
+    root = root or CACHE_DIR
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(dir=root, prefix=f"{key}{_TMP_MARK}")
+
+
+def commit_cache(tmp, key, names, meta, max_bytes=None, keep=None, root=None):
+    # tmp中已经写好了names中各数组的.npy，写入header.json后改名为key，之后参与淘汰
+    with open(os.path.join(tmp, "header.json"), "w") as file:
+        json.dump({"version": CACHE_VERSION, "arrays": sorted(names), "meta": meta}, file)
+
+    # 整个目录写完后再原子改名，读取方不会看到写了一半的缓存
+    try:
+        os.rename(tmp, _cache_path(key, root))
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # 其他写入方已经写好了同一个key，直接使用已有的缓存
+        if not check_cache(key, root):
+            raise
+
+    if max_bytes is not None:
+        evict_cache(max_bytes, keep={key} | set(keep or ()), root=root)
+
+
+def make_cache(obj, key, max_bytes=None):
+    # obj.to_cache()返回 (数组字典, 可json序列化的参数)，每个数组单独保存为.npy
+    arrays, meta = obj.to_cache()
+    tmp = cache_tmpdir(key)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    commit_cache(tmp, key, arrays, meta, max_bytes)
+
+
+def read_cache(key, cls, root=None):
+    # 以只读内存映射打开各数组，页面在首次访问时才真正读入
+    path = _cache_path(key, root)
+    with open(os.path.join(path, "header.json"), "r") as file:
+        header = json.load(file)
+    if header["version"] != CACHE_VERSION:
+        raise ValueError(f"cache {key} has version {header['version']}, expected {CACHE_VERSION}")
+
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in header["arrays"]
+    }
+    # 更新目录时间戳，用于LRU淘汰
+    os.utime(path)
+    return cls.from_cache(arrays, header["meta"])
+
+
+def cache_sizes(root=None):
+    # 各缓存的 key: (最近使用时间, 字节数)，跳过写入中的临时目录
+    root = root or CACHE_DIR
+    sizes = {}
+    if not os.path.isdir(root):
+        return sizes
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if _TMP_MARK in name or not os.path.exists(os.path.join(path, "header.json")):
+            continue
+        size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        sizes[name] = (os.stat(path).st_mtime, size)
+    return sizes
+
+
+def evict_cache(max_bytes, keep=None, root=None):
+    # 缓存总大小超过上限时，按最近使用时间从旧到新删除，keep为不能删除的一个key或key的集合
+    keep = {keep} if isinstance(keep, str) else set(keep or ())
+    sizes = cache_sizes(root)
+    total = sum(size for _, size in sizes.values())
+    for _, name, size in sorted((mtime, name, size) for name, (mtime, size) in sizes.items()):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        shutil.rmtree(_cache_path(name, root), ignore_errors=True)
+        total -= size
 
-def read_cache(md5):
-    # 以二进制读模式打开文件
-    with open(f"./cache/{md5}.cache", 'rb') as file:
-        # 使用pickle加载并反序列化对象
-        obj = pickle.load(file)
-    return obj
 
 def calculate_md5(file_path):
     # 创建一个MD5哈希对象
@@ -34,19 +120,3 @@ def calculate_md5(file_path):
     # 返回MD5值的16进制表示
     return md5_hash.hexdigest()
 
-
-# 强制终止线程的函数
-def terminate_thread(thread):
-    if not thread.is_alive():
-        return
-
-    # 获取线程的ID
-    thread_id = thread.ident
-    # 使用ctypes发出终止请求
-    res = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(thread_id), ctypes.py_object(SystemExit))
-    if res == 0:
-        raise ValueError("Invalid thread id")
-    elif res > 1:
-        # 复位状态，如果出现异常
-        ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
-        raise SystemError("PyThreadState_SetAsyncExc failed")
\ No newline at end of file
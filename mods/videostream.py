@@ -0,0 +1,354 @@
+import logging
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from .hardware.ST7789 import RGB565_DTYPE, convert_rgba_to_rgb565
+
+logger = logging.getLogger(__name__)
+
+#每像素字节数，rgb565为已经是显示格式的大端像素
+RAW_FORMATS = {"rgb24": 3, "rgba": 4, "rgb565": 2}
+MJPEG = "mjpeg"
+
+#共享内存环形缓冲区的头部：写入序号, 槽数, 每槽字节数；每个槽以帧长度(uint32)开头
+SHM_HEADER = struct.Struct("<QII")
+SHM_SLOT_HEADER = struct.Struct("<I")
+
+
+def _read_exact(stream, size):
+    """读满size字节，流结束时返回None"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def read_raw_frames(stream, frame_bytes):
+    """按固定长度从流中切出原始帧"""
+    while True:
+        frame = _read_exact(stream, frame_bytes)
+        if frame is None:
+            return
+        yield frame
+
+
+def read_mjpeg_frames(stream, chunk_size=65536):
+    """按JPEG的SOI/EOI标记从流中切出MJPEG帧"""
+    buf = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+        while True:
+            start = buf.find(b"\xff\xd8")
+            if start < 0:
+                del buf[:-1]
+                break
+            end = buf.find(b"\xff\xd9", start + 2)
+            if end < 0:
+                del buf[:start]
+                break
+            yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+
+
+class ShmRing:
+    def __init__(self, name, slots=4, slot_size=0, create=False):
+        """
+        共享内存中的帧环形缓冲区，生产者循环写入各个槽，写完一帧后递增写入序号。
+        读取方只取最新的一帧，来不及处理的帧自然被跳过。
+
+        参数：
+        name: 字符串，共享内存名
+        slots: 整数，槽数（create时有效）
+        slot_size: 整数，每个槽能容纳的最大帧字节数（create时有效）
+        create: 布尔值，为True时创建共享内存（生产者），否则打开已有的（读取方）
+        """
+        if create:
+            size = SHM_HEADER.size + slots * (SHM_SLOT_HEADER.size + slot_size)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            SHM_HEADER.pack_into(self.shm.buf, 0, 0, slots, slot_size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        _, self.slots, self.slot_size = SHM_HEADER.unpack_from(self.shm.buf, 0)
+        self.created = create
+
+    def _slot_offset(self, seq):
+        return SHM_HEADER.size + (seq % self.slots) * (SHM_SLOT_HEADER.size + self.slot_size)
+
+    @property
+    def seq(self):
+        """已经写完的帧数"""
+        return SHM_HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    def write(self, frame):
+        """写入一帧（生产者）"""
+        if len(frame) > self.slot_size:
+            raise ValueError(f"frame of {len(frame)} bytes exceeds slot size {self.slot_size}")
+        seq = self.seq
+        offset = self._slot_offset(seq)
+        SHM_SLOT_HEADER.pack_into(self.shm.buf, offset, len(frame))
+        start = offset + SHM_SLOT_HEADER.size
+        self.shm.buf[start:start + len(frame)] = frame
+        SHM_HEADER.pack_into(self.shm.buf, 0, seq + 1, self.slots, self.slot_size)
+
+    def read(self, seq):
+        """读出序号为seq的帧，已经被覆盖时返回None"""
+        if self.seq - seq > self.slots - 1:
+            return None
+        offset = self._slot_offset(seq)
+        length = SHM_SLOT_HEADER.unpack_from(self.shm.buf, offset)[0]
+        start = offset + SHM_SLOT_HEADER.size
+        frame = bytes(self.shm.buf[start:start + length])
+        #拷贝期间槽被生产者覆盖则丢弃
+        if self.seq - seq > self.slots - 1:
+            return None
+        return frame
+
+    def frames(self, stop, poll=0.002):
+        """不断产出最新的帧，直到stop被设置"""
+        last = self.seq
+        while not stop.is_set():
+            seq = self.seq
+            if seq == last:
+                time.sleep(poll)
+                continue
+            frame = self.read(seq - 1)
+            last = seq
+            if frame is not None:
+                yield frame
+
+    def close(self):
+        self.shm.close()
+        if self.created:
+            self.shm.unlink()
+
+
+def crop_square(image, box=None):
+    """
+    取出一只眼用的正方形区域。
+
+    参数：
+    image: numpy数组，整幅图像
+    box: 可选，(x0, x1) 横向范围，在其中居中取正方形，默认为整幅图像
+
+    返回：
+    正方形图像视图
+    """
+    h, w = image.shape[:2]
+    x0, x1 = box if box is not None else (0, w)
+    side = min(h, x1 - x0)
+    sx = x0 + (x1 - x0 - side) // 2
+    sy = (h - side) // 2
+    return image[sy:sy + side, sx:sx + side]
+
+
+class VideoStream:
+    def __init__(self, frame_queue, source="file", path=None, format=MJPEG, width=240, height=240,
+                 layout="mirror", workers=2, fps=0, loop=False, stale_timeout=0.5, max_age=0.1,
+                 screen_size=(240, 240)):
+        """
+        连续视频输入，读取线程切帧，线程池解码和缩放，结果送进显示帧队列。
+
+        只保留“新”的帧：解码池满时新到的帧直接丢弃，解码完成时比已经送出的帧更旧
+        或者等待超过max_age的帧也丢弃，屏幕始终显示尽量新的画面。
+
+        参数：
+        frame_queue: FrameQueue对象
+        source: 字符串，"file"、"pipe"（命名管道）或"shm"（共享内存环形缓冲区）
+        path: 字符串，文件路径、管道路径或共享内存名
+        format: 字符串，"mjpeg"或RAW_FORMATS中的原始像素格式
+        width, height: 整数，原始像素格式的帧尺寸
+        layout: 字符串，"mirror"两眼显示同一画面，"split"左右各取画面的一半
+        workers: 整数，解码线程数
+        fps: 浮点数，file来源的播放帧率，为0时不限速
+        loop: 布尔值，file来源播放完后是否从头循环
+        stale_timeout: 浮点数，超过这个时间没有新帧时认为视频流已停止（秒）
+        max_age: 浮点数，帧从读取到解码完成的最长时间，超过则丢弃（秒）
+        screen_size: (宽, 高) 元组，屏幕尺寸
+        """
+        if format != MJPEG and format not in RAW_FORMATS:
+            raise ValueError(f"unknown video format: {format}")
+        if format == "rgb565" and layout != "mirror":
+            raise ValueError("rgb565 frames are shown as-is and only support the mirror layout")
+        self.frame_queue = frame_queue
+        self.source = source
+        self.path = path
+        self.format = format
+        self.width = width
+        self.height = height
+        self.layout = layout
+        self.workers = workers
+        self.fps = fps
+        self.loop = loop
+        self.stale_timeout = stale_timeout
+        self.max_age = max_age
+        self.screen_size = screen_size
+
+        self.read = 0
+        self.dropped_busy = 0
+        self.dropped_late = 0
+        self.errors = 0
+        self.emitted = 0
+        self.decode_total = 0.0
+        self._last_seq = -1
+        self._last_frame_time = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._emit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    @property
+    def active(self):
+        """最近stale_timeout秒内是否送出过帧，视频流停止后眼睛渲染自动恢复"""
+        return time.monotonic() - self._last_frame_time < self.stale_timeout
+
+    def start(self):
+        """启动读取线程"""
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="video-decode")
+        self._thread = threading.Thread(target=self._run, name="video-read", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止读取，等待读取线程退出"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def _frames(self):
+        if self.source == "shm":
+            ring = ShmRing(self.path)
+            try:
+                yield from ring.frames(self._stop)
+            finally:
+                ring.close()
+            return
+
+        while not self._stop.is_set():
+            #命名管道在写入方打开之前会阻塞在open上
+            with open(self.path, "rb", buffering=0) as stream:
+                if self.format == MJPEG:
+                    frames = read_mjpeg_frames(stream)
+                else:
+                    frames = read_raw_frames(stream, self.width * self.height * RAW_FORMATS[self.format])
+                for frame in frames:
+                    if self._stop.is_set():
+                        return
+                    yield frame
+            if self.source == "file" and not self.loop:
+                return
+
+    def _run(self):
+        period = 1.0 / self.fps if self.source == "file" and self.fps > 0 else 0
+        next_time = time.monotonic()
+        seq = 0
+        try:
+            for frame in self._frames():
+                if period:
+                    next_time += period
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_time = time.monotonic()
+                self.read += 1
+                with self._lock:
+                    if self._in_flight >= self.workers:
+                        #解码跟不上时丢弃新到的帧，不让读取线程阻塞
+                        self.dropped_busy += 1
+                        continue
+                    self._in_flight += 1
+                self._pool.submit(self._decode, seq, frame, time.monotonic())
+                seq += 1
+        except Exception:
+            logger.exception("video stream reader stopped")
+
+    def _decode(self, seq, frame, read_time):
+        start = time.monotonic()
+        try:
+            left, right = self._convert(frame)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+                self.errors += 1
+            logger.debug("video frame decode failed", exc_info=True)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            self.decode_total += now - start
+        #送出时不持有self._lock，FIFO队列满而阻塞时读取线程和stats()不受影响；
+        #_emit_lock只在解码线程之间排队，判断新旧和入队一起完成，送出的帧序号保持递增
+        with self._emit_lock:
+            with self._lock:
+                if seq < self._last_seq or now - read_time > self.max_age:
+                    self.dropped_late += 1
+                    return
+                self._last_seq = seq
+                self._last_frame_time = now
+                self.emitted += 1
+            self.frame_queue.put(left, right, stamp=read_time)
+
+    def _convert(self, frame):
+        """把一帧原始数据转换成左右眼的RGB565帧"""
+        w, h = self.screen_size
+        if self.format == "rgb565":
+            pixels = np.frombuffer(frame, dtype=RGB565_DTYPE)
+            if (self.width, self.height) != (w, h):
+                pixels = cv2.resize(
+                    pixels.reshape(self.height, self.width).astype(np.uint16), (w, h),
+                    interpolation=cv2.INTER_NEAREST
+                ).astype(RGB565_DTYPE).reshape(-1)
+            return pixels, pixels
+
+        if self.format == MJPEG:
+            #cv2解码为BGR，反转通道顺序得到RGB
+            image = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("invalid jpeg frame")
+            image = image[..., ::-1]
+        else:
+            image = np.frombuffer(frame, dtype=np.uint8).reshape(self.height, self.width, RAW_FORMATS[self.format])
+
+        if self.layout == "split":
+            half = image.shape[1] // 2
+            boxes = ((0, half), (half, image.shape[1]))
+        else:
+            boxes = (None,)
+        eyes = []
+        for box in boxes:
+            eye = crop_square(image, box)
+            if eye.shape[:2] != (h, w):
+                eye = cv2.resize(np.ascontiguousarray(eye), (w, h), interpolation=cv2.INTER_AREA)
+            eyes.append(convert_rgba_to_rgb565(eye))
+        return eyes[0], eyes[-1]
+
+    def stats(self):
+        """读取、送出、丢弃的帧数与平均解码耗时"""
+        with self._lock:
+            decoded = self.emitted + self.dropped_late
+            return {
+                "read": self.read,
+                "emitted": self.emitted,
+                "dropped_busy": self.dropped_busy,
+                "dropped_late": self.dropped_late,
+                "errors": self.errors,
+                "decode_avg_ms": round(self.decode_total / decoded * 1000, 2) if decoded else None,
+                "active": self.active
+            }